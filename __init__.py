@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 # This file makes Python treat the directory liar_tavern as a package.
 
-# Optionally, you can import key classes for easier access from outside
-# from .main import LiarDicePlugin
-# from .game_logic import LiarDiceGame
\ No newline at end of file
+# 引擎 (models / exceptions / game_logic) 与消息构建 (messages / message_utils) 不依赖 AstrBot，可以单独导入；
+# 只有适配层 main.py 需要框架。包级名称按需导入，import liar_tavern 本身不会加载 main 或 AstrBot。
+_LAZY_EXPORTS = {"LiarDicePlugin": ".main", "LiarDiceGame": ".game_logic"}
+
+def __getattr__(name):
+    module = _LAZY_EXPORTS.get(name)
+    if module is None: raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    return getattr(importlib.import_module(module, __name__), name)
@@ -0,0 +1,227 @@
+# liar_tavern/batch_engine.py
+
+# -*- coding: utf-8 -*-
+
+"""结构数组 (SoA) 批量引擎: 用 NumPy 数组同步推进成千上万局，供策略评估与 AI 调参。
+
+规则与 LiarDiceGame 相同 (process_play_card / process_challenge / process_wait / _reshuffle_internal)，状态按字段存成数组:
+    hands[g, s, t]    第 g 局座位 s 手里第 t 种牌的张数 (按 CARDS 的顺序: A / K / Q / Joker)；座位按回合顺序编号
+    gun[g, s]         弹膛位掩码；gun_pos[g, s] 指针；survived[g, s] 空响次数；alive[g, s]
+    join[g, s]        座位 s 的加入顺序 (即 GameState.players 的字典顺序，发保底牌按这个顺序)
+    main[g] 主牌编号；cur[g] 当前座位；last_seat[g] / last_cards[g, t] 待质疑的上一手 (-1 表示没有)
+step() 让所有未结束的对局各执行一个动作，动作由向量化策略一次给出；手牌只记各类张数，规则只关心打出什么牌，不关心编号。
+牌堆构成直接取自 LiarDiceGame._build_deck；发牌先按加入顺序发保底牌，其余 3 张从剩余牌堆无放回抽取，与标量引擎同分布。
+
+抽样对局 (sample_rate) 同时录成 replay.Replay，cross_check() 用 ReplayCursor 在标量引擎中逐回合重放，
+核对回合顺序、质疑与开枪结果、洗牌时机和胜者。需要 NumPy；缺失时 available() 为 False。
+"""
+
+import logging
+import itertools
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+np = None; _numpy_checked = False # 可选依赖，见 _numpy()
+
+from .models import CARD_TYPES_BASE, JOKER, HAND_SIZE, MAX_PLAY_CARDS, MIN_PLAYERS, MAX_PLAYERS_LIMIT, GUN_CHAMBERS, LIVE_BULLETS, GameStatus
+from .exceptions import GameError, InvalidActionError, NotEnoughPlayersError
+from .game_logic import LiarDiceGame
+from .replay import Replay, ReplaySeat, ReplayEvent, ReplayCursor, OP_DEAL, OP_PLAY, OP_CHALLENGE, OP_WAIT, OP_END
+
+logger = logging.getLogger(__name__)
+
+CARDS = list(CARD_TYPES_BASE) + [JOKER] # 牌型编号，与回放格式一致
+JOKER_CODE = len(CARD_TYPES_BASE)
+PLAY, CHALLENGE, WAIT = 0, 1, 2 # 动作编号
+GUARANTEED = 2 # 每人保底的主牌/Joker 张数
+DEFAULT_MAX_TURNS = 2000 # 单局动作数上限，超过视为未完成 (winner 为 -1)
+
+def _numpy():
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try: import numpy as np
+        except ImportError: np = None
+    return np
+
+def available() -> bool: return _numpy() is not None
+
+def draw_cards(rng, pool, counts):
+    """从每行的牌堆 pool[i] (各类张数，原地扣减) 无放回抽 counts[i] 张，返回抽到的各类张数"""
+    drawn = np.zeros_like(pool); rows = np.arange(len(pool))
+    for i in range(int(counts.max()) if len(counts) else 0):
+        sel = rows[counts > i]; cum = pool[sel].cumsum(axis=1)
+        kind = (rng.random(len(sel))[:, None] * cum[:, -1:] >= cum).sum(axis=1) # 落在第几类的累计区间内
+        pool[sel, kind] -= 1; drawn[sel, kind] += 1
+    return drawn
+
+class BatchEngine:
+    def __init__(self, games: int, players: int, seed: Optional[int] = None, sample_rate: float = 0.0, max_turns: int = DEFAULT_MAX_TURNS):
+        if _numpy() is None: raise RuntimeError("批量引擎需要 NumPy")
+        if not MIN_PLAYERS <= players <= MAX_PLAYERS_LIMIT: raise NotEnoughPlayersError(f"每局人数需在 {MIN_PLAYERS} 到 {MAX_PLAYERS_LIMIT} 之间")
+        self.games = games; self.players = players; self.max_turns = max_turns; self.rng = np.random.default_rng(seed)
+        # 各存活人数对应的牌堆构成 (各类张数)，直接取自标量引擎
+        scalar = LiarDiceGame(trace_size=0); self._deck = np.zeros((players + 1, len(CARDS)), dtype=np.int16)
+        for n in range(1, players + 1): counts = Counter(scalar._build_deck(n)); self._deck[n] = [counts[card] for card in CARDS]
+        live = min(LIVE_BULLETS, GUN_CHAMBERS - 1); self._gun_masks = np.array([sum(1 << c for c in combo) for combo in itertools.combinations(range(GUN_CHAMBERS), live)], dtype=np.int16)
+
+        shape = (games, players); rows = np.arange(games)[:, None]
+        self.join = self.rng.permuted(np.tile(np.arange(players, dtype=np.int16), (games, 1)), axis=1) # 回合顺序是加入顺序的随机排列
+        self._seat_by_join = np.empty_like(self.join); self._seat_by_join[rows, self.join] = np.arange(players, dtype=np.int16)
+        self.gun = self._gun_masks[self.rng.integers(len(self._gun_masks), size=shape)]
+        self.gun_pos = self.rng.integers(GUN_CHAMBERS, size=shape).astype(np.int8); self._gun_pos0 = self.gun_pos.copy()
+        self.survived = np.zeros(shape, dtype=np.int16); self.alive = np.ones(shape, dtype=bool)
+        self.hands = np.zeros((games, players, len(CARDS)), dtype=np.int16)
+        self.main = np.zeros(games, dtype=np.int8); self.cur = np.zeros(games, dtype=np.int16)
+        self.last_seat = np.full(games, -1, dtype=np.int16); self.last_cards = np.zeros((games, len(CARDS)), dtype=np.int16)
+        self.done = np.zeros(games, dtype=bool); self.winner = np.full(games, -1, dtype=np.int16); self.turns = np.zeros(games, dtype=np.int32)
+        self.reshuffles = 0; self.steps = 0
+
+        self._sampled = self.rng.random(games) < sample_rate if sample_rate > 0 else np.zeros(games, dtype=bool)
+        self._events: Dict[int, List[ReplayEvent]] = {int(g): [] for g in np.flatnonzero(self._sampled)}
+        self._deal(np.arange(games)) # 开局: 全员按加入顺序发牌，回合顺序第一位先手
+
+    # --- 发牌 ---
+    def _deal(self, g) -> None:
+        """给 g 中各局的存活玩家重新选主牌并发牌 (对应 start_game / _reshuffle_internal 中的 _deal_cards_new_rule)"""
+        m = len(g); alive = self.alive[g]; main = self.rng.integers(len(CARD_TYPES_BASE), size=m).astype(np.int8); self.main[g] = main
+        pool = self._deck[alive.sum(axis=1)].astype(np.int32); rows = np.arange(m)
+        # 保底牌: 按加入顺序，每人先取主牌，主牌取完改取 Joker
+        seat_by_join = self._seat_by_join[g]; rank = np.empty((m, self.players), dtype=np.int32)
+        np.put_along_axis(rank, seat_by_join, np.cumsum(np.take_along_axis(alive, seat_by_join, axis=1), axis=1) - 1, axis=1)
+        mains = np.clip(pool[rows, main][:, None] - GUARANTEED * rank, 0, GUARANTEED) * alive; jokers = (GUARANTEED - mains) * alive
+        hands = np.zeros((m, self.players, len(CARDS)), dtype=np.int16); hands[:, :, JOKER_CODE] = jokers; hands[rows[:, None], np.arange(self.players), main[:, None]] += mains.astype(np.int16)
+        pool[rows, main] -= mains.sum(axis=1); pool[:, JOKER_CODE] -= jokers.sum(axis=1)
+        for seat in range(self.players): hands[:, seat] += draw_cards(self.rng, pool, (HAND_SIZE - GUARANTEED) * alive[:, seat]).astype(np.int16) # 补齐: 剩余牌堆无放回抽取
+        self.hands[g] = hands; self.last_seat[g] = -1
+        for i in np.flatnonzero(self._sampled[g]):
+            game = int(g[i]); self._events[game].append(ReplayEvent(OP_DEAL, main_card=CARDS[main[i]], hands=[(int(self.join[game, s]), self._cards(hands[i, s])) for s in np.flatnonzero(alive[i])]))
+
+    def _first_alive_from(self, g, start):
+        """从座位 start 起 (含) 按回合顺序找第一个存活座位"""
+        seats = (start[:, None] + np.arange(self.players)) % self.players
+        return np.take_along_axis(seats, np.argmax(np.take_along_axis(self.alive[g], seats, axis=1), axis=1)[:, None], axis=1)[:, 0].astype(np.int16)
+
+    def _reshuffle(self, g, after) -> None:
+        """重新洗牌发牌；先手为座位 after 之后第一个存活玩家 (after 为被淘汰者或当前玩家，见 _determine_next_starter_after_reshuffle)"""
+        if not len(g): return
+        self._deal(g); self.cur[g] = self._first_alive_from(g, after + 1); self.reshuffles += len(g)
+
+    def _settle(self, g) -> None:
+        """出牌/等待/质疑未淘汰人之后: 存活玩家手牌全空则洗牌 (先手为当前玩家下家)，否则出牌与等待轮到下家，质疑者继续行动"""
+        cur = self.cur[g]; empty = ~((self.hands[g].sum(axis=2) > 0) & self.alive[g]).any(axis=1)
+        self._reshuffle(g[empty], cur[empty])
+        return g[~empty]
+
+    # --- 推进 ---
+    def step(self, policy: Callable) -> int:
+        """所有未结束的对局各执行一个动作，返回本步推进的局数。policy(engine, g) -> (动作[m], 出牌各类张数[m, 4])"""
+        g = np.flatnonzero(~self.done)
+        if not len(g): return 0
+        action, counts = policy(self, g); action = np.asarray(action); counts = np.asarray(counts, dtype=np.int16)
+        self._validate(g, action, counts)
+        self.turns[g] += 1; self.steps += 1
+        plays = action == PLAY; self._play(g[plays], counts[plays]); self._challenge(g[action == CHALLENGE]); self._wait(g[action == WAIT])
+        stalled = g[~self.done[g] & (self.turns[g] >= self.max_turns)]
+        if len(stalled): self.done[stalled] = True; logger.warning(f"{len(stalled)} 局超过 {self.max_turns} 个动作仍未结束，按未完成处理。")
+        return len(g)
+
+    def run(self, policy: Callable, max_steps: Optional[int] = None) -> int:
+        """推进到全部结束 (或 max_steps 步)，返回执行的步数"""
+        steps = 0
+        while (max_steps is None or steps < max_steps) and self.step(policy): steps += 1
+        return steps
+
+    def _validate(self, g, action, counts) -> None:
+        cur = self.cur[g]; hand = self.hands[g, cur]; size = hand.sum(axis=1); played = counts.sum(axis=1)
+        bad = ~np.isin(action, (PLAY, CHALLENGE, WAIT))
+        bad |= (action == PLAY) & ((size == 0) | (played < 1) | (played > MAX_PLAY_CARDS) | (counts < 0).any(axis=1) | (counts > hand).any(axis=1))
+        bad |= (action == CHALLENGE) & (self.last_seat[g] < 0)
+        bad |= (action == WAIT) & (size > 0)
+        if bad.any(): i = int(np.argmax(bad)); raise InvalidActionError(f"策略在 {int(bad.sum())} 局给出了非法动作 (如第 {int(g[i])} 局: 动作 {int(action[i])}，出牌 {counts[i].tolist()}，手牌 {hand[i].tolist()}，可质疑 {bool(self.last_seat[g[i]] >= 0)})")
+
+    def _play(self, g, counts) -> None:
+        """process_play_card: 接受上一手 (弃牌)，打出的牌成为新的待质疑出牌"""
+        if not len(g): return
+        cur = self.cur[g]; self.hands[g, cur] -= counts; self.last_seat[g] = cur; self.last_cards[g] = counts
+        self._record(g, lambda i, game: ReplayEvent(OP_PLAY, int(self.join[game, cur[i]]), cards=self._cards(counts[i])))
+        rest = self._settle(g); self.cur[rest] = self._first_alive_from(rest, self.cur[rest] + 1)
+
+    def _wait(self, g) -> None:
+        """process_wait: 手牌为空时接受上一手"""
+        if not len(g): return
+        self.last_seat[g] = -1; self._record(g, lambda i, game: ReplayEvent(OP_WAIT, int(self.join[game, self.cur[game]])))
+        rest = self._settle(g); self.cur[rest] = self._first_alive_from(rest, self.cur[rest] + 1)
+
+    def _challenge(self, g) -> None:
+        """process_challenge + _apply_shot_consequences: 声称不实则出牌者开枪，否则质疑者开枪；中弹淘汰后结束或洗牌"""
+        if not len(g): return
+        cur = self.cur[g]; last = self.last_seat[g]; cards = self.last_cards[g]
+        truthful = cards[np.arange(len(g)), self.main[g]] + cards[:, JOKER_CODE] == cards.sum(axis=1)
+        loser = np.where(truthful, cur, last); self.last_seat[g] = -1
+        position = self.gun_pos[g, loser]; hit = (self.gun[g, loser] >> position & 1).astype(bool)
+        self.gun_pos[g, loser] = (position + 1) % GUN_CHAMBERS; self.survived[g, loser] += ~hit
+        self._record(g, lambda i, game: ReplayEvent(OP_CHALLENGE, int(self.join[game, cur[i]]), success=not truthful[i], hit=bool(hit[i])))
+        shot = g[hit]; shot_loser = loser[hit]; self.alive[shot, shot_loser] = False
+        over = self.alive[shot].sum(axis=1) == 1
+        ended = shot[over]; self.done[ended] = True; self.winner[ended] = np.argmax(self.alive[ended], axis=1)
+        self._record(ended, lambda i, game: ReplayEvent(OP_END, int(self.join[game, self.winner[game]])))
+        self._reshuffle(shot[~over], shot_loser[~over]) # 有人淘汰: 从淘汰者的下家起找先手
+        self._settle(g[~hit]) # 无人淘汰: 质疑者继续行动 (cur 不变)
+
+    # --- 抽样录制与交叉核对 ---
+    @staticmethod
+    def _cards(counts) -> List[str]: return [card for card, count in zip(CARDS, counts.tolist()) for _ in range(count)]
+
+    def _record(self, g, make: Callable[[int, int], ReplayEvent]) -> None:
+        for i in np.flatnonzero(self._sampled[g]): game = int(g[i]); self._events[game].append(make(int(i), game))
+
+    def sampled_replays(self) -> List[Tuple[int, Replay]]:
+        """抽样对局的回放 (座位按加入顺序，seating 为回合顺序)；未完成的对局没有 END 事件"""
+        replays = []
+        for game, events in self._events.items():
+            seats = [ReplaySeat(f"b{game}_{j}", f"P{j}", True, int(self.gun[game, s]), GUN_CHAMBERS, int(self._gun_pos0[game, s])) for j, s in enumerate(self._seat_by_join[game].tolist())]
+            replays.append((game, Replay(f"batch{game}", 0, 0, seats, self.join[game].tolist(), list(events))))
+        return replays
+
+    def cross_check(self) -> Tuple[int, List[str]]:
+        """用标量引擎重放抽样对局，返回 (核对局数, 不一致说明)。只核对已结束的对局"""
+        checked = 0; mismatches = []
+        for game, replay in self.sampled_replays():
+            if not self.done[game]: continue
+            checked += 1; cursor = None
+            try:
+                cursor = ReplayCursor(replay)
+                while not cursor.finished: cursor.step()
+                if self.winner[game] < 0: continue # 超过动作上限的对局只核对已执行的回合
+                state = cursor.game.state; expected = replay.seats[int(self.join[game, self.winner[game]])].id
+                if state.status != GameStatus.ENDED or cursor.game._get_winner_id() != expected: raise GameError(f"胜者不一致: 批量引擎 {expected}，标量引擎 {cursor.game._get_winner_id()} ({state.status.name})")
+            except GameError as e: mismatches.append(f"第 {game} 局" + (f"第 {cursor.turn + 1} 回合" if cursor else "") + f": {e}")
+        return checked, mismatches
+
+    # --- 统计 ---
+    def seat_wins(self) -> List[int]:
+        """各座位 (回合顺序) 的胜场，未完成的对局不计"""
+        return np.bincount(self.winner[self.winner >= 0], minlength=self.players).tolist()
+
+class RandomPolicy:
+    """向量化的参数化随机策略，供基准与调参: 有上一手时以 challenge_rate 质疑 (手牌空时必质疑)；
+    出牌随机 1~3 张，以 honest_rate 只从主牌/Joker 中出 (有的话)。两个参数都可以是标量或按座位的数组。"""
+
+    def __init__(self, challenge_rate: Any = 0.3, honest_rate: Any = 0.5, seed: Optional[int] = None):
+        if _numpy() is None: raise RuntimeError("批量引擎需要 NumPy")
+        self.challenge_rate = np.asarray(challenge_rate, dtype=np.float64); self.honest_rate = np.asarray(honest_rate, dtype=np.float64); self.rng = np.random.default_rng(seed)
+
+    def _rate(self, rate, cur): return rate if rate.ndim == 0 else rate[cur]
+
+    def __call__(self, engine: BatchEngine, g) -> Tuple[Any, Any]:
+        rng = self.rng; m = len(g); cur = engine.cur[g]; hand = engine.hands[g, cur].astype(np.int32); size = hand.sum(axis=1)
+        has_last = engine.last_seat[g] >= 0
+        challenge = has_last & ((size == 0) | (rng.random(m) < self._rate(self.challenge_rate, cur)))
+        action = np.where(challenge, CHALLENGE, np.where(size == 0, WAIT, PLAY))
+        honest_pool = np.zeros_like(hand); rows = np.arange(m); main = engine.main[g]
+        honest_pool[rows, main] = hand[rows, main]; honest_pool[:, JOKER_CODE] = hand[:, JOKER_CODE]
+        honest = (honest_pool.sum(axis=1) > 0) & (rng.random(m) < self._rate(self.honest_rate, cur))
+        pool = np.where(honest[:, None], honest_pool, hand)
+        count = np.where(action == PLAY, 1 + (rng.random(m) * np.minimum(pool.sum(axis=1), MAX_PLAY_CARDS)).astype(np.int32), 0)
+        return action, draw_cards(rng, pool, count)
@@ -0,0 +1,96 @@
+# liar_tavern/benchmarks/astrbot_stubs.py
+
+# -*- coding: utf-8 -*-
+
+"""最小化的 AstrBot 替身，让基准/压测脚本在没有框架的普通 Linux 机器上运行。
+
+只实现插件实际用到的那部分接口；install() 之后再用 load_plugin_package() 以包的形式导入插件。
+"""
+
+import os
+import sys
+import types
+import importlib.util
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE_NAME = "liar_tavern"
+
+class Plain:
+    def __init__(self, text: str = "", **kwargs): self.text = text
+    def __repr__(self): return f"Plain({self.text!r})"
+
+class At:
+    def __init__(self, qq=None, **kwargs): self.qq = qq
+    def __repr__(self): return f"At({self.qq!r})"
+
+class Image:
+    def __init__(self, file=None, url=None, **kwargs): self.file = file; self.url = url
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    mod = types.ModuleType(name); mod.__dict__.update(attrs); sys.modules[name] = mod; return mod
+
+def install() -> None:
+    """把 astrbot.api.message_components 替身注册进 sys.modules (已存在真实框架时不覆盖)"""
+    if "astrbot.api.message_components" in sys.modules: return
+    astrbot = sys.modules.get("astrbot") or _module("astrbot")
+    api = sys.modules.get("astrbot.api") or _module("astrbot.api")
+    comps = _module("astrbot.api.message_components", Plain=Plain, At=At, Image=Image)
+    astrbot.api = api; api.message_components = comps
+
+# --- 插件主类 (main.py) 需要的框架替身 ---
+class AstrMessageEvent:
+    """事件基类替身；压测脚本中的假事件需继承它 (插件内有 isinstance 检查)"""
+    def __init__(self): self._stopped = False
+    def stop_event(self): self._stopped = True
+    def is_stopped(self) -> bool: return self._stopped
+    def plain_result(self, text: str): return ("plain", text)
+    def chain_result(self, chain): return ("chain", chain)
+
+class MessageChain(list):
+    pass
+
+class EventMessageType:
+    GROUP_MESSAGE = "group_message"
+    PRIVATE_MESSAGE = "private_message"
+    ALL = "all"
+
+class PermissionType:
+    ADMIN = "admin"
+    MEMBER = "member"
+
+def _passthrough_decorator(*args, **kwargs):
+    def decorator(func): return func
+    return decorator
+
+class Context:
+    def __init__(self, provider=None, config=None): self._provider = provider; self._config = config or types.SimpleNamespace(command_prefix="/")
+    def get_using_provider(self): return self._provider
+    def get_config(self): return self._config
+
+class Star:
+    def __init__(self, context: Context): self.context = context
+
+class AstrBotConfig(dict):
+    pass
+
+class ActionFailed(Exception):
+    def __init__(self, retcode: int = -1, message: str = "", wording: str = ""):
+        super().__init__(message or wording or f"retcode={retcode}"); self.retcode = retcode; self.message = message; self.wording = wording
+
+def install_framework() -> None:
+    """在 install() 基础上再注册 astrbot.api.event / star / AstrBotConfig 与 aiocqhttp 替身"""
+    install()
+    if "astrbot.api.star" in sys.modules: return
+    filter_mod = _module("astrbot.api.event.filter", EventMessageType=EventMessageType, PermissionType=PermissionType,
+                         command=_passthrough_decorator, event_message_type=_passthrough_decorator, permission_type=_passthrough_decorator)
+    event_mod = _module("astrbot.api.event", filter=filter_mod, AstrMessageEvent=AstrMessageEvent, MessageChain=MessageChain)
+    star_mod = _module("astrbot.api.star", Context=Context, Star=Star, register=_passthrough_decorator)
+    api = sys.modules["astrbot.api"]; api.event = event_mod; api.star = star_mod; api.AstrBotConfig = AstrBotConfig
+    aiocqhttp = _module("aiocqhttp"); aiocqhttp.exceptions = _module("aiocqhttp.exceptions", ActionFailed=ActionFailed)
+
+def load_plugin_package(name: str = PACKAGE_NAME) -> types.ModuleType:
+    """以包名 name 导入插件目录 (插件内部使用相对导入)"""
+    if name in sys.modules: return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PLUGIN_DIR, "__init__.py"), submodule_search_locations=[PLUGIN_DIR])
+    package = importlib.util.module_from_spec(spec); sys.modules[name] = package; spec.loader.exec_module(package)
+    return package
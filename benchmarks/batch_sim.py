@@ -0,0 +1,111 @@
+# liar_tavern/benchmarks/batch_sim.py
+
+# -*- coding: utf-8 -*-
+
+"""批量模拟: 用 batch_engine 的结构数组引擎同步推进大量对局，评估参数化策略并报告吞吐 (需要 NumPy，无需 AstrBot)。
+
+用法:
+    python benchmarks/batch_sim.py [--games 200000 --players 4 --chunk 50000]           # 吞吐与各座位胜率
+    python benchmarks/batch_sim.py --challenge-rates 0.1,0.3,0.5,0.7 --honest-rate 0.6  # 按座位设置参数，比较策略强弱
+    python benchmarks/batch_sim.py --cross-check-rate 0.01                              # 抽样对局用 ReplayCursor 在标量引擎中重放核对
+    python benchmarks/batch_sim.py --scalar-games 2000                                  # 同一策略逐局跑 LiarDiceGame，对比吞吐
+
+胜率按回合顺序的座位统计 (座位 0 先手)；按座位的参数也按回合顺序对应。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import astrbot_stubs # noqa: E402
+
+astrbot_stubs.load_plugin_package() # batch_engine / game_logic 不依赖 AstrBot，只需以包名导入
+from liar_tavern import batch_engine # noqa: E402
+from liar_tavern.batch_engine import BatchEngine, RandomPolicy # noqa: E402
+from liar_tavern.game_logic import LiarDiceGame # noqa: E402
+from liar_tavern.models import GameStatus, JOKER, MAX_PLAY_CARDS # noqa: E402
+
+def parse_rates(text: Optional[str], default: float, players: int):
+    if not text: return default
+    rates = [float(x) for x in text.split(",")]
+    if len(rates) != players: raise SystemExit(f"按座位的参数需要 {players} 个，收到 {len(rates)} 个")
+    return rates
+
+def run_batch(args, challenge_rate, honest_rate) -> Dict:
+    wins = [0] * args.players; unfinished = 0; turns = 0; reshuffles = 0; checked = 0; mismatches: List[str] = []
+    elapsed = check_seconds = 0.0; remaining = args.games; chunk_index = 0
+    while remaining > 0:
+        size = min(args.chunk, remaining); seed = None if args.seed is None else args.seed + chunk_index
+        started = time.perf_counter(); engine = BatchEngine(size, args.players, seed=seed, sample_rate=args.cross_check_rate, max_turns=args.max_turns)
+        engine.run(RandomPolicy(challenge_rate, honest_rate, seed=None if seed is None else seed + 1)); elapsed += time.perf_counter() - started
+        wins = [a + b for a, b in zip(wins, engine.seat_wins())]; unfinished += int((engine.winner < 0).sum()); turns += int(engine.turns.sum()); reshuffles += engine.reshuffles
+        if args.cross_check_rate > 0: started = time.perf_counter(); count, bad = engine.cross_check(); checked += count; mismatches.extend(bad); check_seconds += time.perf_counter() - started
+        remaining -= size; chunk_index += 1
+    return {"games": args.games, "seconds": elapsed, "games_per_minute": args.games / elapsed * 60 if elapsed else 0.0, "avg_turns": turns / args.games,
+            "reshuffles_per_game": reshuffles / args.games, "unfinished": unfinished, "seat_win_rate": [w / args.games for w in wins],
+            "cross_checked": checked, "cross_check_seconds": check_seconds, "mismatches": len(mismatches), "mismatch_samples": mismatches[:5]}
+
+def scalar_game(players: int, challenge_rates: List[float], honest_rates: List[float], rng: random.Random, max_turns: int) -> int:
+    """用 LiarDiceGame 跑一局同一策略的对局，返回动作数"""
+    game = LiarDiceGame(trace_size=0)
+    for i in range(players): game.add_player(f"p{i}", f"P{i}")
+    game.start_game(); seat = {pid: i for i, pid in enumerate(game.state.turn_order)}; turns = 0
+    while game.state.status == GameStatus.PLAYING and turns < max_turns:
+        pid = game.get_current_player_id(); hand = game.state.players[pid].hand; i = seat[pid]; turns += 1
+        if game.state.last_play and (not hand or rng.random() < challenge_rates[i]): game.process_challenge(pid); continue
+        if not hand: game.process_wait(pid); continue
+        honest = [k for k, card in enumerate(hand) if card == game.state.main_card or card == JOKER]
+        pool = honest if honest and rng.random() < honest_rates[i] else list(range(len(hand)))
+        picks = rng.sample(pool, 1 + int(rng.random() * min(len(pool), MAX_PLAY_CARDS)))
+        game.process_play_card(pid, [k + 1 for k in picks])
+    return turns
+
+def run_scalar(args, challenge_rate, honest_rate) -> Dict:
+    per_seat = lambda rate: rate if isinstance(rate, list) else [rate] * args.players
+    rng = random.Random(args.seed); random.seed(args.seed); started = time.perf_counter()
+    turns = sum(scalar_game(args.players, per_seat(challenge_rate), per_seat(honest_rate), rng, args.max_turns) for _ in range(args.scalar_games))
+    elapsed = time.perf_counter() - started
+    return {"games": args.scalar_games, "seconds": elapsed, "games_per_minute": args.scalar_games / elapsed * 60 if elapsed else 0.0, "avg_turns": turns / args.scalar_games}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="结构数组批量引擎的吞吐与策略评估")
+    parser.add_argument("--games", type=int, default=200000)
+    parser.add_argument("--players", type=int, default=4)
+    parser.add_argument("--chunk", type=int, default=50000, help="每个批量引擎同时推进的局数")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-turns", type=int, default=batch_engine.DEFAULT_MAX_TURNS)
+    parser.add_argument("--challenge-rate", type=float, default=0.3)
+    parser.add_argument("--honest-rate", type=float, default=0.5)
+    parser.add_argument("--challenge-rates", help="按座位的质疑概率，逗号分隔 (覆盖 --challenge-rate)")
+    parser.add_argument("--honest-rates", help="按座位的老实出牌概率，逗号分隔 (覆盖 --honest-rate)")
+    parser.add_argument("--cross-check-rate", type=float, default=0.0, help="抽样核对的对局比例")
+    parser.add_argument("--scalar-games", type=int, default=0, help="同时用 LiarDiceGame 逐局跑这么多局作对比")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if not batch_engine.available(): print("批量引擎需要 NumPy (pip install numpy)"); return 2
+    challenge_rate = parse_rates(args.challenge_rates, args.challenge_rate, args.players); honest_rate = parse_rates(args.honest_rates, args.honest_rate, args.players)
+
+    results = {"batch": run_batch(args, challenge_rate, honest_rate)}
+    if args.scalar_games > 0: results["scalar"] = run_scalar(args, challenge_rate, honest_rate)
+    batch = results["batch"]
+    print(f"批量引擎: {batch['games']} 局 / {batch['seconds']:.2f}s = {batch['games_per_minute']:,.0f} 局/分钟，平均 {batch['avg_turns']:.1f} 个动作、洗牌 {batch['reshuffles_per_game']:.2f} 次，未完成 {batch['unfinished']}")
+    print("座位胜率: " + " / ".join(f"{i}:{rate:.1%}" for i, rate in enumerate(batch["seat_win_rate"])))
+    if args.cross_check_rate > 0:
+        print(f"交叉核对: {batch['cross_checked']} 局 / {batch['cross_check_seconds']:.2f}s (不计入吞吐)，不一致 {batch['mismatches']}")
+        for line in batch["mismatch_samples"]: print(f"  {line}")
+    if "scalar" in results:
+        scalar = results["scalar"]
+        print(f"标量引擎: {scalar['games']} 局 / {scalar['seconds']:.2f}s = {scalar['games_per_minute']:,.0f} 局/分钟，平均 {scalar['avg_turns']:.1f} 个动作 (批量为其 {batch['games_per_minute'] / max(scalar['games_per_minute'], 1e-9):.0f} 倍)")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(results, f, ensure_ascii=False, indent=2)
+    return 1 if batch["mismatches"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# liar_tavern/benchmarks/bench_engine.py
+
+# -*- coding: utf-8 -*-
+
+"""game_logic / message_utils 微基准。
+
+用法:
+    python benchmarks/bench_engine.py                       # 运行并打印结果
+    python benchmarks/bench_engine.py --output run.json     # 结果写入 JSON
+    python benchmarks/bench_engine.py --compare             # 与 baseline.json 对比，回归超过阈值时退出码为 1
+    python benchmarks/bench_engine.py --update-baseline     # 用本次结果覆盖 baseline.json
+
+每个用例在计时前用固定种子重新构造状态，只对被测调用本身计时；取多轮中最快一轮的单次平均耗时 (微秒)。
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import astrbot_stubs # noqa: E402
+
+astrbot_stubs.install_framework()
+_pkg = astrbot_stubs.load_plugin_package()
+from liar_tavern.game_logic import LiarDiceGame # noqa: E402
+from liar_tavern.message_utils import build_game_status_message, build_challenge_result_messages # noqa: E402
+from liar_tavern.main import LiarDicePlugin # noqa: E402
+from liar_tavern.risk import table_shot_risk # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_PLAYER_COUNTS = (2, 4, 6, 8, 16, 32, 64)
+
+# --- 状态构造 (均使用固定种子，保证可复现) ---
+def make_started_game(player_count: int, seed: int) -> LiarDiceGame:
+    random.seed(seed)
+    game = LiarDiceGame(creator_id="p0")
+    for i in range(player_count): game.add_player(f"{10000 + i}", f"玩家{i}")
+    game.start_game()
+    return game
+
+def make_game_with_last_play(player_count: int, seed: int) -> LiarDiceGame:
+    game = make_started_game(player_count, seed)
+    game.process_play_card(game.get_current_player_id(), [1])
+    return game
+
+def make_challenge_result(player_count: int, seed: int) -> Dict[str, Any]:
+    game = make_game_with_last_play(player_count, seed)
+    return game.process_challenge(game.get_current_player_id())
+
+# --- 用例: (名称, setup(n, seed) -> ctx, op(ctx)) ---
+def _prepare_deal(n: int, seed: int) -> LiarDiceGame:
+    game = make_started_game(n, seed); game.state.deck = game._build_deck(n); return game
+
+_PLUGIN = None
+def _prepare_prompt(n: int, seed: int) -> Tuple[Any, LiarDiceGame]:
+    global _PLUGIN
+    if _PLUGIN is None: _PLUGIN = LiarDicePlugin(astrbot_stubs.Context(), astrbot_stubs.AstrBotConfig(enable_player_stats=False, opponent_model_path="", enable_replays=False))
+    game = make_game_with_last_play(n, seed); game.state.players[game.get_current_player_id()].is_ai = True
+    return _PLUGIN, game.snapshot("10001")
+
+def _next_snapshot(game: LiarDiceGame) -> Any:
+    """模拟一次动作后重建快照: 版本变化，但所有玩家的 PlayerView 都可复用"""
+    game.state.action_count += 1; return game.snapshot("10001")
+
+def _prepare_risk(n: int, seed: int) -> List[Any]:
+    """各玩家已空响 0~2 次的开局牌桌"""
+    game = make_started_game(n, seed)
+    for i, pdata in enumerate(game.state.players.values()): pdata.shots_survived = i % 3
+    return list(game.state.players.values())
+
+CASES: List[Tuple[str, Callable[[int, int], Any], Callable[[Any], Any]]] = [
+    ("build_deck", lambda n, seed: (LiarDiceGame(), n), lambda ctx: ctx[0]._build_deck(ctx[1])),
+    ("deal_cards_new_rule", _prepare_deal, lambda g: g._deal_cards_new_rule()),
+    ("process_play_card", make_started_game, lambda g: g.process_play_card(g.get_current_player_id(), [1])),
+    ("process_challenge", make_game_with_last_play, lambda g: g.process_challenge(g.get_current_player_id())),
+    ("reshuffle_internal", make_started_game, lambda g: g._reshuffle_internal("基准测试")),
+    ("advance_turn", make_started_game, lambda g: g._advance_turn()),
+    ("build_game_status_message", make_game_with_last_play, lambda g: build_game_status_message(g.state, g.get_current_player_id())),
+    ("build_challenge_result_messages", make_challenge_result, lambda r: build_challenge_result_messages(r)),
+    ("game_snapshot", make_game_with_last_play, _next_snapshot),
+    ("table_shot_risk", _prepare_risk, table_shot_risk),
+    ("build_llm_prompt", _prepare_prompt, lambda ctx: ctx[0]._build_llm_prompt(ctx[1], ctx[1].current_player_id, include_chat=False)),
+]
+
+def run_case(setup: Callable, op: Callable, player_count: int, seed: int, loops: int, repeats: int) -> float:
+    """返回单次调用耗时 (微秒)，取 repeats 轮中最快一轮的平均值"""
+    best = float("inf")
+    for r in range(repeats):
+        total_ns = 0
+        for i in range(loops):
+            ctx = setup(player_count, seed + i)
+            random.seed(seed * 7919 + i) # 被测调用内部的随机数同样固定
+            t0 = time.perf_counter_ns(); op(ctx); total_ns += time.perf_counter_ns() - t0
+        best = min(best, total_ns / loops / 1000.0)
+    return best
+
+def run_all(player_counts, seed: int, loops: int, repeats: int, only: List[str]) -> Dict[str, float]:
+    results: Dict[str, float] = {}
+    for name, setup, op in CASES:
+        if only and name not in only: continue
+        for n in player_counts:
+            key = f"{name}[n={n}]"; results[key] = round(run_case(setup, op, n, seed, loops, repeats), 3)
+            print(f"{key:<45} {results[key]:>10.2f} µs", flush=True)
+    return results
+
+def compare(current: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """返回超出阈值的回归列表 (current > baseline * (1 + threshold))"""
+    regressions = []
+    for key, base in sorted(baseline.items()):
+        now = current.get(key)
+        if now is None or base <= 0: continue
+        ratio = now / base
+        marker = "REGRESSION" if ratio > 1 + threshold else ("faster" if ratio < 1 - threshold else "ok")
+        print(f"{key:<45} base {base:>10.2f} µs  now {now:>10.2f} µs  x{ratio:5.2f}  {marker}")
+        if marker == "REGRESSION": regressions.append(key)
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="骗子酒馆引擎微基准")
+    parser.add_argument("--players", default=",".join(map(str, DEFAULT_PLAYER_COUNTS)), help="玩家人数列表，逗号分隔")
+    parser.add_argument("--seed", type=int, default=20240501)
+    parser.add_argument("--loops", type=int, default=200, help="每轮调用次数")
+    parser.add_argument("--repeats", type=int, default=5, help="轮数 (取最快一轮)")
+    parser.add_argument("--only", default="", help="只运行指定用例，逗号分隔")
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--compare", action="store_true", help="与基线对比，回归时返回 1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="允许的相对变慢比例 (默认 25%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    player_counts = [int(x) for x in args.players.split(",") if x.strip()]
+    only = [x.strip() for x in args.only.split(",") if x.strip()]
+    results = run_all(player_counts, args.seed, args.loops, args.repeats, only)
+    report = {"meta": {"seed": args.seed, "loops": args.loops, "repeats": args.repeats, "players": player_counts, "python": platform.python_version(), "machine": platform.machine(), "unit": "us_per_call"}, "results": results}
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {args.baseline}")
+    if args.compare:
+        if not os.path.exists(args.baseline): print(f"找不到基线文件 {args.baseline}"); return 2
+        with open(args.baseline, encoding="utf-8") as f: baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions: print(f"\n{len(regressions)} 项回归超过 {args.threshold:.0%}: {', '.join(regressions)}"); return 1
+        print("\n未发现超过阈值的回归。")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
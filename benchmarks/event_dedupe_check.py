@@ -0,0 +1,54 @@
+# liar_tavern/benchmarks/event_dedupe_check.py
+
+# -*- coding: utf-8 -*-
+
+"""重复事件过滤自检: 适配器不带消息 ID 时按 (发送者, 内容, 牌桌版本) 判重。
+
+    python benchmarks/event_dedupe_check.py
+
+核对两点: 同一玩家在不同回合发出的相同命令都会被处理；处理完才到的重投仍会被静默丢弃。
+"""
+
+import os
+import sys
+import asyncio
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadtest # noqa: E402 (同时安装框架替身并导入插件)
+from liar_tavern.main import LiarDicePlugin # noqa: E402
+
+GROUP_ID = "515151"
+
+def no_id_event(bot, sender_id: str, sender_name: str, text: str) -> loadtest.FakeEvent:
+    """模拟不提供消息 ID 的适配器"""
+    event = loadtest.FakeEvent(bot, GROUP_ID, sender_id, sender_name, text); event.message_obj.message_id = None
+    return event
+
+async def replies(agen) -> List:
+    return [item async for item in agen]
+
+async def check_repeats_across_turns():
+    bot = loadtest.FakeBot(0, 0.0, loadtest.random.Random(5))
+    config = loadtest.astrbot_stubs.AstrBotConfig(enable_trash_talk=False, enable_player_stats=False, opponent_model_path="", enable_replays=False, turn_timeout_seconds=0, event_dedupe_window_seconds=3)
+    plugin = LiarDicePlugin(loadtest.astrbot_stubs.Context(provider=None), config); loadtest.plugin_main.asyncio = loadtest._scaled_asyncio(0.0)
+    players = {"1001": "甲", "1002": "乙"}; creator = next(iter(players.items()))
+    await loadtest._drain(plugin.create_game(no_id_event(bot, *creator, "骗子酒馆")))
+    for pid, pname in players.items(): await loadtest._drain(plugin.join_game(no_id_event(bot, pid, pname, "加入")))
+    await loadtest._drain(plugin.start_game_cmd(no_id_event(bot, *creator, "开始")))
+    game = plugin.games[GROUP_ID]
+    for turn in range(4): # 两人轮流，每人连续两个回合都发同样的 “出牌 1”
+        pid = game.get_current_player_id(); version = game.state.action_count
+        await loadtest._drain(plugin.play_cards_cmd(no_id_event(bot, pid, players[pid], "出牌 1")))
+        assert game.state.action_count == version + 1, f"第 {turn + 1} 回合的相同命令被当成重投丢弃"
+        echoed = await replies(plugin.play_cards_cmd(no_id_event(bot, pid, players[pid], "出牌 1"))) # 处理完才到的重投
+        assert game.state.action_count == version + 1 and not echoed, f"第 {turn + 1} 回合处理后的重投没有被丢弃"
+    await plugin.terminate()
+    print(f"[ok] 不同回合的相同命令均被处理，处理后的重投被丢弃 (丢弃 {plugin.event_deduper.dropped} / 检查 {plugin.event_deduper.checked})")
+
+def main(argv=None) -> int:
+    asyncio.run(check_repeats_across_turns())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
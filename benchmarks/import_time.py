@@ -0,0 +1,69 @@
+# liar_tavern/benchmarks/import_time.py
+
+# -*- coding: utf-8 -*-
+
+"""导入耗时测量: 每个目标在全新的子进程里导入若干次，取导入耗时 (不含解释器启动) 的中位数。
+
+目标:
+    * engine   —— models / exceptions / game_logic (模拟、进程池子进程只需要这些)；
+    * messages —— message_utils (与框架无关的消息构建)；
+    * plugin   —— main (装上 AstrBot 替身后的完整插件，替身本身几乎不耗时)。
+engine 与 messages 不安装任何替身，若它们 (间接) 导入了 AstrBot 会直接报错。
+同时列出子进程里是否加载了 astrbot / PIL / numpy 等较重的模块。
+
+用法:
+    python benchmarks/import_time.py [--runs 7]
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("astrbot", "aiocqhttp", "PIL", "numpy", "sqlite3", "cProfile")
+TARGETS = {
+    "engine": (False, ["game_logic"]),
+    "messages": (False, ["message_utils"]),
+    "plugin": (True, ["main"]),
+}
+
+CHILD = """
+import sys, json, time, importlib
+sys.path.insert(0, {bench_dir!r})
+import astrbot_stubs
+if {framework!r}: astrbot_stubs.install_framework()
+t0 = time.perf_counter(); error = None
+try:
+    astrbot_stubs.load_plugin_package()
+    for name in {modules!r}: importlib.import_module("liar_tavern." + name)
+except ImportError as e: error = str(e)
+print(json.dumps({{"error": error, "us": (time.perf_counter() - t0) * 1e6, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(framework: bool, modules: List[str]) -> Dict:
+    code = CHILD.format(bench_dir=BENCH_DIR, framework=framework, modules=modules, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if proc.returncode: raise RuntimeError(proc.stderr[-2000:])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="插件各层的导入耗时")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--output", help="结果写入 JSON 文件")
+    args = parser.parse_args(argv)
+    results = {}
+    for label, (framework, modules) in TARGETS.items():
+        runs = [measure(framework, modules) for _ in range(args.runs)]
+        error = runs[-1]["error"]; heavy = runs[-1]["heavy"]; median_ms = statistics.median(r["us"] for r in runs) / 1000.0
+        results[label] = {"median_ms": median_ms, "error": error, "heavy": heavy}
+        print(f"{label:<9} {'导入失败: ' + error if error else f'{median_ms:7.1f} ms'}  | 加载: {', '.join(heavy) or '-'}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# liar_tavern/benchmarks/llm_parse_fuzz.py
+
+# -*- coding: utf-8 -*-
+
+"""LLM 回复解析的模糊测试与吞吐基准: 对比旧的正则解析与 llm_json 单遍扫描。
+
+语料由两部分组成:
+    * 种子: 仿照常见模型实际输出的 AI 决策回复 (含预期决策)；也可用 --corpus 读入自己收集的回复
+      (JSON Lines，每行 {"text": 回复原文, "expected": 预期决策或 null})；
+    * 变异: 对种子叠加 0~3 种模型常见的格式毛病 (思路/结尾说明里的花括号、代码块、草稿+终稿、尾逗号、单引号、
+      全角标点、裸键名、"indices":"1,2"、输出截断、缺少/未闭合思路标签……)，随机样本约一半保持原样。
+
+每条回复按插件的校验规则判定: 解析出的决策与预期一致记为正确，解析失败记为一次重试 (AI 回合要再请求一次 LLM)，
+解析成功但与预期不同记为误判。同时报告两种解析器的平均耗时。
+
+用法:
+    python benchmarks/llm_parse_fuzz.py [--samples 5000 --seed 7 --corpus my_outputs.jsonl]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import astrbot_stubs # noqa: E402
+
+astrbot_stubs.install_framework()
+astrbot_stubs.load_plugin_package()
+from liar_tavern.main import LiarDicePlugin # noqa: E402
+from bench_engine import make_game_with_last_play # noqa: E402
+
+# --- 旧解析 (改动前 _extract_llm_json 的逻辑，用于对比) ---
+def legacy_extract(response_text: str) -> Tuple[Optional[str], Any, Optional[str]]:
+    reasoning_text = None
+    think_match = re.search(r"<thinking>(.*?)</thinking>", response_text, re.DOTALL | re.IGNORECASE); response_after_think = response_text[think_match.end():].strip() if think_match else response_text.strip()
+    if think_match: reasoning_text = think_match.group(1).strip()
+    json_match = re.search(r'(\{.*\})', response_after_think, re.DOTALL); json_str = json_match.group(1) if json_match else response_after_think
+    if not json_str: return reasoning_text, None, "未找到JSON"
+    try: return reasoning_text, json.loads(json_str), None
+    except json.JSONDecodeError as e: return reasoning_text, None, f"JSON解析失败:{e}"
+
+# --- 种子: (思路, 决策) ---
+SEEDS: List[Tuple[str, Dict[str, Any]]] = [
+    ("上家声称打出 2 张主牌，他的吹牛率偏高。我手里第 1、2 张是主牌，先跟进两张真牌更稳。", {"action": "play", "indices": [1, 2]}),
+    ("上家只剩 1 张手牌却声称打出 3 张，几乎不可能全是真的，质疑。", {"action": "challenge"}),
+    ("我的下一枪中弹概率 75%，质疑失败风险太大。打出第 3 张 (不是主牌)，赌下家不质疑。", {"action": "play", "indices": [3]}),
+    ("下家爱质疑，只打真牌: 第 1 张。", {"action": "play", "indices": [1]}),
+    ("牌局分析:\n1. 主牌是 K\n2. 我有 K、Joker\n3. 上家风险 50%\n结论: 质疑。", {"action": "challenge"}),
+    ("手里有三张可以当主牌，一次打出 1,2,4 号。", {"action": "play", "indices": [1, 2, 4]}),
+]
+REFUSALS = ["抱歉，我无法继续这个游戏。", "<thinking>局势复杂</thinking>\n我选择出牌。", "<thinking>想想</thinking>\n(思考超时)"]
+
+def _dump(decision: Dict[str, Any]) -> str: return json.dumps(decision, ensure_ascii=False)
+
+# --- 变异: 作用在 (思路, 思路标签样式, JSON 文本, 前缀, 后缀, 代码块, 截断) 上，最后统一渲染 ---
+def m_brace_in_thinking(s, rng): s["think"] += " 可选动作 {play, challenge, wait}，上家状态 {手牌: 1}。"
+def m_fence(s, rng): s["fence"] = True
+def m_trailing_prose(s, rng): s["after"] += rng.choice(["\n说明: 上家的 {吹牛率} 很高，所以这样选。", "\n（备注：{\"confidence\": 高}）", "\n祝我好运 :}"])
+def m_plain_trailing(s, rng): s["after"] += "\n希望能赢！"
+def m_draft(s, rng): s["before"] += "草稿: {\"action\": \"wait\"}\n不对，手牌非空不能等待。最终:\n"
+def m_no_tags(s, rng): s["tags"] = "none"
+def m_unclosed(s, rng): s["tags"] = "unclosed"
+def m_upper_tags(s, rng): s["tags"] = "upper"
+def m_trailing_comma(s, rng): s["json"] = s["json"][:-1] + ",}"
+def m_single_quotes(s, rng): s["json"] = s["json"].replace('"', "'")
+def m_fullwidth(s, rng): s["json"] = s["json"].replace('": ', '"：', 1)
+def m_bare_keys(s, rng): s["json"] = re.sub(r'"(action|indices)"', r"\1", s["json"])
+def m_string_indices(s, rng): s["json"] = re.sub(r"\[([\d, ]+)\]", lambda m: '"' + m.group(1).replace(" ", "") + '"', s["json"])
+def m_truncated(s, rng): s["truncate"] = True
+
+MUTATION_WEIGHTS = (50, 30, 15, 5) # 随机样本叠加 0/1/2/3 种变异的权重
+MUTATORS: List[Callable] = [m_brace_in_thinking, m_fence, m_trailing_prose, m_plain_trailing, m_draft, m_no_tags, m_unclosed, m_upper_tags,
+                            m_trailing_comma, m_single_quotes, m_fullwidth, m_bare_keys, m_string_indices, m_truncated]
+
+def render(s: Dict[str, Any]) -> str:
+    body = s["json"]
+    if s["fence"] and not s["truncate"]: body = f"```json\n{body}\n```"
+    body = s["before"] + body
+    if s["truncate"]: body = body[:-1] # 输出停在最后一个右括号之前
+    else: body += s["after"]
+    think = s["think"]
+    if s["tags"] == "none": return f"思考: {think}\n{body}"
+    if s["tags"] == "unclosed": return f"<thinking>{think}\n{body}"
+    open_tag, close_tag = ("<THINKING>", "</THINKING>") if s["tags"] == "upper" else ("<thinking>", "</thinking>")
+    return f"{open_tag}{think}{close_tag}\n{body}"
+
+def build_corpus(samples: int, seed: int) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    """返回 [(变异说明, 回复原文, 预期决策)]；先是每个种子的原样与单变异版本，其余随机叠加变异"""
+    rng = random.Random(seed); corpus = []
+    def sample(think, decision, mutators):
+        s = {"think": think, "json": _dump(decision), "tags": "tag", "before": "", "after": "", "fence": False, "truncate": False}
+        for mutate in mutators: mutate(s, rng)
+        corpus.append(("+".join(m.__name__[2:] for m in mutators) or "原样", render(s), decision))
+    for think, decision in SEEDS:
+        sample(think, decision, [])
+        for mutate in MUTATORS: sample(think, decision, [mutate])
+    for text in REFUSALS: corpus.append(("无决策", text, None))
+    while len(corpus) < samples:
+        # 大多数回复是规整的，少数带一两处毛病
+        think, decision = rng.choice(SEEDS); sample(think, decision, rng.sample(MUTATORS, rng.choices((0, 1, 2, 3), weights=MUTATION_WEIGHTS)[0]))
+    return corpus
+
+def load_corpus(path: str) -> List[Tuple[str, str, Optional[Dict[str, Any]]]]:
+    with open(path, encoding="utf-8") as f: return [("外部", row["text"], row.get("expected")) for row in map(json.loads, filter(str.strip, f))]
+
+# --- 评估 ---
+def evaluate(plugin: LiarDicePlugin, snapshot, ai_id: str, corpus, extract: Callable, strict_indices: bool) -> Dict[str, Any]:
+    """用给定的 extract 解析整个语料，按插件的校验规则判定；strict_indices 模拟旧校验 (indices 必须是列表)"""
+    correct = retries = wrong = parse_ns = 0; failures: Dict[str, int] = {}
+    for label, text, expected in corpus:
+        t0 = time.perf_counter_ns(); _reasoning, data, error = extract(text); parse_ns += time.perf_counter_ns() - t0 # 只计解析耗时
+        if not error and (not isinstance(data, dict) or "action" not in data): error = "JSON格式错误"
+        if not error and strict_indices and data.get("action") == "play" and not isinstance(data.get("indices"), list): error = "'play'缺indices"
+        if not error: error = plugin._validate_decision(data, snapshot, ai_id)
+        if error:
+            retries += 1
+            if expected is None: correct += 1 # 本就没有决策，重试无法避免
+            else: failures[label] = failures.get(label, 0) + 1
+        elif data == expected: correct += 1
+        else: wrong += 1; failures[label] = failures.get(label, 0) + 1
+    return {"correct": correct, "retries": retries, "wrong": wrong, "us_per_parse": parse_ns / len(corpus) / 1000, "failures": failures}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="LLM 回复解析模糊测试")
+    parser.add_argument("--samples", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--corpus", help="额外的真实回复语料 (JSON Lines)")
+    parser.add_argument("--show-failures", type=int, default=8, help="每种解析器列出的失败变异类别数")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    plugin = LiarDicePlugin(astrbot_stubs.Context(), astrbot_stubs.AstrBotConfig(enable_player_stats=False, opponent_model_path="", enable_replays=False))
+    game = make_game_with_last_play(4, args.seed); ai_id = game.get_current_player_id(); snapshot = game.snapshot("10001")
+    corpus = build_corpus(args.samples, args.seed) + (load_corpus(args.corpus) if args.corpus else [])
+    print(f"语料 {len(corpus)} 条 (种子 {len(SEEDS)}，变异器 {len(MUTATORS)} 种)")
+    for label, extract, strict in (("旧: 正则", legacy_extract, True), ("新: 单遍扫描", plugin._extract_llm_json, False)):
+        report = evaluate(plugin, snapshot, ai_id, corpus, extract, strict)
+        print(f"[{label}] 正确 {report['correct']} ({report['correct'] / len(corpus):.1%}) | 重试 {report['retries']} (每千次决策 {report['retries'] * 1000 / len(corpus):.0f}) | "
+              f"误判 {report['wrong']} | {report['us_per_parse']:.1f} µs/条")
+        for name, count in sorted(report["failures"].items(), key=lambda item: -item[1])[:args.show_failures]: print(f"    {count:>5}  {name}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+# liar_tavern/benchmarks/loadtest.py
+
+# -*- coding: utf-8 -*-
+
+"""多群并发压测: 在进程内用假 bot / 假 LLM 驱动 LiarDicePlugin 跑完整对局。
+
+用法示例:
+    python benchmarks/loadtest.py --groups 200 --humans 2 --ais 2
+    python benchmarks/loadtest.py --groups 500 --send-latency-ms 30 --send-fail-rate 0.01 --llm-delay-ms 800 --pacing-scale 0.05
+    python benchmarks/loadtest.py --groups 20 --tables-per-group 3 --humans 4 --ais 28   # 同群多桌 + 大桌
+    python benchmarks/loadtest.py --groups 2 --tournament --humans 8 --ais 56 --llm-delay-ms 800   # 每群一场 64 人锦标赛
+
+报告: 回合延迟 p50/p99 (人类命令处理 / AI 回合)、事件循环滞后、峰值内存、每分钟完成局数。
+结束后把本次存下的回放全部重放核对，有任何一局重放失败时退出码为 1。
+"""
+
+import os
+import json
+import re
+import sys
+import time
+import types
+import random
+import itertools
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import astrbot_stubs # noqa: E402
+
+astrbot_stubs.install_framework()
+astrbot_stubs.load_plugin_package()
+import liar_tavern.main as plugin_main # noqa: E402
+from liar_tavern.main import LiarDicePlugin # noqa: E402
+from liar_tavern.models import make_table_key # noqa: E402
+from liar_tavern import memory_report # noqa: E402
+from replay_viewer import replay_archive # noqa: E402
+
+# --- 假平台 ---
+class FakeBot:
+    """send_group_msg / send_private_msg 带可配置延迟与失败率"""
+
+    def __init__(self, latency_ms: float, fail_rate: float, rng: random.Random):
+        self.latency_s = latency_ms / 1000.0; self.fail_rate = fail_rate; self.rng = rng
+        self.sent_group = 0; self.sent_private = 0; self.failed = 0
+
+    async def _deliver(self):
+        if self.latency_s: await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.latency_s)
+        if self.fail_rate and self.rng.random() < self.fail_rate: self.failed += 1; raise astrbot_stubs.ActionFailed(retcode=1200, message="fake failure", wording="压测注入失败")
+
+    async def send_group_msg(self, group_id: int, message):
+        await self._deliver(); self.sent_group += 1
+
+    async def send_private_msg(self, user_id: int, message):
+        await self._deliver(); self.sent_private += 1
+
+class FakeEvent(astrbot_stubs.AstrMessageEvent):
+    _next_message_id = itertools.count(1)
+
+    def __init__(self, bot: FakeBot, group_id: str, sender_id: str, sender_name: str, message_str: str, message_id: Optional[int] = None):
+        super().__init__(); self.bot = bot; self._group_id = group_id; self._sender_id = sender_id; self._sender_name = sender_name; self.message_str = message_str
+        self.message_obj = types.SimpleNamespace(message_id=message_id or next(self._next_message_id))
+    def redelivered(self) -> "FakeEvent":
+        """适配器重投: 同一条消息 (同一消息 ID) 再触发一次"""
+        return FakeEvent(self.bot, self._group_id, self._sender_id, self._sender_name, self.message_str, self.message_obj.message_id)
+    def get_group_id(self): return self._group_id
+    def get_sender_id(self): return self._sender_id
+    def get_sender_name(self): return self._sender_name
+
+class FakeLLMResponse:
+    def __init__(self, completion_text: str): self.completion_text = completion_text
+
+class FakeProvider:
+    """根据 Prompt 中的手牌/上家信息返回脚本化决策，带可配置延迟与失败率"""
+
+    _HAND_RE = re.compile(r"确保编号有效\(1-(\d+)\)")
+
+    def __init__(self, delay_ms: float, fail_rate: float, challenge_rate: float, rng: random.Random, stall_rate: float = 0.0, outage_s: float = 0.0):
+        self.delay_s = delay_ms / 1000.0; self.fail_rate = fail_rate; self.challenge_rate = challenge_rate; self.rng = rng; self.calls = 0
+        self.stall_rate = stall_rate; self.outage_until = time.perf_counter() + outage_s # 开头 outage_s 秒内所有调用都失败
+
+    async def text_chat(self, prompt: str, session_id=None, contexts=None, **kwargs):
+        self.calls += 1
+        if self.delay_s: await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.delay_s)
+        if self.fail_rate and self.rng.random() < self.fail_rate: raise TimeoutError("fake provider timeout")
+        if time.perf_counter() < self.outage_until: raise ConnectionError("fake provider outage")
+        if self.stall_rate and self.rng.random() < self.stall_rate: await asyncio.sleep(3600) # 挂起，只能靠回合截止时间收回
+        if "说句垃圾话" in prompt: return FakeLLMResponse("就这？")
+        has_last_play = "- 上家: 无" not in prompt
+        if "JSON计划" in prompt: return FakeLLMResponse(f"<thinking>压测</thinking>\n{self._plan(prompt, has_last_play)}")
+        match = self._HAND_RE.search(prompt); hand_size = int(match.group(1)) if match else 0
+        if has_last_play and (hand_size == 0 or self.rng.random() < self.challenge_rate): decision = '{"action": "challenge"}'
+        elif hand_size == 0: decision = '{"action": "wait"}'
+        else: decision = '{"action": "play", "indices": [%s]}' % ", ".join(str(i) for i in range(1, min(hand_size, self.rng.randint(1, 2)) + 1))
+        return FakeLLMResponse(f"<thinking>压测</thinking>\n{decision}")
+
+    def _plan(self, prompt: str, has_last_play: bool) -> str:
+        """批量计划: 各 AI 手牌见 “各 AI 手牌” 段，每张牌显示为 [编号:牌面]"""
+        block = prompt.split("- 各 AI 手牌:\n", 1)[1].split("- 玩家状态", 1)[0]; moves = []
+        for line in block.splitlines():
+            hand_size = line.count("[")
+            if (has_last_play or moves) and (hand_size == 0 or self.rng.random() < self.challenge_rate): moves.append({"action": "challenge"})
+            elif hand_size == 0: moves.append({"action": "wait"})
+            else: moves.append({"action": "play", "indices": list(range(1, min(hand_size, self.rng.randint(1, 2)) + 1))})
+        return json.dumps({"moves": moves})
+
+def _scaled_asyncio(scale: float) -> types.ModuleType:
+    """替换插件模块里的 asyncio，只缩放 sleep (AI 节奏停顿)，其余原样委托"""
+    proxy = types.ModuleType("asyncio_scaled")
+    proxy.__getattr__ = lambda name: getattr(asyncio, name)
+    async def sleep(delay, result=None): return await asyncio.sleep(delay * scale, result)
+    proxy.sleep = sleep
+    return proxy
+
+# --- 统计 ---
+def percentile(values: List[float], q: float) -> float:
+    if not values: return 0.0
+    ordered = sorted(values); idx = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[idx]
+
+class LoopLagMonitor:
+    def __init__(self, interval: float = 0.05): self.interval = interval; self.samples: List[float] = []; self._task: Optional[asyncio.Task] = None
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time(); await asyncio.sleep(self.interval); self.samples.append(max(0.0, loop.time() - start - self.interval) * 1000.0)
+    def start(self): self._task = asyncio.get_running_loop().create_task(self._run())
+    def stop(self):
+        if self._task: self._task.cancel()
+
+# --- 驱动 ---
+async def _drain(agen):
+    async for _ in agen: pass
+
+class GroupDriver:
+    """驱动群内一张牌桌 (table 为空时是默认桌) 的完整对局"""
+
+    def __init__(self, plugin: LiarDicePlugin, bot: FakeBot, group_id: str, humans: int, ais: int, think_ms: float, challenge_rate: float, rng: random.Random, stats: Dict[str, List[float]], table: str = "", table_index: int = 0, hand_check_rate: float = 0.0, duplicate_rate: float = 0.0):
+        self.plugin = plugin; self.bot = bot; self.group_id = group_id; self.rng = rng; self.stats = stats
+        self.table = table; self.table_key = make_table_key(group_id, table); self.table_arg = f" {table}" if table else ""
+        self.humans = [(f"{900000000 + table_index * 10000000 + int(group_id) * 100 + i}", f"玩家{i}") for i in range(humans)]; self.ais = ais
+        self.think_s = think_ms / 1000.0; self.challenge_rate = challenge_rate; self.hand_check_rate = hand_check_rate; self.duplicate_rate = duplicate_rate
+
+    def _event(self, sender_id: str, sender_name: str, text: str) -> FakeEvent:
+        return FakeEvent(self.bot, self.group_id, sender_id, sender_name, text)
+
+    async def _human_turn(self, pid: str, pname: str, game) -> None:
+        pdata = game.state.players[pid]; has_last_play = game.state.last_play is not None
+        if self.hand_check_rate and self.rng.random() < self.hand_check_rate: await _drain(self.plugin.show_my_hand_cmd(self._event(pid, pname, "我的手牌"))) # 行动前再看一眼手牌
+        if has_last_play and (not pdata.hand or self.rng.random() < self.challenge_rate): handler, text = self.plugin.challenge_play_cmd, "质疑"
+        elif not pdata.hand: handler, text = self.plugin.wait_turn_cmd, "等待"
+        else: count = min(len(pdata.hand), self.rng.randint(1, 2)); handler, text = self.plugin.play_cards_cmd, "出牌 " + " ".join(str(i) for i in range(1, count + 1))
+        event = self._event(pid, pname, text)
+        t0 = time.perf_counter(); await _drain(handler(event)); self.stats["human_turn_ms"].append((time.perf_counter() - t0) * 1000.0)
+        if self.duplicate_rate and self.rng.random() < self.duplicate_rate: # 重投: 漏过去弹的任何回复都会出现在群里
+            self.stats.setdefault("duplicates_sent", []).append(1); replies = [item async for item in handler(event.redelivered())]
+            if replies: self.stats.setdefault("duplicate_replies", []).append(len(replies))
+
+    async def play_one_game(self, timeout_s: float) -> bool:
+        creator_id, creator_name = self.humans[0] if self.humans else ("1", "房主")
+        key = self.table_key; table = self.table
+        await _drain(self.plugin.create_game(self._event(creator_id, creator_name, "骗子酒馆" + self.table_arg), table))
+        for pid, pname in self.humans: await _drain(self.plugin.join_game(self._event(pid, pname, "加入" + self.table_arg), table))
+        if self.ais: await _drain(self.plugin.add_ai_player(self._event(creator_id, creator_name, "添加AI"), self.ais, table))
+        await _drain(self.plugin.start_game_cmd(self._event(creator_id, creator_name, "开始" + self.table_arg), table))
+        human_ids = dict(self.humans); deadline = time.perf_counter() + timeout_s
+        while key in self.plugin.games:
+            if time.perf_counter() > deadline:
+                await _drain(self.plugin.force_end_game_cmd(self._event(creator_id, creator_name, "结束游戏" + self.table_arg), table)); return False
+            game = self.plugin.games[key]; current = game.get_current_player_id()
+            if current in human_ids:
+                if self.think_s: await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_s)
+                if key in self.plugin.games and game.get_current_player_id() == current: await self._human_turn(current, human_ids[current], game)
+            else: await asyncio.sleep(0.01) # AI 回合由插件自己的任务推进
+        return True
+
+class TournamentDriver(GroupDriver):
+    """驱动一个群的锦标赛: 报名、开赛，之后每名人类选手在自己当前所在的牌桌上轮到时行动，直到决出冠军"""
+
+    def __init__(self, *args, ais_entrants: int = 0, table_size: int = 4, **kwargs):
+        super().__init__(*args, **kwargs); self.ai_entrants = ais_entrants; self.table_size = table_size; self.peak_games = 0
+
+    async def _human_loop(self, pid: str, pname: str) -> None:
+        games = self.plugin.games
+        while self.group_id in self.plugin.tournaments:
+            key = next((k for k in self.plugin._group_tables.get(self.group_id, ()) if k in games and games[k].get_current_player_id() == pid), None)
+            if key is None: await asyncio.sleep(0.01); continue
+            game = games[key]
+            if self.think_s: await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_s)
+            if key in games and game.get_current_player_id() == pid: await self._human_turn(pid, pname, game)
+
+    async def run(self, timeout_s: float):
+        """返回结束时的锦标赛对象 (超时则取消并返回 None)"""
+        cup = self.plugin.tournament_cmd; organizer = self.humans[0] if self.humans else ("1", "房主")
+        await _drain(cup(self._event(*organizer, "酒馆锦标赛 创建"), "创建", str(self.table_size)))
+        for pid, pname in self.humans: await _drain(cup(self._event(pid, pname, "酒馆锦标赛 报名"), "报名"))
+        if self.ai_entrants: await _drain(cup(self._event(*organizer, "酒馆锦标赛 AI"), "AI", str(self.ai_entrants)))
+        tournament = self.plugin.tournaments[self.group_id]
+        await _drain(cup(self._event(*organizer, "酒馆锦标赛 开赛"), "开赛"))
+        humans = [asyncio.create_task(self._human_loop(pid, pname)) for pid, pname in self.humans]; deadline = time.perf_counter() + timeout_s
+        try:
+            while self.group_id in self.plugin.tournaments:
+                if time.perf_counter() > deadline: await _drain(cup(self._event(*organizer, "酒馆锦标赛 取消"), "取消")); return None
+                self.peak_games = max(self.peak_games, len(self.plugin.games)); await asyncio.sleep(0.05)
+        finally: [t.cancel() for t in humans]
+        return tournament
+
+async def run(args) -> Dict[str, float]:
+    rng = random.Random(args.seed); random.seed(args.seed)
+    plugin_main.asyncio = _scaled_asyncio(args.pacing_scale)
+    bot = FakeBot(args.send_latency_ms, args.send_fail_rate, rng)
+    provider = FakeProvider(args.llm_delay_ms, args.llm_fail_rate, args.ai_challenge_rate, rng, args.llm_stall_rate, args.llm_outage_s)
+    work_dir = tempfile.mkdtemp(prefix="liar_loadtest_")
+    config = astrbot_stubs.AstrBotConfig(enable_trash_talk=not args.no_trash_talk, recent_chat_history_length=10, include_chat_in_action_prompt=True,
+                                         max_table_players=max(2, args.tournament_table_size if args.tournament else args.humans + args.ais), max_tables_per_group=args.tables_per_group,
+                                         player_stats_db_path=args.stats_db or os.path.join(work_dir, "stats.db"), opponent_model_path=os.path.join(work_dir, "opponents.json"),
+                                         replay_db_path=args.replay_db or os.path.join(work_dir, "replays.db"), ai_batch_turns=args.ai_batch, ai_turn_deadline_seconds=args.ai_deadline,
+                                         hand_display_mode="image" if args.hand_images else "text", hand_image_cache_dir=os.path.join(work_dir, "hands"), hand_image_prewarm=args.hand_image_prewarm,
+                                         hand_dm_dedup=not args.no_hand_dedup, event_dedupe_window_seconds=0 if args.no_event_dedupe else 3,
+                                         llm_max_concurrent_calls=args.llm_max_concurrent, tournament_table_size=args.tournament_table_size, tournament_max_live_tables=args.tournament_live_tables, tournament_max_entrants=args.humans + args.ais)
+    plugin = LiarDicePlugin(astrbot_stubs.Context(provider=provider), config)
+    if plugin._hand_image_thread: t0 = time.perf_counter(); await asyncio.to_thread(plugin._hand_image_thread.join); print(f"手牌图片预热用时 {time.perf_counter() - t0:.1f}s")
+
+    stats: Dict[str, List[float]] = {"human_turn_ms": [], "ai_turn_ms": []}
+    original_ai_turn = plugin._handle_ai_turn
+    async def timed_ai_turn(*a, **kw):
+        t0 = time.perf_counter()
+        try: return await original_ai_turn(*a, **kw)
+        finally: stats["ai_turn_ms"].append((time.perf_counter() - t0) * 1000.0)
+    plugin._handle_ai_turn = timed_ai_turn
+
+    if args.tracemalloc: tracemalloc.start()
+    lag = LoopLagMonitor(); lag.start()
+    completed = 0; timed_out = 0; start = time.perf_counter()
+    memory_reports = []
+    async def memory_sampler(): # 周期性跑一轮内存估算，观察分片测量对回合延迟与事件循环滞后的影响
+        while True: await asyncio.sleep(args.memory_report_interval); memory_reports.append(await plugin._measure_memory())
+    sampler = asyncio.create_task(memory_sampler()) if args.memory_report_interval > 0 else None
+
+    async def table_worker(index: int, table_index: int):
+        nonlocal completed, timed_out
+        table = f"T{table_index}" if table_index else "" # 第一张为默认桌，其余为命名桌
+        driver = GroupDriver(plugin, bot, str(100000 + index), args.humans, args.ais, args.think_ms, args.human_challenge_rate, random.Random(args.seed + index * 100 + table_index), stats, table, table_index, args.hand_check_rate, args.duplicate_rate)
+        for _ in range(args.games_per_group):
+            if await driver.play_one_game(args.game_timeout): completed += 1
+            else: timed_out += 1
+
+    tournaments = []; drivers = []
+    async def tournament_worker(index: int):
+        driver = TournamentDriver(plugin, bot, str(100000 + index), args.humans, 0, args.think_ms, args.human_challenge_rate, random.Random(args.seed + index * 100), stats,
+                                  hand_check_rate=args.hand_check_rate, duplicate_rate=args.duplicate_rate, ais_entrants=args.ais, table_size=args.tournament_table_size)
+        drivers.append(driver); tournament = await driver.run(args.game_timeout)
+        if tournament: tournaments.append(tournament)
+
+    if args.tournament: await asyncio.gather(*(tournament_worker(i) for i in range(args.groups)))
+    else: await asyncio.gather(*(table_worker(i, t) for i in range(args.groups) for t in range(args.tables_per_group)))
+    if args.tournament: completed = sum(t.tables_played for t in tournaments); timed_out = args.groups - len(tournaments)
+    elapsed = time.perf_counter() - start; lag.stop()
+    if sampler: sampler.cancel()
+    replays_saved = lambda: plugin.replay_archive.saved if plugin.replay_archive else 0
+    await plugin.terminate() # 同时写完剩余的战绩增量与回放
+    replay_check = await asyncio.to_thread(replay_archive, plugin.replay_archive.db_path) if plugin.replay_archive else None
+    for replay_id, error in (replay_check["failures"][:5] if replay_check else []): print(f"  ✗ 回放 #{replay_id} 重放失败: {error}")
+    stats_store = plugin.player_stats
+
+    report = {
+        "groups": args.groups, "tables": args.groups * args.tables_per_group, "games_completed": completed, "games_timed_out": timed_out, "elapsed_s": elapsed,
+        "games_per_minute": completed / elapsed * 60.0 if elapsed else 0.0,
+        "human_turn_p50_ms": percentile(stats["human_turn_ms"], 0.5), "human_turn_p99_ms": percentile(stats["human_turn_ms"], 0.99),
+        "ai_turn_p50_ms": percentile(stats["ai_turn_ms"], 0.5), "ai_turn_p99_ms": percentile(stats["ai_turn_ms"], 0.99),
+        "turns_human": len(stats["human_turn_ms"]), "turns_ai": len(stats["ai_turn_ms"]),
+        "loop_lag_p50_ms": percentile(lag.samples, 0.5), "loop_lag_p99_ms": percentile(lag.samples, 0.99), "loop_lag_max_ms": max(lag.samples, default=0.0),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "group_msgs": bot.sent_group, "private_msgs": bot.sent_private, "send_failures": bot.failed, "llm_calls": provider.calls,
+        "stats_flush_batches": stats_store.flushed_batches if stats_store else 0, "stats_rows_written": stats_store.flushed_rows if stats_store else 0, "opponent_profiles": len(plugin.opponent_model),
+        "replays_saved": replays_saved(), "replays_failed": len(replay_check["failures"]) if replay_check else 0,
+        "llm_timeouts": sum(h.timeouts for h in plugin._provider_health.values()), "llm_skipped_open": sum(h.skipped for h in plugin._provider_health.values()),
+    }
+    if plugin.hand_images: report.update({"hand_image_memory_hits": plugin.hand_images.memory_hits, "hand_image_disk_hits": plugin.hand_images.disk_hits, "hand_image_renders": plugin.hand_images.renders})
+    if plugin.hand_delivery: report.update({f"hand_dm_{key}": getattr(plugin.hand_delivery, key) for key in ("sent_full", "sent_delta", "suppressed", "collapsed", "throttled")})
+    if args.duplicate_rate: report.update({"duplicates_sent": len(stats.get("duplicates_sent", [])), "duplicate_replies": sum(stats.get("duplicate_replies", [])), "duplicates_dropped": plugin.event_deduper.dropped if plugin.event_deduper else 0})
+    if args.tournament: report.update({"tournaments_completed": len(tournaments), "tournament_rounds": sum(len(t.rounds) for t in tournaments), "tournament_peak_live_tables": max((t.peak_live for t in tournaments), default=0),
+                                       "peak_games_in_memory": max((d.peak_games for d in drivers), default=0), "games_left_in_memory": len(plugin.games)})
+    if plugin.llm_gate: report.update({"llm_gate_queued": plugin.llm_gate.queued, "llm_gate_timeouts": plugin.llm_gate.timeouts, "llm_gate_wait_human_s": plugin.llm_gate.wait_seconds[0], "llm_gate_wait_ai_s": plugin.llm_gate.wait_seconds[1]})
+    if args.ai_batch: report.update({f"ai_plan_{key}": value for key, value in plugin.ai_plan_stats.items()})
+    if memory_reports:
+        peak = max(memory_reports, key=lambda r: r.total)
+        report.update({"memory_scans": len(memory_reports), "memory_scan_max_ms": max(r.seconds for r in memory_reports) * 1000.0, "memory_scan_max_slices": max(r.slices for r in memory_reports), "memory_peak_estimate_mb": peak.total / 1024 / 1024})
+        report.update({f"memory_peak_{label}_kb": size / 1024 for label, size in zip(memory_report.CATEGORY_LABELS, peak.totals)})
+    if args.tracemalloc: report["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024; tracemalloc.stop()
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="骗子酒馆多群并发压测")
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--games-per-group", type=int, default=1, help="每张牌桌连续进行的局数")
+    parser.add_argument("--tables-per-group", type=int, default=1, help="每个群同时进行的牌桌数")
+    parser.add_argument("--humans", type=int, default=2)
+    parser.add_argument("--ais", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--send-latency-ms", type=float, default=20.0)
+    parser.add_argument("--send-fail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-delay-ms", type=float, default=300.0)
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0, help="LLM 调用永久挂起的概率")
+    parser.add_argument("--llm-outage-s", type=float, default=0.0, help="压测开始后这段时间内 LLM 调用全部失败 (观察熔断与恢复)")
+    parser.add_argument("--ai-deadline", type=float, default=25.0, help="AI 回合总截止时间 (秒，ai_turn_deadline_seconds)")
+    parser.add_argument("--ai-challenge-rate", type=float, default=0.4)
+    parser.add_argument("--human-challenge-rate", type=float, default=0.3)
+    parser.add_argument("--think-ms", type=float, default=50.0, help="人类玩家思考时间")
+    parser.add_argument("--pacing-scale", type=float, default=0.0, help="插件内 asyncio.sleep 节奏停顿的缩放倍数 (1.0 为真实节奏)")
+    parser.add_argument("--game-timeout", type=float, default=120.0, help="单局超时 (秒)，超时强制结束")
+    parser.add_argument("--no-trash-talk", action="store_true")
+    parser.add_argument("--ai-batch", action="store_true", help="开启连续 AI 座位的批量决策 (ai_batch_turns)")
+    parser.add_argument("--hand-images", action="store_true", help="私信手牌改为图片 (需要 Pillow)，等预热完成后再开局")
+    parser.add_argument("--hand-image-prewarm", type=int, default=4096, help="预渲染的常见开局手牌数")
+    parser.add_argument("--hand-check-rate", type=float, default=0.0, help="人类玩家行动前使用 /我的手牌 的概率")
+    parser.add_argument("--no-hand-dedup", action="store_true", help="关闭手牌私信去重 (hand_dm_dedup=false)，用于对比私信条数")
+    parser.add_argument("--duplicate-rate", type=float, default=0.0, help="人类玩家的出牌/质疑/等待事件被适配器重投的概率")
+    parser.add_argument("--no-event-dedupe", action="store_true", help="关闭重复事件过滤 (event_dedupe_window_seconds=0)")
+    parser.add_argument("--llm-max-concurrent", type=int, default=8, help="LLM 并发上限 (llm_max_concurrent_calls)，0 不限制")
+    parser.add_argument("--tournament", action="store_true", help="每个群改为一场锦标赛: --humans 名人类与 --ais 名 AI 报名，--game-timeout 为整场时限")
+    parser.add_argument("--tournament-table-size", type=int, default=4)
+    parser.add_argument("--tournament-live-tables", type=int, default=8, help="同时进行的牌桌数上限 (tournament_max_live_tables)")
+    parser.add_argument("--memory-report-interval", type=float, default=0.0, help="每隔这么多秒跑一轮 /酒馆内存 的分片估算，报告测量耗时与各类别峰值")
+    parser.add_argument("--tracemalloc", action="store_true", help="额外统计 Python 堆峰值 (有额外开销)")
+    parser.add_argument("--stats-db", default="", help="战绩数据库路径 (默认写入临时目录)")
+    parser.add_argument("--replay-db", default="", help="回放存档路径 (默认写入临时目录，可再用 replay_viewer.py --bulk 重放)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING); logging.getLogger("liar_tavern").setLevel(logging.CRITICAL)
+    report = asyncio.run(run(args))
+    width = max(len(k) for k in report)
+    for key, value in report.items(): print(f"{key:<{width}}  {value:.2f}" if isinstance(value, float) else f"{key:<{width}}  {value}")
+    return 0 if report["games_completed"] and not report["replays_failed"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# liar_tavern/benchmarks/provider_warmup.py
+
+# -*- coding: utf-8 -*-
+
+"""LLM 提供方预热/保活效果测量: 本地 HTTP 替身提供方 + 真实插件对局 (无需 AstrBot 与网络)。
+
+替身服务端模拟真实 LLM 网关的两个特征:
+    * 每条新连接先付出 --connect-ms 的建连成本 (DNS/TCP/TLS)；
+    * 连接空闲超过 --idle-s 秒即被服务端关闭，客户端下次请求只能重新建连。
+替身客户端像常见 HTTP 客户端一样复用一条 keep-alive 连接，断开时自动重连一次。
+
+用法:
+    python benchmarks/provider_warmup.py                     # 对比 关闭预热/保活 与 开启 两种配置
+    python benchmarks/provider_warmup.py --think-ms 3000     # 人类思考时间超过空闲回收时间，观察保活对稳态延迟的影响
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import threading
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadtest # noqa: E402  (同时完成 AstrBot 替身的安装与插件加载)
+from loadtest import FakeBot, FakeProvider, GroupDriver, LiarDicePlugin, astrbot_stubs # noqa: E402
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # 支持 keep-alive
+
+    def setup(self):
+        self.timeout = self.server.idle_s # 空闲连接在读超时后被关闭
+        time.sleep(self.server.connect_s); self.server.connections += 1 # 每条新连接一次的建连成本
+        super().setup()
+
+    def _reply(self, payload: Dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(200); self.send_header("Content-Type", "application/json"); self.send_header("Content-Length", str(len(body))); self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply({"models": ["stand-in"]})
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.service_s); self._reply({"ok": True})
+
+    def log_message(self, format, *args): pass
+
+def start_server(connect_ms: float, idle_s: float, service_ms: float) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler); server.daemon_threads = True
+    server.connect_s = connect_ms / 1000.0; server.idle_s = idle_s; server.service_s = service_ms / 1000.0; server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class HttpStandInProvider(FakeProvider):
+    """先完成一次真实的 HTTP 往返，再按压测脚本的规则给出决策"""
+
+    def __init__(self, port: int, challenge_rate: float, rng: random.Random):
+        super().__init__(0, 0, challenge_rate, rng); self.port = port
+        self._conn = None; self._lock = threading.Lock(); self.connects = 0
+
+    def _request(self, method: str, path: str, body: bytes = b"") -> bytes:
+        with self._lock: # 单连接，请求串行 (连接池大小为 1)
+            for attempt in (0, 1):
+                if self._conn is None: self._conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30); self.connects += 1
+                try:
+                    self._conn.request(method, path, body=body or None, headers={"Content-Type": "application/json"})
+                    return self._conn.getresponse().read()
+                except (http.client.HTTPException, ConnectionError, OSError):
+                    self._conn.close(); self._conn = None # 服务端已回收这条空闲连接
+                    if attempt: raise
+        return b""
+
+    async def text_chat(self, prompt: str, session_id=None, contexts=None, **kwargs):
+        await asyncio.to_thread(self._request, "POST", "/chat", json.dumps({"prompt": prompt[:64]}).encode())
+        return await super().text_chat(prompt, session_id, contexts, **kwargs)
+
+    async def get_models(self):
+        return json.loads(await asyncio.to_thread(self._request, "GET", "/models"))
+
+async def run_mode(args, warm: bool) -> Tuple[Dict[str, float], int]:
+    server = start_server(args.connect_ms, args.idle_s, args.service_ms)
+    rng = random.Random(args.seed); random.seed(args.seed)
+    loadtest.plugin_main.asyncio = loadtest._scaled_asyncio(args.pacing_scale)
+    provider = HttpStandInProvider(server.server_address[1], 0.4, rng)
+    config = astrbot_stubs.AstrBotConfig(enable_trash_talk=False, enable_player_stats=False, enable_replays=False, opponent_model_path="",
+                                         provider_warmup=warm, provider_keepalive_seconds=args.keepalive_s if warm else 0)
+    plugin = LiarDicePlugin(astrbot_stubs.Context(provider=provider), config); bot = FakeBot(0, 0, rng)
+
+    async def table(index: int):
+        driver = GroupDriver(plugin, bot, str(200000 + index), 1, args.ais, args.think_ms, 0.3, random.Random(args.seed + index), {"human_turn_ms": [], "ai_turn_ms": []})
+        for game in range(args.games):
+            if game: await asyncio.sleep(args.gap_s) # 两局之间的空档超过空闲回收时间，下一局开局时连接已冷
+            await driver.play_one_game(120)
+    await asyncio.gather(*(table(i) for i in range(args.tables)))
+    await plugin.terminate(); server.shutdown(); server.server_close()
+    first, steady = plugin.ai_llm_latency["first"], plugin.ai_llm_latency["steady"]
+    health = next(iter(plugin._provider_health.values()))
+    return {"first_calls": first.count, "first_avg_ms": first.avg_ms, "first_max_ms": first.max_ms,
+            "steady_calls": steady.count, "steady_avg_ms": steady.avg_ms, "steady_p90_ms": steady.percentile(0.9),
+            "pings": health.warmups}, server.connections
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="LLM 提供方预热/保活效果测量")
+    parser.add_argument("--tables", type=int, default=1, help="并发牌桌数 (多桌共用一条连接，会互相保温)")
+    parser.add_argument("--games", type=int, default=3, help="每张牌桌依次进行的局数")
+    parser.add_argument("--ais", type=int, default=2)
+    parser.add_argument("--connect-ms", type=float, default=300.0, help="每条新连接的建连成本")
+    parser.add_argument("--idle-s", type=float, default=2.0, help="服务端回收空闲连接的时间")
+    parser.add_argument("--service-ms", type=float, default=40.0, help="每次请求的服务耗时")
+    parser.add_argument("--gap-s", type=float, default=2.5, help="同一牌桌两局之间的空档")
+    parser.add_argument("--keepalive-s", type=float, default=1.2, help="开启时的 provider_keepalive_seconds (应小于 --idle-s)")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="人类玩家思考时间")
+    parser.add_argument("--pacing-scale", type=float, default=0.5, help="插件内节奏停顿的缩放倍数")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING); logging.getLogger("liar_tavern").setLevel(logging.CRITICAL)
+
+    for label, warm in (("关闭预热/保活", False), ("开启预热/保活", True)):
+        report, connections = asyncio.run(run_mode(args, warm))
+        print(f"[{label}] 服务端建连 {connections} 次")
+        for key, value in report.items(): print(f"  {key:<14} {value:.1f}" if isinstance(value, float) else f"  {key:<14} {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+# liar_tavern/benchmarks/replay_viewer.py
+
+# -*- coding: utf-8 -*-
+
+"""对局回放查看 / 批量重放工具 (无需 AstrBot)。
+
+用法:
+    python benchmarks/replay_viewer.py --code <回放码>                  # 逐回合打印整局
+    python benchmarks/replay_viewer.py --db data/liar_tavern_replays.db --id 42 --turn 15   # 快进到第 15 回合并打印局面
+    python benchmarks/replay_viewer.py --db data/liar_tavern_replays.db --id 42 --step      # 交互式: 回车下一回合，数字跳转，q 退出
+    python benchmarks/replay_viewer.py --db data/liar_tavern_replays.db --bulk [--limit 10000]  # 批量解码+重放，校验一致性并报告吞吐
+
+回放由 LiarDiceGame 重新执行；洗牌使用录制的发牌结果，质疑与开枪结果会与录制值核对。
+"""
+
+import os
+import sys
+import time
+import logging
+import sqlite3
+import argparse
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import astrbot_stubs # noqa: E402
+
+astrbot_stubs.load_plugin_package() # replay / game_logic 不依赖 AstrBot，只需以包名导入
+from liar_tavern.replay import ReplayCursor, decode_replay, replay_from_code # noqa: E402
+from liar_tavern.exceptions import ReplayError # noqa: E402
+from liar_tavern.models import ChallengeResult, ShotResult # noqa: E402
+
+def describe_turn(cursor: ReplayCursor, result: Dict[str, Any]) -> str:
+    action = result.get("action")
+    if action == "play":
+        name = result.get("player_name") or result.get("player_who_played_name"); cards = result.get("actual_cards") or result.get("played_cards")
+        line = f"{name} 打出 {len(cards)} 张 (实际: {' '.join(cards)})"
+    elif action == "challenge":
+        truth = "吹牛被抓" if result["challenge_result"] == ChallengeResult.SUCCESS else "声称属实"
+        line = f"{result['challenger_name']} 质疑 {result['challenged_player_name']} → {truth}，{result['loser_name']} 开枪{'中弹淘汰' if result['shot_outcome'] == ShotResult.HIT else '幸存'}"
+    else: line = f"{result.get('player_name')} 等待"
+    if result.get("new_main_card"): line += f"\n      ↻ 洗牌，新主牌 {result['new_main_card']}"
+    if cursor.finished and cursor.replay.winner: line += f"\n      🏆 胜者: {cursor.replay.winner.name}"
+    return line
+
+def describe_state(cursor: ReplayCursor) -> str:
+    state = cursor.game.state; current = cursor.game.get_current_player_id() if not cursor.finished else None
+    lines = [f"-- 第 {cursor.turn} 回合后 | 主牌 {state.main_card} --"]
+    for pid in state.turn_order:
+        p = state.players[pid]
+        lines.append(f"{'➡️' if pid == current else '  '} {p.name}{'[AI]' if p.is_ai else ''}{' (淘汰)' if p.is_eliminated else ''}: {' '.join(p.hand) or '-'} | 枪 {p.gun_position}/{p.gun_chambers} 空响 {p.shots_survived}")
+    if state.last_play: lines.append(f"上家: {state.last_play.player_name} 声称 {state.last_play.claimed_quantity} 张")
+    return "\n".join(lines)
+
+def load_bytes(args) -> bytes:
+    if args.code: return replay_from_code(args.code)
+    if args.file:
+        with open(args.file, "rb") as f: return f.read()
+    row = sqlite3.connect(args.db).execute("SELECT data FROM replays WHERE id = ?", (args.id,)).fetchone()
+    if not row: raise ReplayError(f"存档中没有编号 {args.id}")
+    return bytes(row[0])
+
+def show(data: bytes, args) -> None:
+    replay = decode_replay(data); cursor = ReplayCursor(replay)
+    print(f"群 {replay.group_id} | {len(replay.seats)} 人 | {replay.turn_count} 回合 | {len(data)} 字节 | "
+          f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(replay.started_at))} 起，历时 {replay.ended_at - replay.started_at}s")
+    print(describe_state(cursor))
+    if args.turn is not None: cursor.seek(args.turn); print(describe_state(cursor)); return
+    if not args.step:
+        while not cursor.finished: result = cursor.step(); print(f"{cursor.turn:>4}. {describe_turn(cursor, result)}")
+        return
+    while True:
+        command = input("[回车]下一回合 / 数字跳转 / q 退出 > ").strip()
+        if command == "q": return
+        if command.isdigit(): cursor.seek(int(command)); print(describe_state(cursor)); continue
+        if cursor.finished: print("(已结束)"); continue
+        result = cursor.step(); print(f"{cursor.turn:>4}. {describe_turn(cursor, result)}"); print(describe_state(cursor))
+
+def replay_archive(db_path: str, limit: int = 100000) -> Dict[str, Any]:
+    """批量解码并完整重放存档中的对局 (loadtest.py 压测结束后也用它核对回放)"""
+    conn = sqlite3.connect(db_path); total_bytes = games = turns = 0; failures = []
+    t0 = time.perf_counter()
+    try:
+        for replay_id, data in conn.execute("SELECT id, data FROM replays ORDER BY id DESC LIMIT ?", (limit,)):
+            try:
+                cursor = ReplayCursor(decode_replay(bytes(data)))
+                while not cursor.finished: cursor.step()
+                games += 1; turns += cursor.turn; total_bytes += len(data)
+            except Exception as e: failures.append((replay_id, str(e)))
+    finally: conn.close()
+    return {"games": games, "turns": turns, "bytes": total_bytes, "seconds": time.perf_counter() - t0, "failures": failures}
+
+def bulk(args) -> int:
+    """批量重放存档，报告吞吐与不一致的回放"""
+    checked = replay_archive(args.db, args.limit); games = checked["games"]; elapsed = checked["seconds"]
+    print(f"重放 {games} 局 / {checked['turns']} 回合，用时 {elapsed:.2f}s ({games / elapsed if elapsed else 0:.0f} 局/s)，平均 {checked['bytes'] / games if games else 0:.0f} 字节/局")
+    for replay_id, error in checked["failures"][:20]: print(f"  ✗ #{replay_id}: {error}")
+    return 1 if checked["failures"] else 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="骗子酒馆回放查看")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--code", help="/酒馆回放 给出的回放码")
+    source.add_argument("--file", help="原始回放文件")
+    source.add_argument("--id", type=int, help="存档中的回放编号 (配合 --db)")
+    source.add_argument("--bulk", action="store_true", help="批量重放存档 (配合 --db)")
+    parser.add_argument("--db", default="data/liar_tavern_replays.db")
+    parser.add_argument("--turn", type=int, help="快进到第 N 回合后打印局面")
+    parser.add_argument("--step", action="store_true", help="交互式逐回合查看")
+    parser.add_argument("--limit", type=int, default=100000, help="--bulk 时最多重放的局数")
+    args = parser.parse_args(argv)
+    logging.disable(logging.WARNING) # 引擎的 info 日志会淹没输出
+    if args.bulk: return bulk(args)
+    try: show(load_bytes(args), args)
+    except ReplayError as e: print(f"❌ {e}"); return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# liar_tavern/benchmarks/state_store_check.py
+
+# -*- coding: utf-8 -*-
+
+"""共享状态存储自检: 序列化往返、乐观并发、租约，以及两个插件节点交替处理同一批群的完整对局。
+
+默认使用进程内的 Redis 替身 (FakeRedis)；传入 --redis-url 时改用真实 Redis。
+    python benchmarks/state_store_check.py
+    python benchmarks/state_store_check.py --redis-url redis://localhost:6379/15
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import loadtest # noqa: E402 (同时安装框架替身并导入插件)
+from liar_tavern import state_store # noqa: E402
+from liar_tavern.state_store import RedisStateStore, encode_state, decode_state # noqa: E402
+from liar_tavern.exceptions import StateConflictError # noqa: E402
+from liar_tavern.game_logic import LiarDiceGame # noqa: E402
+from liar_tavern.models import make_table_key # noqa: E402
+from liar_tavern.main import LiarDicePlugin # noqa: E402
+
+class FakeRedis:
+    """只实现 RedisStateStore 用到的命令；Lua 脚本按脚本文本分派到等价的 Python 实现"""
+
+    def __init__(self):
+        self.hashes: Dict[str, Dict[str, bytes]] = {}
+        self.strings: Dict[str, Tuple[str, float]] = {}
+        self.round_trips = 0
+
+    async def _tick(self):
+        self.round_trips += 1; await asyncio.sleep(0) # 模拟一次网络往返的让出
+
+    def _get(self, key):
+        value = self.strings.get(key)
+        if value and value[1] <= time.monotonic(): del self.strings[key]; return None
+        return value[0] if value else None
+
+    async def hmget(self, key, *fields):
+        await self._tick(); h = self.hashes.get(key, {}); return [h.get(f) for f in fields]
+
+    async def eval(self, script, numkeys, *args):
+        await self._tick(); key, argv = args[0], args[1:]
+        if script == state_store._SAVE_SCRIPT:
+            cur = self.hashes.get(key, {}).get("v", b"0")
+            if cur.decode() != argv[0]: return -1
+            nv = int(cur) + 1; self.hashes[key] = {"v": str(nv).encode(), "d": argv[1]}; return nv
+        if script == state_store._DELETE_SCRIPT:
+            cur = self.hashes.get(key, {}).get("v", b"0")
+            if cur.decode() != argv[0]: return -1
+            self.hashes.pop(key, None); return 0
+        if script == state_store._LEASE_SCRIPT:
+            holder = self._get(key)
+            if holder is None or holder == argv[0]: self.strings[key] = (argv[0], time.monotonic() + int(argv[1]) / 1000.0); return 1
+            return 0
+        if script == state_store._RELEASE_SCRIPT:
+            if self._get(key) == argv[0]: del self.strings[key]; return 1
+            return 0
+        raise NotImplementedError("FakeRedis 不支持该脚本")
+
+def make_store(client) -> RedisStateStore:
+    return RedisStateStore(client, key_prefix=f"liar_tavern_check_{os.getpid()}")
+
+async def check_serialization():
+    random.seed(7); game = LiarDiceGame(creator_id="1")
+    for i in range(6): game.add_player(str(1000 + i), f"玩家{i}")
+    game.state.players["1005"].is_ai = True
+    game.start_game(); game.process_play_card(game.get_current_player_id(), [1, 2])
+    data = encode_state(game.state)
+    assert decode_state(data) == game.state, "序列化往返结果不一致"
+    print(f"[ok] 序列化往返 (6 人对局 {len(data)} 字节)")
+
+async def check_cas_and_leases(client):
+    store = make_store(client); gid = "424242"
+    state = LiarDiceGame(creator_id="1").state
+    v1 = await store.save(gid, state, 0); assert v1 == 1
+    try: await store.save(gid, state, 0); raise AssertionError("过期版本写入应失败")
+    except StateConflictError: pass
+    assert (await store.load(gid))[1] == 1
+    assert await store.acquire_lease(gid, "A", 0.2) and not await store.acquire_lease(gid, "B", 0.2)
+    assert await store.acquire_lease(gid, "A", 0.2), "持有者应能续约"
+    await store.release_lease(gid, "B"); assert not await store.acquire_lease(gid, "B", 0.2), "非持有者不能释放租约"
+    await asyncio.sleep(0.25); assert await store.acquire_lease(gid, "B", 0.2), "租约过期后应可被接管"
+    await store.release_lease(gid, "B"); await store.delete(gid, 1)
+    assert (await store.load(gid)) == (None, 0)
+    print("[ok] 乐观并发版本检查与租约")
+
+async def check_read_only_commands(client):
+    """只读命令不写回 (不递增版本)，动作命令写回一次"""
+    bot = loadtest.FakeBot(0, 0.0, random.Random(3)); gid = "434343"
+    config = loadtest.astrbot_stubs.AstrBotConfig(enable_trash_talk=False, enable_player_stats=False, opponent_model_path="", enable_replays=False, turn_timeout_seconds=0)
+    node = LiarDicePlugin(loadtest.astrbot_stubs.Context(provider=None), config); node.state_store = make_store(client)
+    driver = loadtest.GroupDriver(node, bot, gid, 2, 0, 0, 0.0, random.Random(3), {"human_turn_ms": []}); creator = driver.humans[0]
+    await loadtest._drain(node.create_game(driver._event(*creator, "骗子酒馆")))
+    for pid, pname in driver.humans: await loadtest._drain(node.join_game(driver._event(pid, pname, "加入")))
+    await loadtest._drain(node.start_game_cmd(driver._event(*creator, "开始")))
+    version = (await node.state_store.load(gid))[1]
+    for pid, pname in driver.humans: await loadtest._drain(node.game_status_cmd(driver._event(pid, pname, "状态"))); await loadtest._drain(node.show_my_hand_cmd(driver._event(pid, pname, "我的手牌")))
+    assert (await node.state_store.load(gid))[1] == version, "只读命令不应写回共享状态"
+    current = node.games[gid].get_current_player_id()
+    await loadtest._drain(node.play_cards_cmd(driver._event(current, dict(driver.humans)[current], "出牌 1")))
+    assert (await node.state_store.load(gid))[1] == version + 1, "出牌应写回一次"
+    await loadtest._drain(node.force_end_game_cmd(driver._event(*creator, "结束游戏"))); await node.terminate()
+    print("[ok] 只读命令不写回共享状态")
+
+async def check_multi_node(client, groups: int):
+    """两个节点共享存储，每条命令随机路由到其中一个节点"""
+    rng = random.Random(11); bot = loadtest.FakeBot(1, 0.0, rng)
+    config = loadtest.astrbot_stubs.AstrBotConfig(enable_trash_talk=False, enable_player_stats=False, opponent_model_path="", enable_replays=False)
+    nodes = []
+    for _ in range(2):
+        node = LiarDicePlugin(loadtest.astrbot_stubs.Context(provider=loadtest.FakeProvider(5, 0.0, 0.4, rng)), config)
+        node.state_store = make_store(client); nodes.append(node)
+    loadtest.plugin_main.asyncio = loadtest._scaled_asyncio(0.0)
+
+    class RoutedPlugin:
+        """把命令随机转发到某个节点，并以共享存储判断牌桌是否仍存在"""
+        def __init__(self, gid): self.gid = gid; self.games = {}
+        def __getattr__(self, name):
+            handler_name = name
+            def call(*a, **kw): return getattr(rng.choice(nodes), handler_name)(*a, **kw)
+            return call
+
+    async def run_group(index: int) -> bool:
+        gid = str(700000 + index); routed = RoutedPlugin(gid)
+        driver = loadtest.GroupDriver(routed, bot, gid, 2, 1, 1, 0.3, random.Random(index), {"human_turn_ms": []})
+        # 驱动器通过 plugin.games 查看局面；这里从存储读取最新状态
+        async def refresh():
+            state, _ = await nodes[0].state_store.load(gid)
+            routed.games = {gid: LiarDiceGame.from_state(state)} if state else {}
+        creator = driver.humans[0]
+        await loadtest._drain(routed.create_game(driver._event(*creator, "骗子酒馆")))
+        for pid, pname in driver.humans: await loadtest._drain(routed.join_game(driver._event(pid, pname, "加入")))
+        await loadtest._drain(routed.add_ai_player(driver._event(*creator, "添加AI"), 1))
+        await loadtest._drain(routed.start_game_cmd(driver._event(*creator, "开始")))
+        humans = dict(driver.humans); deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            await refresh()
+            if gid not in routed.games: return True
+            game = routed.games[gid]; current = game.get_current_player_id()
+            if current in humans: await driver._human_turn(current, humans[current], game)
+            else: await asyncio.sleep(0.005)
+        return False
+
+    results = await asyncio.gather(*(run_group(i) for i in range(groups)))
+    for node in nodes: await node.terminate()
+    assert all(results), f"{results.count(False)} 个群未能在两节点间完成对局"
+    print(f"[ok] 两节点交替处理 {groups} 个群完整对局 (存储往返 {getattr(client, 'round_trips', '?')} 次)")
+
+async def check_failover(client):
+    """驱动回合的节点失联 (AI 任务与计时器随之消失) 后，另一节点处理下一条命令时接管，直到对局结束"""
+    bot = loadtest.FakeBot(2, 0.0, random.Random(5)); loadtest.plugin_main.asyncio = loadtest._scaled_asyncio(0.0)
+    config = loadtest.astrbot_stubs.AstrBotConfig(enable_trash_talk=False, enable_player_stats=False, opponent_model_path="", enable_replays=False,
+                                                  turn_timeout_seconds=1, turn_reminder_seconds=0, ai_turn_deadline_seconds=1, state_lease_ttl=1)
+    for index, stall_on_ai in enumerate((False, True)):
+        node_a = LiarDicePlugin(loadtest.astrbot_stubs.Context(provider=loadtest.FakeProvider(400, 0.0, 0.4, random.Random(index))), config); node_a.state_store = make_store(client)
+        node_b = LiarDicePlugin(loadtest.astrbot_stubs.Context(provider=None), config); node_b.state_store = make_store(client)
+        gid = str(818100 + index); driver = loadtest.GroupDriver(node_a, bot, gid, 1, 0, 0, 0.0, random.Random(index), {"human_turn_ms": []}); creator = driver.humans[0]
+        await loadtest._drain(node_a.create_game(driver._event(*creator, "骗子酒馆")))
+        await loadtest._drain(node_a.join_game(driver._event(*creator, "加入"))); await loadtest._drain(node_a.add_ai_player(driver._event(*creator, "添加AI"), 2))
+        await loadtest._drain(node_a.start_game_cmd(driver._event(*creator, "开始")))
+        replies = [item async for item in node_b.create_game(driver._event(*creator, "骗子酒馆 二号桌"), "二号桌")]
+        assert replies and (await node_b.state_store.load(make_table_key(gid, "二号桌")))[0] is None, "共享后端下不应创建命名牌桌"
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline: # 等到 A 驱动的是指定类型的回合 (AI 回合时 LLM 调用正在进行)
+            state, _ = await node_a.state_store.load(gid)
+            assert state is not None, "对局在节点失联前就结束了"
+            if state.turn_owner == node_a.instance_id and state.players[state.turn_order[state.current_player_index]].is_ai == stall_on_ai: break
+            await asyncio.sleep(0.005)
+        for task in list(node_a.active_ai_tasks.values()) + list(node_a._timer_tasks): task.cancel()
+        node_a.turn_timers.close(); node_a.active_ai_tasks.clear() # 节点 A 失联
+        await loadtest._drain(node_b.game_status_cmd(driver._event(*creator, "状态"))) # 群里的下一条消息路由到 B
+        while time.monotonic() < deadline and (await node_b.state_store.load(gid))[0] is not None: await asyncio.sleep(0.02)
+        assert (await node_b.state_store.load(gid))[0] is None, f"节点失联 ({'AI' if stall_on_ai else '人类'}回合) 后对局没有被接管完成"
+        await node_a.terminate(); await node_b.terminate()
+    print("[ok] 驱动节点失联后由另一节点接管 AI 回合与超时回合；命名牌桌被拒绝")
+
+async def main_async(args):
+    if args.redis_url:
+        import redis.asyncio as redis_asyncio
+        client = redis_asyncio.from_url(args.redis_url, decode_responses=False)
+    else: client = FakeRedis()
+    await check_serialization()
+    await check_cas_and_leases(client)
+    await check_read_only_commands(client)
+    await check_multi_node(client, args.groups)
+    await check_failover(client)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="共享状态存储自检")
+    parser.add_argument("--redis-url", default="", help="使用真实 Redis (建议独立的 db)")
+    parser.add_argument("--groups", type=int, default=20)
+    args = parser.parse_args(argv)
+    import logging; logging.basicConfig(level=logging.WARNING); logging.getLogger("liar_tavern").setLevel(logging.CRITICAL)
+    asyncio.run(main_async(args)); return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# liar_tavern/chat_history.py
+
+# -*- coding: utf-8 -*-
+
+from typing import Iterator, List, Optional, Tuple
+
+# --- 单条记录长度上限 (防止超长消息撑大 Prompt 和内存) ---
+MAX_CHAT_SENDER_LEN = 24
+MAX_CHAT_TEXT_LEN = 160
+
+class ChatHistoryRing:
+    """预分配的定长环形缓冲区，保存最近的群聊记录 (sender, text)。"""
+
+    __slots__ = ("capacity", "_slots", "_head", "_count")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(0, int(capacity))
+        self._slots: List[Optional[Tuple[str, str]]] = [None] * self.capacity
+        self._head = 0 # 下一次写入的位置
+        self._count = 0
+
+    def append(self, sender: str, text: str) -> None:
+        """写入一条记录，超长部分截断；满时覆盖最旧记录。"""
+        if not self.capacity: return
+        if len(sender) > MAX_CHAT_SENDER_LEN: sender = sender[:MAX_CHAT_SENDER_LEN]
+        if len(text) > MAX_CHAT_TEXT_LEN: text = text[:MAX_CHAT_TEXT_LEN - 1] + "…"
+        self._slots[self._head] = (sender, text)
+        self._head = (self._head + 1) % self.capacity
+        if self._count < self.capacity: self._count += 1
+
+    def clear(self) -> None:
+        for i in range(self.capacity): self._slots[i] = None
+        self._head = 0; self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        """按时间顺序 (旧 -> 新) 遍历记录。"""
+        start = (self._head - self._count) % self.capacity if self.capacity else 0
+        for i in range(self._count):
+            yield self._slots[(start + i) % self.capacity]
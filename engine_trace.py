@@ -0,0 +1,77 @@
+# liar_tavern/engine_trace.py
+
+# -*- coding: utf-8 -*-
+
+"""每局一个的引擎事件追踪环形缓冲区。
+
+引擎的例行事件 (发牌、出牌、质疑、开枪、洗牌、轮转……) 不再逐条拼接日志字符串，而是以 (时间, 事件名, 参数元组)
+写入固定大小的环形缓冲区: 一次元组构造加一次列表赋值，参数保持原始对象，只在导出时才按 TEMPLATES 格式化。
+出错时由插件把最近的事件一并写入日志，管理员也可以用 /酒馆追踪 随时查看，事后排查时仍有完整的来龙去脉。
+启动时已开启 DEBUG 日志的实例会同时把每条事件写到 debug 日志 (即旧的详细日志)。
+"""
+
+import time
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_SIZE = 256
+
+# 事件名 -> 格式模板 (按位置填入参数)。参数直接保存原对象不做拷贝，只能是之后不会被原地修改的值:
+# 字符串、数字，以及引擎总是整体替换而不原地修改的列表/字典 (手牌、出牌、回合顺序、一次发牌的结果)
+TEMPLATES = {
+    "join": "加入: {1}({0})，共 {2} 人",
+    "start": "开局: 主牌 {0}，顺序 {1}",
+    "deck": "构建牌堆: {0} 人，基础牌各 {1} 张 + {2} 张 Joker，共 {3} 张",
+    "deal": "发牌: 保底 {0} 张 {1} + {2} 张 Joker，补牌后剩余 {3} 张，手牌 {4}",
+    "play": "出牌: {0} 编号 {1} 实为 {2}，剩 {3} 张",
+    "accept": "{0} 接受了 {1} 的牌 {2}",
+    "wait": "等待: {0} (手牌为空)",
+    "challenge": "质疑: {0} -> {1} 声称 {2} 张，实为 {3}",
+    "challenge_result": "质疑结果: {0}，输家 {1}",
+    "shot": "开枪: {0} 弹膛 {1:0{2}b} 位置 {3}，{4}",
+    "eliminated": "淘汰: {0}",
+    "turn": "轮到: {0}({1})",
+    "reshuffle": "洗牌: {0}，新主牌 {1}，{2} 名存活玩家",
+    "game_end": "对局结束: 胜者 {0}",
+}
+
+class GameTrace:
+    """固定容量的环形缓冲区；容量为 0 时 record 不做任何事"""
+    __slots__ = ("capacity", "recorded", "_events", "_mirror")
+
+    def __init__(self, capacity: int = DEFAULT_TRACE_SIZE):
+        self.capacity = max(0, capacity); self.recorded = 0 # 累计写入次数 (含已被覆盖的)
+        self._events: List[Optional[Tuple[float, str, Tuple[Any, ...]]]] = [None] * self.capacity
+        self._mirror = logger.isEnabledFor(logging.DEBUG)
+
+    def record(self, event: str, *args: Any) -> None:
+        if self.capacity: self._events[self.recorded % self.capacity] = (time.time(), event, args); self.recorded += 1
+        if self._mirror: logger.debug(format_event(event, args))
+
+    def __len__(self) -> int: return min(self.recorded, self.capacity)
+
+    def events(self) -> List[Tuple[float, str, Tuple[Any, ...]]]:
+        """按时间顺序返回缓冲区内的事件"""
+        if self.recorded <= self.capacity: return self._events[:self.recorded]
+        split = self.recorded % self.capacity; return self._events[split:] + self._events[:split]
+
+    def lines(self, limit: Optional[int] = None) -> List[str]:
+        """格式化最近 limit 条 (默认全部) 事件"""
+        events = self.events()
+        if limit is not None: events = events[-limit:] if limit > 0 else []
+        return [f"{time.strftime('%H:%M:%S', time.localtime(ts))}.{int(ts * 1000) % 1000:03d} {format_event(event, args)}" for ts, event, args in events]
+
+    def dump(self, log: logging.Logger, header: str, limit: Optional[int] = None) -> None:
+        """把最近的事件作为一条 WARNING 日志写出 (出错时调用)"""
+        lines = self.lines(limit)
+        if not lines: return
+        dropped = self.recorded - len(self)
+        log.warning(f"{header}最近 {len(lines)} 条引擎事件{f' (更早的 {dropped} 条已被覆盖)' if dropped else ''}:\n" + "\n".join(lines))
+
+def format_event(event: str, args: Tuple[Any, ...]) -> str:
+    template = TEMPLATES.get(event)
+    if template is None: return f"{event} {args}"
+    try: return template.format(*args)
+    except (IndexError, ValueError, KeyError) as e: return f"{event} {args} (格式化失败: {e})"
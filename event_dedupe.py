@@ -0,0 +1,47 @@
+# liar_tavern/event_dedupe.py
+
+# -*- coding: utf-8 -*-
+
+"""重复事件过滤: OneBot 适配器偶尔会重投或重复触发同一条消息事件。
+
+出牌/质疑/等待在进入游戏逻辑前先查这里: 有消息 ID 时按 (群, 消息 ID) 判重，否则按 (群, 发送者, 消息内容, 牌桌版本) 判重，
+同一玩家在不同回合发出的相同命令 (如连续两轮 /等待) 因版本不同不会被误判为重投。
+索引是按插入顺序排列的有界字典，条目在时间窗口后过期；所有条目的窗口相同，过期项总在最前面，
+每次检查只需从头部弹出过期项，判重与登记均摊 O(1)。
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 4096
+
+def event_key(group_id: Optional[str], sender_id: Optional[str], message_str: str, message_id: Any = None, version: Optional[int] = None) -> Hashable:
+    """消息 ID 可用时只用它 (同一条消息重投的 ID 不变)，否则退回 发送者 + 内容 + 发送者所在牌桌的版本 (GameState.action_count)"""
+    if message_id not in (None, ""): return (group_id, "id", str(message_id))
+    return (group_id, sender_id, message_str.strip(), version)
+
+class EventDeduper:
+    def __init__(self, window: float = 3.0, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.window = window; self.max_entries = max(1, max_entries)
+        self._expiry: "OrderedDict[Hashable, float]" = OrderedDict()
+        self.checked = 0; self.dropped = 0
+
+    def seen(self, key: Hashable, now: Optional[float] = None) -> bool:
+        """窗口内见过该键时返回 True (计一次丢弃)；否则登记并返回 False。重复事件不会延长窗口。"""
+        now = time.monotonic() if now is None else now; expiry = self._expiry; self.checked += 1
+        while expiry:
+            oldest, expires_at = next(iter(expiry.items()))
+            if expires_at > now and len(expiry) < self.max_entries: break
+            del expiry[oldest]
+        if key in expiry: self.dropped += 1; return True
+        expiry[key] = now + self.window; return False
+
+    def register(self, key: Hashable, now: Optional[float] = None) -> None:
+        """只登记不判重 (已登记的键保持原过期时间)"""
+        if key not in self._expiry: self._expiry[key] = (time.monotonic() if now is None else now) + self.window
+
+    def __len__(self) -> int: return len(self._expiry)
@@ -70,4 +70,25 @@ class AIParseError(AIDecisionError):
 
 class AIInvalidDecisionError(AIDecisionError):
     """AI (LLM) 的决策不符合游戏规则"""
+    pass
+
+class AIDeadlineError(AIDecisionError):
+    """AI 回合剩余时间不足，或 LLM 提供方熔断中，本回合不再调用 LLM"""
+    pass
+
+class StaleSnapshotError(AIDecisionError):
+    """AI 决策所依据的局面快照已过期 (期间有其他动作)，决策不再应用"""
+    pass
+
+# --- 共享状态存储相关异常 ---
+class StateConflictError(GameError):
+    """共享存储中的牌桌状态已被其他节点修改 (版本不匹配)"""
+    pass
+# --- 锦标赛相关异常 ---
+class TournamentError(GameError):
+    """锦标赛报名/赛程操作无效 (非报名阶段报名、人数不足开赛等)"""
+    pass
+# --- 回放相关异常 ---
+class ReplayError(GameError):
+    """回放数据损坏，或重放结果与录制内容不一致"""
     pass
\ No newline at end of file
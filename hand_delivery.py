@@ -0,0 +1,87 @@
+# liar_tavern/hand_delivery.py
+
+# -*- coding: utf-8 -*-
+
+"""手牌私信投递记录: 按 (牌桌, 玩家) 记下最近送达的手牌与版本号，减少私信条数 (平台配额最紧的资源)。
+
+每次手牌变化登记为一个新版本:
+    * 与最近送达内容相同的版本不再发送；
+    * 同一玩家上一条手牌私信还在发送中时，新版本只暂存为待发，发送结束后只补发最新的一个，中间版本合并掉；
+    * 出牌后只发简短的 “剩余: ...” (DELTA)，开局发牌/重新洗牌或主牌变化时发完整手牌 (FULL)；
+    * /我的手牌 在手牌未变且距上次送达不足最小间隔时不再私信。
+记录只保存在本节点内存中，对局结束时随牌桌一起释放。
+"""
+
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FULL = "full"; DELTA = "delta"
+Hand = Tuple[str, ...]
+
+@dataclass
+class HandDelivery:
+    """单个玩家在一张牌桌上的投递状态"""
+    version: int = 0 # 最近登记的版本
+    sent_version: int = 0 # 最近送达的版本
+    hand: Optional[Hand] = None # 最近送达的手牌；送达失败后清空，下一次必定重发
+    main_card: Optional[str] = None
+    sent_at: float = 0.0
+    sending: bool = False
+    pending: Optional[Tuple[int, Hand, Optional[str], str]] = None # (版本, 手牌, 主牌, 类型)，发送中到达的最新版本
+
+class HandDeliveryTracker:
+    def __init__(self, min_interval: float = 30.0):
+        self.min_interval = max(0.0, min_interval)
+        self._tables: Dict[str, Dict[str, HandDelivery]] = {}
+        self.sent_full = 0; self.sent_delta = 0; self.failed = 0
+        self.suppressed = 0; self.collapsed = 0; self.throttled = 0 # 省下的私信
+
+    def record(self, table_key: str, player_id: str) -> HandDelivery:
+        return self._tables.setdefault(table_key, {}).setdefault(player_id, HandDelivery())
+
+    def table_records(self, table_key: str) -> Optional[Dict[str, HandDelivery]]: return self._tables.get(table_key)
+
+    def forget_table(self, table_key: str) -> None:
+        self._tables.pop(table_key, None)
+
+    def offer(self, record: HandDelivery, hand: Hand, main_card: Optional[str], kind: str, force: bool = False) -> bool:
+        """登记新版本；返回 True 表示调用方应立即发送 (并在结束后调用 finish)，False 表示已丢弃或已暂存为待发"""
+        record.version += 1
+        if record.sending:
+            if record.pending is not None: self.collapsed += 1; kind = FULL if FULL in (kind, record.pending[3]) else DELTA
+            record.pending = (record.version, hand, main_card, kind); return False
+        if not force and hand == record.hand and main_card == record.main_card: self.suppressed += 1; return False
+        record.sending = True; return True
+
+    def kind_for(self, record: HandDelivery, main_card: Optional[str], kind: str) -> str:
+        """玩家手里没有可依据的完整手牌 (从未送达、上次失败或主牌已变) 时，DELTA 改发 FULL"""
+        if kind == DELTA and (record.hand is None or record.main_card != main_card): return FULL
+        return kind
+
+    def finish(self, record: HandDelivery, version: int, hand: Hand, main_card: Optional[str], kind: str, success: bool) -> Optional[Tuple[int, Hand, Optional[str], str]]:
+        """记下一次发送的结果，返回接下来要补发的最新待发版本 (与已送达内容相同则丢弃并返回 None)；无需再发时结束发送状态"""
+        if success:
+            record.sent_version = version; record.hand = hand; record.main_card = main_card; record.sent_at = time.monotonic()
+            if kind == FULL: self.sent_full += 1
+            else: self.sent_delta += 1
+        else: record.hand = None; self.failed += 1
+        pending, record.pending = record.pending, None
+        if pending is not None and pending[1] == record.hand and pending[2] == record.main_card: self.suppressed += 1; pending = None
+        if pending is None: record.sending = False
+        return pending
+
+    def throttle_remaining(self, table_key: str, player_id: str, hand: Hand, main_card: Optional[str]) -> float:
+        """手牌未变且距上次送达不足最小间隔时，返回还需等待的秒数 (并计一次节流)，否则返回 0"""
+        record = self._tables.get(table_key, {}).get(player_id)
+        if record is None or record.hand != hand or record.main_card != main_card: return 0.0
+        remaining = self.min_interval - (time.monotonic() - record.sent_at)
+        if remaining <= 0: return 0.0
+        self.throttled += 1; return remaining
+
+    def summary(self) -> str:
+        sent = self.sent_full + self.sent_delta; saved = self.suppressed + self.collapsed + self.throttled
+        return f"手牌私信: 完整 {self.sent_full} / 剩余 {self.sent_delta} 条 (失败 {self.failed})，省下 {saved} 条 (重复 {self.suppressed} / 合并 {self.collapsed} / 节流 {self.throttled})，节省率 {saved / (sent + saved) if sent + saved else 0.0:.0%}"
@@ -0,0 +1,183 @@
+# liar_tavern/hand_image.py
+
+# -*- coding: utf-8 -*-
+
+"""手牌图片: 把手牌与主牌渲染成 PNG，按内容寻址缓存 (内存 LRU + 磁盘)。
+
+缓存键只由 (手牌序列, 主牌, 主题, 渲染版本) 决定，同一手牌永远对应同一个文件。牌型只有 4 种、手牌最多 5 张，
+可能的组合很少，预热后绝大多数私信直接命中内存，不再渲染。渲染与磁盘读写都在线程中进行，不阻塞事件循环。
+需要 Pillow (AstrBot 自带)；缺失时 available 为 False，插件退回文字手牌。Pillow 在第一次检查 available 时才导入，文字手牌模式不加载它。
+"""
+
+import os
+import io
+import sys
+import base64
+import hashlib
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+Image = ImageDraw = ImageFont = None; _pil_checked = False # 可选依赖，见 _load_pil()
+
+from .models import CARD_TYPES_BASE, JOKER, HAND_SIZE
+
+logger = logging.getLogger(__name__)
+
+RENDER_VERSION = 1 # 修改绘制逻辑时递增，旧缓存文件自然不再命中
+PREWARM_TABLE_SIZES = (2, 3, 4, 5, 6, 8) # 预热时按这些人数的牌桌估计开局手牌分布，各占相同比重
+CARD_W, CARD_H, GAP, MARGIN, HEADER_H = 84, 120, 12, 16, 40
+THEMES: Dict[str, Dict[str, str]] = {
+    "light": {"background": "#f4efe6", "card": "#ffffff", "border": "#8a7f70", "text": "#2b2b2b", "accent": "#c0392b", "joker": "#6c3483"},
+    "dark": {"background": "#1e1f24", "card": "#2c2f38", "border": "#5d6270", "text": "#e8e8e8", "accent": "#f1c40f", "joker": "#bb8fce"},
+}
+_LABELS = {JOKER: "JOKER"}
+_fonts: Dict[int, object] = {}
+
+def _load_pil() -> bool:
+    global Image, ImageDraw, ImageFont, _pil_checked
+    if not _pil_checked:
+        _pil_checked = True
+        try: from PIL import Image, ImageDraw, ImageFont
+        except ImportError: Image = None
+    return Image is not None
+
+def _font(size: int):
+    font = _fonts.get(size)
+    if font is None:
+        try: font = ImageFont.truetype("DejaVuSans-Bold.ttf", size)
+        except OSError:
+            try: font = ImageFont.load_default(size=size) # Pillow >= 10.1
+            except TypeError: font = ImageFont.load_default()
+        _fonts[size] = font
+    return font
+
+def render_hand_png(hand: Sequence[str], main_card: Optional[str], theme: str = "light") -> bytes:
+    """绘制一手牌: 顶部标出主牌，每张牌左上角是出牌编号，主牌与 Joker 用强调色描边"""
+    if not _load_pil(): raise RuntimeError("渲染手牌图片需要 Pillow")
+    colors = THEMES.get(theme, THEMES["light"]); count = max(1, len(hand))
+    image = Image.new("RGB", (MARGIN * 2 + count * CARD_W + (count - 1) * GAP, MARGIN * 2 + HEADER_H + CARD_H), colors["background"])
+    draw = ImageDraw.Draw(image)
+    draw.text((MARGIN, MARGIN), f"MAIN  {main_card or '?'}", fill=colors["accent"], font=_font(26))
+    top = MARGIN + HEADER_H
+    if not hand: draw.text((MARGIN + 8, top + CARD_H // 2 - 12), "EMPTY", fill=colors["border"], font=_font(22))
+    for i, card in enumerate(hand):
+        left = MARGIN + i * (CARD_W + GAP); matches = card == main_card or card == JOKER
+        draw.rounded_rectangle((left, top, left + CARD_W, top + CARD_H), radius=10, fill=colors["card"], outline=colors["accent"] if matches else colors["border"], width=4 if matches else 2)
+        draw.text((left + 8, top + 6), str(i + 1), fill=colors["border"], font=_font(18))
+        label = _LABELS.get(card, card); size = 20 if len(label) > 1 else 48
+        draw.text((left + CARD_W // 2, top + CARD_H // 2 + 6), label, fill=colors["joker"] if card == JOKER else colors["text"], font=_font(size), anchor="mm")
+    buf = io.BytesIO(); image.save(buf, format="PNG"); return buf.getvalue()
+
+def common_hands(decks: Iterable[Tuple[Dict[str, int], int]], limit: int) -> List[Tuple[Tuple[str, ...], str]]:
+    """按近似出现概率从高到低列出开局手牌，其后是出牌后剩下的手牌，元素为 (手牌序列, 主牌)，只用于决定预热顺序。
+    decks 为若干 (牌堆构成, 人数)，各占相同比重。
+
+    近似发牌规则: 依次给每人 2 张保底牌 (先主牌，主牌发完改发 Joker)，其余 3 张按剩余牌堆的构成随机，最后打乱顺序。
+    某个序列的概率 ∝ Σ(保底牌组合的占比 × 序列中能充当这对保底牌的位置对数 × 其余位置的剩余牌堆占比之积)。
+    """
+    cards = list(CARD_TYPES_BASE) + [JOKER]; totals: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+    for deck_counts, players in decks:
+        table = _table_hand_weights(deck_counts, players, cards); norm = sum(table.values()) or 1.0
+        for key, weight in table.items(): totals[key] = totals.get(key, 0.0) + weight / norm
+    # 出牌后剩下的手牌是开局手牌的子序列，排在开局手牌之后，按能由多少开局手牌得到加权
+    partial: Dict[Tuple[str, Tuple[str, ...]], float] = {}
+    for (main_card, hand), weight in totals.items():
+        for size in range(1, HAND_SIZE):
+            for keep in itertools.combinations(range(HAND_SIZE), size):
+                key = (main_card, tuple(hand[i] for i in keep)); partial[key] = partial.get(key, 0.0) + weight
+    ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0])) + sorted(partial.items(), key=lambda item: (-item[1], item[0]))
+    return [(hand, main_card) for (main_card, hand), _ in ranked[:limit]]
+
+def _table_hand_weights(deck_counts: Dict[str, int], players: int, cards: List[str]) -> Dict[Tuple[str, Tuple[str, ...]], float]:
+    weights_by_hand = {}
+    for main_card in CARD_TYPES_BASE:
+        mains = min(2 * players, deck_counts.get(main_card, 0)); jokers = min(2 * players - mains, deck_counts.get(JOKER, 0))
+        pairs = {(main_card, main_card): mains // 2, (main_card, JOKER): mains % 2, (JOKER, JOKER): (jokers - mains % 2) // 2} # 每种保底组合的人数
+        pool = dict(deck_counts); pool[main_card] = pool.get(main_card, 0) - mains; pool[JOKER] = pool.get(JOKER, 0) - jokers
+        pool_total = sum(max(0, v) for v in pool.values()) or 1; weights = {card: max(0, pool.get(card, 0)) / pool_total for card in cards}
+        for hand in itertools.product(cards, repeat=HAND_SIZE):
+            weight = 0.0
+            for (first, second), holders in pairs.items():
+                if holders <= 0: continue
+                for a, b in itertools.combinations(range(HAND_SIZE), 2):
+                    if sorted((hand[a], hand[b])) != sorted((first, second)): continue
+                    rest = 1.0
+                    for k, card in enumerate(hand):
+                        if k != a and k != b: rest *= weights[card]
+                    weight += holders * rest
+            if weight > 0: weights_by_hand[(main_card, hand)] = weight
+    return weights_by_hand
+
+class HandImageCache:
+    """内容寻址的手牌图片缓存。lookup() 只查内存、不做任何 IO，可在事件循环中直接调用；
+    load_or_render() 会读磁盘或渲染，应通过 asyncio.to_thread 调用。值为 OneBot 图片段可用的 base64:// 字符串。
+    """
+
+    def __init__(self, cache_dir: str, theme: str = "light", memory_items: int = 512):
+        self.cache_dir = cache_dir; self.theme = theme if theme in THEMES else "light"; self.memory_items = max(1, memory_items)
+        self._memory: "OrderedDict[str, str]" = OrderedDict(); self._lock = threading.Lock()
+        self.memory_hits = 0; self.disk_hits = 0; self.renders = 0 # 按需请求的去向
+        self.prewarmed = 0; self.prewarm_renders = 0
+
+    @property
+    def available(self) -> bool: return _load_pil()
+
+    def key(self, hand: Sequence[str], main_card: Optional[str]) -> str:
+        return hashlib.sha1(f"{RENDER_VERSION}|{self.theme}|{main_card}|{','.join(hand)}".encode("utf-8")).hexdigest()[:20]
+
+    def lookup(self, hand: Sequence[str], main_card: Optional[str]) -> Optional[str]:
+        key = self.key(hand, main_card)
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None: self._memory.move_to_end(key); self.memory_hits += 1
+        return value
+
+    def _remember(self, key: str, value: str, only_if_room: bool = False) -> None:
+        with self._lock:
+            if only_if_room and len(self._memory) >= self.memory_items: return
+            self._memory[key] = value; self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items: self._memory.popitem(last=False)
+
+    def _load_or_render_key(self, key: str, hand: Sequence[str], main_card: Optional[str]) -> Tuple[str, bool]:
+        """返回 (base64 段, 是否新渲染)"""
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        try:
+            with open(path, "rb") as f: data = f.read()
+            rendered = False
+        except FileNotFoundError:
+            data = render_hand_png(hand, main_card, self.theme); rendered = True
+            os.makedirs(self.cache_dir, exist_ok=True); tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f: f.write(data)
+            os.replace(tmp, path) # 原子替换，并发渲染同一手牌也只会留下完整文件
+        return "base64://" + base64.b64encode(data).decode("ascii"), rendered
+
+    def load_or_render(self, hand: Sequence[str], main_card: Optional[str]) -> str:
+        key = self.key(hand, main_card); value, rendered = self._load_or_render_key(key, hand, main_card)
+        with self._lock:
+            if rendered: self.renders += 1
+            else: self.disk_hits += 1
+        self._remember(key, value); return value
+
+    def prewarm(self, hands: Iterable[Tuple[Sequence[str], str]], stop: threading.Event) -> int:
+        """后台线程中依次确保这些手牌已有磁盘缓存；内存只装到上限为止，不挤掉对局中真正用到的图片"""
+        count = rendered_count = 0
+        for hand, main_card in hands:
+            if stop.is_set(): break
+            key = self.key(hand, main_card)
+            try: value, rendered = self._load_or_render_key(key, hand, main_card)
+            except Exception as e: logger.warning(f"预渲染手牌图片失败: {e}"); break
+            self._remember(key, value, only_if_room=True); count += 1; rendered_count += rendered
+            with self._lock: self.prewarmed += 1; self.prewarm_renders += rendered
+        logger.info(f"手牌图片预热完成: {count} 张 (新渲染 {rendered_count})。"); return count
+
+    def memory_bytes(self) -> int:
+        """内存缓存的近似大小 (键与 base64 字符串)"""
+        with self._lock: return sys.getsizeof(self._memory) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self._memory.items())
+
+    def summary(self) -> str:
+        served = self.memory_hits + self.disk_hits + self.renders
+        hit_rate = self.memory_hits / served if served else 0.0
+        return f"手牌图片: 内存命中 {self.memory_hits} / 磁盘 {self.disk_hits} / 渲染 {self.renders} (命中率 {hit_rate:.0%}，预热 {self.prewarmed}，内存 {len(self._memory)}/{self.memory_items})"
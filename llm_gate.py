@@ -0,0 +1,58 @@
+# liar_tavern/llm_gate.py
+
+# -*- coding: utf-8 -*-
+
+"""LLM 并发闸门: 所有牌桌共用，同时在途的 LLM 调用不超过上限。
+
+满载时调用方按 (优先级, 到达顺序) 排队，数值小的先放行: 有人类玩家的牌桌为 HUMAN_TABLE，纯 AI 牌桌 (如锦标赛里的 AI 桌) 为 AI_TABLE。
+排队时间计入 AI 回合的截止时间，等不到名额的调用方直接改用备用决策，因此几十张 AI 桌同时开打时，人类所在牌桌的 AI 回合不会被挤在后面。
+"""
+
+import heapq
+import asyncio
+import itertools
+import contextlib
+from typing import List, Optional, Tuple
+
+HUMAN_TABLE, AI_TABLE = 0, 1
+
+class LlmGate:
+    def __init__(self, limit: int):
+        self.limit = max(1, limit); self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []; self._seq = itertools.count()
+        self.granted = 0; self.queued = 0; self.timeouts = 0; self.peak_waiting = 0
+        self.wait_seconds = [0.0, 0.0] # 按优先级累计的排队时间
+
+    @property
+    def waiting(self) -> int: return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = HUMAN_TABLE, timeout: Optional[float] = None) -> None:
+        """取得一个名额；timeout 秒内取不到时抛出 asyncio.TimeoutError (不占名额)"""
+        if self.active < self.limit and not self.waiting: self.active += 1; self.granted += 1; return
+        loop = asyncio.get_running_loop(); future = loop.create_future(); started = loop.time()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future)); self.queued += 1; self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try: await asyncio.wait_for(asyncio.shield(future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled(): self.release() # 名额在超时/取消的同时到达，转给下一位
+            else: future.cancel()
+            if isinstance(e, asyncio.TimeoutError): self.timeouts += 1
+            raise
+        finally: self.wait_seconds[min(priority, AI_TABLE)] += loop.time() - started
+        self.granted += 1
+
+    def release(self) -> None:
+        """归还名额；有人排队时直接转给优先级最高的等待者 (active 不变)"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done(): future.set_result(None); return
+        self.active -= 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: int = HUMAN_TABLE, timeout: Optional[float] = None):
+        await self.acquire(priority, timeout)
+        try: yield
+        finally: self.release()
+
+    def summary(self) -> str:
+        return (f"LLM 并发闸门: 在途 {self.active}/{self.limit}，排队 {self.waiting} (峰值 {self.peak_waiting})，放行 {self.granted} 次 / 排队 {self.queued} 次 / 超时 {self.timeouts} 次，"
+                f"累计排队 人类桌 {self.wait_seconds[HUMAN_TABLE]:.1f}s / AI 桌 {self.wait_seconds[AI_TABLE]:.1f}s")
@@ -0,0 +1,102 @@
+# liar_tavern/llm_json.py
+
+# -*- coding: utf-8 -*-
+
+"""LLM 回复解析: 单遍扫描找出最后一个括号配平的 JSON 对象。
+
+约定的回复是 <thinking>思路</thinking> 加一行 JSON，但模型经常:
+在思路或结尾说明里写花括号、用 ``` 代码块包住 JSON、先写草稿再写最终决策、
+写出尾逗号/单引号/全角标点/裸键名，或者输出被截断、少了结尾的括号。
+扫描只统计字符串之外的括号，记录每个顶层对象的位置，从最后一个开始尝试解码，失败时做轻量修复再试。
+"""
+
+import re
+import json
+import logging
+from typing import Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_THINK_OPEN = "<thinking>"; _THINK_CLOSE = "</thinking>"
+_SCAN = re.compile(r"[{}\[\]\"'\\]") # 扫描时只需停在这些字符上
+_CLOSER = {"{": "}", "[": "]"}
+# 修复规则只作用于单个候选对象，且只在严格解码失败后使用
+_FULLWIDTH = str.maketrans({"“": '"', "”": '"', "：": ":", "，": ","})
+_SINGLE_QUOTED = re.compile(r"'([^'\\\n]*)'")
+_BARE_KEY = re.compile(r"([{,]\s*)([A-Za-z_][A-Za-z0-9_]*)\s*:")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_PY_LITERAL = re.compile(r"\b(True|False|None)\b")
+_INDEX_SEP = re.compile(r"[\s,，、]+")
+
+def split_thinking(text: str) -> Tuple[Optional[str], str]:
+    """拆出 <thinking> 思路 (不区分大小写)，返回 (思路, 其后的正文)；没有闭合的思路标签时正文为全文"""
+    lowered = text.lower(); start = lowered.find(_THINK_OPEN)
+    if start < 0: return None, text
+    end = lowered.find(_THINK_CLOSE, start)
+    if end < 0: return None, text
+    return text[start + len(_THINK_OPEN):end].strip(), text[end + len(_THINK_CLOSE):]
+
+def top_level_objects(text: str) -> List[Tuple[int, int, str]]:
+    """一遍扫描，返回字符串之外每个顶层 {...} 的 (起点, 终点, 补全后缀)。
+
+    对象正常闭合时补全后缀为空；文本在对象中途结束 (输出被截断) 时，后缀是补齐未闭合字符串与括号所需的字符。
+    """
+    spans = []; stack: List[str] = []; start = -1; quote = ""; skip_until = -1
+    for match in _SCAN.finditer(text):
+        i = match.start()
+        if i < skip_until: continue # 被反斜杠转义的字符
+        ch = match.group()
+        if quote:
+            if ch == "\\": skip_until = i + 2
+            elif ch == quote: quote = ""
+            continue
+        if ch == "{" or (ch == "[" and stack):
+            if not stack: start = i
+            stack.append(ch)
+        elif ch == "}" or ch == "]":
+            if stack and _CLOSER[stack[-1]] == ch:
+                stack.pop()
+                if not stack: spans.append((start, i + 1, ""))
+        elif stack and ch in "\"'": quote = ch # 对象外的引号 (如中英文撇号) 不算字符串
+    if stack: spans.append((start, len(text), quote + "".join(_CLOSER[c] for c in reversed(stack))))
+    return spans
+
+def loads_lenient(candidate: str) -> Any:
+    """先严格解码；失败时修正全角标点、单引号、裸键名、尾逗号与 Python 字面量后再试，仍失败则抛出 json.JSONDecodeError"""
+    try: return json.loads(candidate)
+    except json.JSONDecodeError: pass
+    fixed = candidate.translate(_FULLWIDTH)
+    fixed = _SINGLE_QUOTED.sub(lambda m: json.dumps(m.group(1), ensure_ascii=False), fixed)
+    fixed = _BARE_KEY.sub(r'\1"\2":', fixed); fixed = _TRAILING_COMMA.sub(r"\1", fixed)
+    fixed = _PY_LITERAL.sub(lambda m: _PY_LITERALS[m.group(1)], fixed)
+    return json.loads(fixed)
+
+def extract_json(text: str) -> Tuple[Optional[str], Any, Optional[str]]:
+    """返回 (思路, 最后一个能解码为对象的 JSON, 错误)。只在思路之后的正文里找，思路里的草稿不算数。"""
+    reasoning, body = split_thinking(text)
+    stripped = body.strip()
+    if stripped[:1] == "{" and stripped[-1:] == "}": # 常见情况: 正文恰好是一个规整的对象，无需扫描
+        try:
+            data = json.loads(stripped)
+            if isinstance(data, dict): return reasoning, data, None
+        except json.JSONDecodeError: pass
+    spans = top_level_objects(body)
+    if not spans: return reasoning, None, "未找到JSON"
+    error = None
+    for start, end, suffix in reversed(spans):
+        if ":" not in body[start:end] and "：" not in body[start:end]: continue # 说明文字里的 {吹牛率} 之类，不可能是键值对象
+        try: data = loads_lenient(body[start:end] + suffix)
+        except json.JSONDecodeError as e: error = error or f"JSON解析失败:{e}"; continue
+        if isinstance(data, dict):
+            if suffix: logger.debug(f"LLM 回复被截断，已补全 '{suffix}' 后解析。")
+            return reasoning, data, None
+    return reasoning, None, error or "JSON格式错误"
+
+def normalize_indices(value: Any) -> Optional[List[Any]]:
+    """把 indices 统一为列表: 接受 [1,2]、"1,2"、"1 2"、"[1, 2]" 与单个数字；其他类型返回 None。元素的合法性由调用方检查。"""
+    if isinstance(value, list): return value
+    if isinstance(value, bool): return None
+    if isinstance(value, (int, float)): return [value]
+    if isinstance(value, str): return [part for part in _INDEX_SEP.split(value.strip().strip("[]")) if part]
+    return None
@@ -4,10 +4,16 @@
 
 import logging
 import re
-import json
 import asyncio
 import random
-import collections
+import uuid
+import functools
+import contextlib
+import inspect
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional, Any, Tuple
 
 # --- AstrBot API Imports ---
@@ -23,26 +29,62 @@ from aiocqhttp.exceptions import ActionFailed
 # --- Local Imports ---
 from .exceptions import (
     GameError, NotPlayersTurnError, InvalidActionError, InvalidCardIndexError,
-    NotEnoughPlayersError,
-    AIDecisionError, AIParseError, AIInvalidDecisionError
+    NotEnoughPlayersError, StateConflictError, StaleSnapshotError, AIDeadlineError,
+    AIDecisionError, AIParseError, AIInvalidDecisionError, TournamentError
 )
 from .game_logic import LiarDiceGame
+from .chat_history import ChatHistoryRing
+from .metrics import LatencyRecorder, LatencyHistogram, write_prometheus_file
+from .profiling import TableProfiler
+from .state_store import create_state_store, encode_state
+from .turn_timer import TurnTimerHeap
+from .opponent_model import OpponentModel
+from .provider_health import ProviderHealth, OPEN as PROVIDER_OPEN, PING_TIMEOUT, PING_PROMPT
+from .llm_json import extract_json as extract_llm_json, normalize_indices
+from .hand_image import HandImageCache, common_hands, PREWARM_TABLE_SIZES
+from .engine_trace import DEFAULT_TRACE_SIZE
+from .event_dedupe import EventDeduper, event_key
+from .hand_delivery import HandDeliveryTracker, FULL as HAND_FULL, DELTA as HAND_DELTA
+from .llm_gate import LlmGate, HUMAN_TABLE, AI_TABLE
+from .memory_report import MemoryAccountant, MemoryReport, TracemallocDiff, GLOBAL_GROUP, GAME as MEMORY_GAME, CHAT as MEMORY_CHAT, CACHE as MEMORY_CACHE, format_bytes
+from .tournament import Tournament, Entrant, Match, is_tournament_table_name, SIGNUP as TOURNAMENT_SIGNUP, RUNNING as TOURNAMENT_RUNNING, FINISHED as TOURNAMENT_FINISHED
+from .replay import ReplayRecorder, ReplayArchive, decode_replay, replay_to_code
+from .player_stats import PlayerStatsStore, GLOBAL_SCOPE, LEADERBOARD_METRICS, LEADERBOARD_ALIASES
 from .models import (
     GameStatus, MIN_PLAYERS, GameState, MAX_PLAY_CARDS, HAND_SIZE,
-    CARD_TYPES_BASE, JOKER, AI_MAX_RETRIES, PlayerData
+    CARD_TYPES_BASE, JOKER, AI_MAX_RETRIES, AI_MIN_LLM_BUDGET, PlayerData, GameSnapshot, PlayerView,
+    DEFAULT_MAX_PLAYERS, MAX_PLAYERS_LIMIT, LARGE_TABLE_THRESHOLD, PROMPT_NEIGHBOR_SEATS, PROMPT_OPPONENT_PROFILES,
+    MAX_TABLE_NAME_LEN, TABLE_KEY_SEP, make_table_key, split_table_key
 )
+from .messages import Plain, At
 from .message_utils import (
     format_hand, build_join_message, build_start_game_message,
     build_play_card_announcement, build_challenge_result_messages,
     build_wait_announcement, build_reshuffle_announcement,
     build_game_status_message, build_game_end_message,
-    build_error_message
+    build_player_stats_message, build_leaderboard_message, build_error_message
 )
 
 # --- Logger Setup ---
 logger = logging.getLogger(__name__)
 # logger.setLevel(logging.DEBUG)
 
+# --- 共享状态会话装饰器 (用于命令处理的异步生成器) ---
+def _with_game_session(handler=None, *, infer_table: bool = True):
+    """在处理命令前从共享存储加载目标牌桌、处理后写回；租约被其他节点占用时提示稍后重试。
+
+    目标牌桌由处理函数的 table 参数 (若有) 与发送者所在牌桌决定，见 _resolve_table_key。
+    """
+    if handler is None: return functools.partial(_with_game_session, infer_table=infer_table)
+    signature = inspect.signature(handler)
+    @functools.wraps(handler)
+    async def wrapper(self, event: AstrMessageEvent, *args, **kwargs):
+        table = signature.bind_partial(self, event, *args, **kwargs).arguments.get("table", "")
+        async with self._game_session(self._resolve_table_key(event, table, infer=infer_table), event) as ready:
+            if not ready: yield event.plain_result("⏳牌桌正在其他节点处理中，请稍后重试。"); event.stop_event(); return
+            async for item in handler(self, event, *args, **kwargs): yield item
+    return wrapper
+
 # --- Plugin Registration ---
 @register(
     "骗子酒馆", "YourName_AI", "一个结合了吹牛和左轮扑克的多人卡牌游戏 (含AI玩家和聊天互动)。",
@@ -54,32 +96,275 @@ class LiarDicePlugin(Star):
         super().__init__(context)
         self.context = context
         self.config = config
-        self.games: Dict[str, LiarDiceGame] = {}
+        self.games: Dict[str, LiarDiceGame] = {} # 键为牌桌键 (默认桌为群号，命名桌为 群号#桌名)
+        self._group_tables: Dict[str, set] = {} # 群号 -> 本地已知的牌桌键
         self.active_ai_tasks: Dict[str, asyncio.Task] = {}
-        self.group_chat_history: Dict[str, collections.deque] = {}
+        self.group_chat_history: Dict[str, ChatHistoryRing] = {}
+        self._chat_record_groups: Dict[str, set] = {} # 需要记录聊天的群 -> 其中 PLAYING、含 AI 且启用聊天上下文的牌桌键
+        self.chat_record_stats: Dict[str, int] = {"fast_path": 0, "recorded": 0}
+        self._provider_health: Dict[str, ProviderHealth] = {} # LLM 提供方 -> 健康分/熔断器
+        self._provider_pings: Dict[str, asyncio.Task] = {} # 提供方 -> 进行中的预热/保活请求
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._llm_cold_tables: set = set() # 开局后还没成功调用过 LLM 的牌桌，用于区分首回合与稳态延迟
+        self.ai_llm_latency: Dict[str, LatencyHistogram] = {"first": LatencyHistogram(), "steady": LatencyHistogram()}
+        self.ai_plan_stats: Dict[str, int] = {"plans": 0, "moves_applied": 0, "moves_discarded": 0} # 连续 AI 座位的批量决策
+        llm_limit = int(self.config.get("llm_max_concurrent_calls", 8))
+        self.llm_gate: Optional[LlmGate] = LlmGate(llm_limit) if llm_limit > 0 else None # 所有牌桌共用的 LLM 并发上限，人类所在牌桌优先
+        self.tournaments: Dict[str, Tournament] = {} # 群号 -> 报名中/进行中的锦标赛 (每群最多一个，结束即移除)
+        self._tournament_tables: Dict[str, Match] = {} # 进行中的锦标赛牌桌键 -> 对应场次
+        self._tournament_events: Dict[str, AstrMessageEvent] = {} # 群号 -> 锦标赛广播使用的最近事件
+        self._tournament_tasks: set = set(); self._tournament_pumping: set = set()
+        self.metrics = LatencyRecorder(enabled=bool(self.config.get("enable_latency_metrics", False)))
+        self._metrics_export_task: Optional[asyncio.Task] = None
+        self._memory_report: Optional[MemoryReport] = None; self._memory_scan: Optional[asyncio.Task] = None # 最近一次内存估算 / 进行中的测量
+        self.tracemalloc_diff = TracemallocDiff()
+        self._profiler: Optional[TableProfiler] = None # 同一时刻最多一个群在分析
+        self.state_store = create_state_store(self.config)
+        self.instance_id = uuid.uuid4().hex[:12] # 租约持有者标识
+        self._game_versions: Dict[str, int] = {} # 本地缓存的牌桌对应的存储版本
+        dedupe_window = float(self.config.get("event_dedupe_window_seconds", 3))
+        self.event_deduper: Optional[EventDeduper] = EventDeduper(dedupe_window) if dedupe_window > 0 else None # 出牌/质疑/等待的重复事件过滤
+        self._trace_size = max(0, int(self.config.get("engine_trace_size", DEFAULT_TRACE_SIZE))) # 每局引擎事件追踪缓冲区的容量
+        self._group_locks: Dict[str, asyncio.Lock] = {}
+        self.turn_timers = TurnTimerHeap(self._on_turn_timer) # 所有牌桌共用的回合超时计时器
+        self._turn_events: Dict[str, AstrMessageEvent] = {} # 超时动作广播时使用的最近事件
+        self._timer_tasks: set = set()
+        self.player_stats: Optional[PlayerStatsStore] = None # 关闭战绩统计时为 None
+        if self.config.get("enable_player_stats", True):
+            self.player_stats = PlayerStatsStore(self.config.get("player_stats_db_path", "data/liar_tavern_stats.db"), flush_interval=max(1.0, float(self.config.get("player_stats_flush_interval", 5))))
+        self.replay_archive: Optional[ReplayArchive] = None # 关闭回放或使用共享状态后端时为 None (其他节点处理的回合无法录制)
+        if self.config.get("enable_replays", True) and not self.state_store.shared: self.replay_archive = ReplayArchive(self.config.get("replay_db_path", "data/liar_tavern_replays.db"))
+        self._replay_recorders: Dict[str, ReplayRecorder] = {} # 牌桌键 -> 进行中的录制
+        self._replay_tasks: set = set()
+        self.hand_images: Optional[HandImageCache] = None # 文字手牌模式或缺少 Pillow 时为 None
+        self._hand_image_stop = threading.Event(); self._hand_image_thread: Optional[threading.Thread] = None
+        if self.config.get("hand_display_mode", "text") == "image":
+            cache = HandImageCache(self.config.get("hand_image_cache_dir", "data/liar_tavern_hand_images"), self.config.get("hand_image_theme", "light"), int(self.config.get("hand_image_memory_items", 1024)))
+            if cache.available: self.hand_images = cache; self._start_hand_image_prewarm()
+            else: logger.warning("hand_display_mode=image 需要 Pillow，继续使用文字手牌。")
+        self.hand_delivery: Optional[HandDeliveryTracker] = None # 关闭去重时每次变化都发完整手牌
+        if self.config.get("hand_dm_dedup", True): self.hand_delivery = HandDeliveryTracker(float(self.config.get("hand_dm_min_interval_seconds", 30)))
+        self.opponent_model = OpponentModel(max_players=max(1000, int(self.config.get("opponent_model_max_players", 200000)))) # 跨局、跨群的对手画像
+        self._opponent_model_path = self.config.get("opponent_model_path", "data/liar_tavern_opponents.json")
+        if self._opponent_model_path:
+            try: logger.info(f"已加载 {self.opponent_model.load(self._opponent_model_path)} 名玩家的对手画像")
+            except Exception as e: logger.warning(f"加载对手画像失败，将从头统计: {e}")
+        self._opponent_model_dirty = False; self._opponent_model_task: Optional[asyncio.Task] = None
+        self._opponent_model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="liar_opponents") # 单线程保证先后两次保存按顺序落盘
+        self._ensure_metrics_exporter()
         logger.info("骗子酒馆插件 (含AI) v1.3.6 已加载并初始化")
         logger.debug(f"加载的插件配置: {self.config}")
 
     # --- 监听群聊消息以记录历史 ---
     @filter.event_message_type(EventMessageType.GROUP_MESSAGE, priority=10)
     async def _record_group_chat(self, event: AstrMessageEvent):
+        group_id = event.get_group_id()
+        group_id = str(group_id) if group_id else None
+        # 快速路径: 没有需要记录的牌桌时只做一次字典查找
+        tables = self._chat_record_groups.get(group_id)
+        if not tables: self.chat_record_stats["fast_path"] += 1; return
+        if not any(key in self.games and self.games[key].state.status == GameStatus.PLAYING for key in tables):
+            self._chat_record_groups.pop(group_id, None); self.chat_record_stats["fast_path"] += 1; return
+        history = self.group_chat_history.get(group_id)
+        message_text = event.message_str
+        if history is None or not message_text: self.chat_record_stats["fast_path"] += 1; return
+        message_text = message_text.strip()
+        if not message_text: self.chat_record_stats["fast_path"] += 1; return
+
+        user_id = self._get_user_id(event)
+        if not user_id: self.chat_record_stats["fast_path"] += 1; return
+        user_name = event.get_sender_name() or f"用户{user_id[:4]}"
+        history.append(user_name, message_text)
+        self.chat_record_stats["recorded"] += 1
+
+    def _chat_context_enabled(self) -> bool:
+        """聊天记录是否会被任何 Prompt 使用"""
+        if self.config.get("recent_chat_history_length", 10) <= 0: return False
+        return bool(self.config.get("enable_trash_talk", True) or self.config.get("include_chat_in_action_prompt", True))
+    def _update_chat_recording(self, group_id: str, game_instance: LiarDiceGame) -> None:
+        """游戏开始时决定是否为该牌桌所在的群记录聊天，并按当前配置预分配环形缓冲区 (同群多桌共用)。"""
+        has_ai = any(p.is_ai for p in game_instance.state.players.values())
+        if not has_ai or not self._chat_context_enabled(): self._stop_chat_recording(group_id); return
+        chat_group = split_table_key(group_id)[0]; history_len = self.config.get("recent_chat_history_length", 10)
+        history = self.group_chat_history.get(chat_group)
+        if history is None or history.capacity != history_len: self.group_chat_history[chat_group] = ChatHistoryRing(history_len)
+        self._chat_record_groups.setdefault(chat_group, set()).add(group_id)
+    def _stop_chat_recording(self, table_key: str) -> None:
+        chat_group = split_table_key(table_key)[0]; tables = self._chat_record_groups.get(chat_group)
+        if tables: tables.discard(table_key)
+        if not tables: self._chat_record_groups.pop(chat_group, None); self.group_chat_history.pop(chat_group, None)
+
+    def _record_game_stats(self, table_key: str, state: GameState, winner_id: Optional[str]) -> None:
+        """对局正常结束时记入战绩 (强制结束不计)；只在内存中累积，由 PlayerStatsStore 后台批量落盘"""
+        if self.player_stats: self.player_stats.record_game(split_table_key(table_key)[0], state, winner_id)
+        self._opponent_model_changed()
+    def _opponent_model_changed(self) -> None:
+        """对局结束时标记对手画像待保存；后台任务每 opponent_model_save_interval 秒最多写一次，没有新对局结束时退出"""
+        if not self._opponent_model_path: return
+        self._opponent_model_dirty = True
+        if self._opponent_model_task is None or self._opponent_model_task.done():
+            try: self._opponent_model_task = asyncio.get_running_loop().create_task(self._opponent_model_save_loop())
+            except RuntimeError: pass # 无事件循环，留给 terminate 保存
+    async def _opponent_model_save_loop(self):
+        interval = max(5.0, float(self.config.get("opponent_model_save_interval", 300)))
+        while self._opponent_model_dirty:
+            await asyncio.sleep(interval); self._opponent_model_dirty = False
+            await self._save_opponent_model()
+    async def _save_opponent_model(self) -> None:
+        """快照在事件循环上生成，写文件交给专用线程"""
+        try: count = await asyncio.get_running_loop().run_in_executor(self._opponent_model_executor, OpponentModel.write_snapshot, self._opponent_model_path, self.opponent_model.snapshot()); logger.debug(f"已保存 {count} 名玩家的对手画像")
+        except Exception as e: logger.warning(f"保存对手画像失败: {e}")
+    def _finish_replay(self, table_key: str, state: GameState, winner_id: Optional[str]) -> None:
+        """编码回放并在后台写入存档 (不等待磁盘)"""
+        recorder = self._replay_recorders.pop(table_key, None)
+        if not recorder or not self.replay_archive: return
+        try: data = recorder.finish(winner_id)
+        except Exception as e: logger.error(f"[群{table_key}] 回放编码失败: {e}", exc_info=True); return
+        group, table_name = split_table_key(table_key); winner = state.players[winner_id].name if winner_id in state.players else ""
+        task = asyncio.create_task(self.replay_archive.save(group, table_name, len(state.players), winner, data))
+        self._replay_tasks.add(task); task.add_done_callback(self._replay_saved)
+    def _replay_saved(self, task: asyncio.Task) -> None:
+        self._replay_tasks.discard(task)
+        if task.cancelled(): return
+        if task.exception(): logger.error(f"保存回放失败: {task.exception()}")
+        else: logger.debug(f"回放已保存: #{task.result()}")
+    def _release_group_resources(self, group_id: str) -> None:
+        """游戏结束/强制结束后释放该牌桌的附属资源"""
+        self._stop_chat_recording(group_id)
+        self.turn_timers.cancel(group_id); self._turn_events.pop(group_id, None); self._unindex_table(group_id)
+        self._replay_recorders.pop(group_id, None) # 强制结束的对局不保存回放
+        self._llm_cold_tables.discard(group_id); self.metrics.drop_group(group_id)
+        if self.hand_delivery: self.hand_delivery.forget_table(group_id)
+
+    def _dump_trace(self, group_id: Optional[str], reason: str) -> None:
+        """出错时把该牌桌最近的引擎事件写入日志，便于事后排查"""
+        game_instance = self.games.get(group_id) if group_id else None
+        if game_instance: game_instance.trace.dump(logger, f"[群{group_id}] {reason}，")
+
+    # --- 多牌桌 ---
+    def _index_table(self, table_key: str) -> None:
+        self._group_tables.setdefault(split_table_key(table_key)[0], set()).add(table_key)
+    def _unindex_table(self, table_key: str) -> None:
+        group_id = split_table_key(table_key)[0]; tables = self._group_tables.get(group_id)
+        if tables is None: return
+        tables.discard(table_key)
+        if not tables: del self._group_tables[group_id]
+    def _resolve_table_key(self, event: AstrMessageEvent, table: str = "", infer: bool = True) -> Optional[str]:
+        """命令作用的牌桌键: 显式桌名 > 发送者所在的牌桌 > 默认桌 (或本群唯一的牌桌)"""
         group_id = self._get_group_id(event)
+        if not group_id: return None
+        table = (table or "").strip()
+        if table or not infer: return make_table_key(group_id, table)
+        tables = self._group_tables.get(group_id)
+        if not tables: return group_id
         user_id = self._get_user_id(event)
-        if not group_id or not user_id:
-            return
+        for key in tables:
+            game_instance = self.games.get(key)
+            if game_instance and user_id in game_instance.state.players: return key
+        return group_id if group_id in tables or len(tables) > 1 else next(iter(tables))
+    def _max_table_players(self) -> int:
+        return max(MIN_PLAYERS, min(int(self.config.get("max_table_players", DEFAULT_MAX_PLAYERS)), MAX_PLAYERS_LIMIT))
+    def _table_names(self, group_id: str) -> List[str]:
+        return sorted(split_table_key(key)[1] or "默认" for key in self._group_tables.get(group_id, ()))
+    def _table_label(self, table_key: str) -> str:
+        group_id, table_name = split_table_key(table_key); return f"{group_id} 牌桌「{table_name}」" if table_name else group_id
+    def _tag_components(self, table_key: Optional[str], components: List[Any]) -> List[Any]:
+        """转为框架组件，命名牌桌的消息再加上 [桌名] 前缀，便于区分同群的多张牌桌"""
+        table_name = split_table_key(table_key)[1] if table_key else ""; components = self._to_framework(components)
+        return [Comp.Plain(f"[{table_name}] ")] + components if table_name else components
+    @staticmethod
+    def _to_framework(components: List[Any]) -> List[Any]:
+        """message_utils 产出的中立消息段 (messages.Plain / At) 转为 AstrBot 组件，已是框架组件的原样保留"""
+        return [Comp.Plain(c.text) if isinstance(c, Plain) else Comp.At(qq=c.qq) if isinstance(c, At) else c for c in components]
+    def _no_game_text(self, table_key: Optional[str], text: str = "ℹ️无游戏") -> str:
+        names = self._table_names(split_table_key(table_key)[0]) if table_key else []
+        return text + (f"\n本群牌桌: {'、'.join(names)} (在命令后加桌名，如 /加入 桌名)" if names else "")
 
-        user_name = event.get_sender_name() or f"用户{user_id[:4]}"
-        message_text = event.message_str.strip()
+    # --- 延迟指标导出 ---
+    def _ensure_metrics_exporter(self) -> None:
+        """配置了 Prometheus 文件路径时启动定时导出任务 (需在事件循环内调用)"""
+        if not (self.metrics.enabled or self.config.get("memory_metrics_export", False)) or not self.config.get("metrics_prometheus_file", ""): return
+        if self._metrics_export_task and not self._metrics_export_task.done(): return
+        try: self._metrics_export_task = asyncio.get_running_loop().create_task(self._metrics_export_loop())
+        except RuntimeError: logger.debug("事件循环未运行，延迟指标导出任务稍后启动。")
+    async def _metrics_export_loop(self):
+        path = self.config.get("metrics_prometheus_file", ""); interval = max(5, int(self.config.get("metrics_export_interval", 60)))
+        logger.info(f"延迟指标将每 {interval}s 写入 {path}")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                extra = (await self._measure_memory()).render_prometheus(int(self.config.get("memory_report_top_groups", 10))) if self.config.get("memory_metrics_export", False) else ""
+                text = (self.metrics.render_prometheus(True) if self.metrics.enabled else "") + extra # 在事件循环中渲染，直方图字典只在这里被遍历，线程里只写文件；未开延迟统计时只写内存指标
+                await asyncio.to_thread(write_prometheus_file, path, text)
+            except Exception as e: logger.error(f"写入延迟指标文件失败: {e}")
 
-        game_instance = self.games.get(group_id) # 先获取实例
-        if game_instance and game_instance.state.status == GameStatus.PLAYING and message_text:
-            history_len = self.config.get("recent_chat_history_length", 10)
-            if group_id not in self.group_chat_history or self.group_chat_history[group_id].maxlen != history_len:
-                 old_history = list(self.group_chat_history.get(group_id, []))
-                 self.group_chat_history[group_id] = collections.deque(old_history, maxlen=history_len)
+    # --- 内存账目 ---
+    async def _measure_memory(self) -> MemoryReport:
+        """分片估算各群的对局、聊天缓冲、AI 任务与缓存占用的内存；同一时刻只测一轮，并发调用共用结果"""
+        if self._memory_scan is None or self._memory_scan.done():
+            accountant = MemoryAccountant(max(1, int(self.config.get("memory_report_slice_ms", 5))) / 1000.0)
+            for table_key, game_instance in list(self.games.items()):
+                group_id = split_table_key(table_key)[0]; accountant.add_game(group_id, game_instance)
+                recorder = self._replay_recorders.get(table_key); records = self.hand_delivery.table_records(table_key) if self.hand_delivery else None
+                if recorder: accountant.add(group_id, MEMORY_GAME, recorder)
+                if records: accountant.add(group_id, MEMORY_CACHE, records)
+            for group_id, history in list(self.group_chat_history.items()): accountant.add(group_id, MEMORY_CHAT, history, count=True)
+            for table_key, task in list(self.active_ai_tasks.items()): accountant.add_task(split_table_key(table_key)[0], task)
+            for group_id, tournament in list(self.tournaments.items()): accountant.add(group_id, MEMORY_GAME, tournament)
+            if self.hand_images: accountant.add_measure(GLOBAL_GROUP, MEMORY_CACHE, self.hand_images.memory_bytes)
+            self._memory_scan = asyncio.get_running_loop().create_task(accountant.run())
+        self._memory_report = await asyncio.shield(self._memory_scan); return self._memory_report
 
-            self.group_chat_history[group_id].append({"sender": user_name, "text": message_text})
-            logger.debug(f"记录群聊 {group_id} 消息: {user_name}: {message_text}")
+    # --- 共享状态存储 ---
+    @contextlib.asynccontextmanager
+    async def _game_session(self, group_id: Optional[str], event: Optional[AstrMessageEvent] = None):
+        """共享后端: 本地串行 + 群租约 + 加载/乐观写回，加载后检查回合驱动节点是否失联 (见 _watch_turn_driver)。内存后端直接放行。"""
+        if not group_id or not self.state_store.shared: yield True; return
+        lock = self._group_locks.setdefault(group_id, asyncio.Lock())
+        async with lock:
+            ttl = float(self.config.get("state_lease_ttl", 120))
+            if not await self.state_store.acquire_lease(group_id, self.instance_id, ttl): logger.info(f"[群{group_id}] 租约被其他节点持有。"); yield False; return
+            try:
+                await self._load_game_from_store(group_id); loaded = self._encoded_game(group_id)
+                try: await self._watch_turn_driver(group_id, event or self._turn_events.get(group_id)); yield True
+                finally: # 只在状态确实变化时写回 (只读命令不递增版本，不让其他节点的缓存失效)；引擎动作在 await 之间是原子的，异常退出时本地状态也一致
+                    if self._encoded_game(group_id) != loaded: await self._save_game_to_store(group_id)
+            finally:
+                try: await self.state_store.release_lease(group_id, self.instance_id)
+                except Exception as e: logger.warning(f"[群{group_id}] 释放租约失败: {e}")
+    async def _load_game_from_store(self, group_id: str) -> None:
+        state, version = await self.state_store.load(group_id)
+        if state is None: self.games.pop(group_id, None); self._game_versions.pop(group_id, None); self._unindex_table(group_id); self.turn_timers.cancel(group_id); self._turn_events.pop(group_id, None); return
+        if group_id in self.games and self._game_versions.get(group_id) == version: return # 本地缓存仍是最新
+        self.games[group_id] = LiarDiceGame.from_state(state, self._trace_size); self._game_versions[group_id] = version; self._index_table(group_id)
+    async def _watch_turn_driver(self, group_id: str, event: Optional[AstrMessageEvent]) -> None:
+        """AI 任务与回合计时器只存在于触发回合的节点，该节点失联时回合会停住。
+        其他节点加载到这类局面时，在接管期限到达前设观察计时器；期限已过仍未推进则由本节点重新触发当前回合。
+        两个节点同时推进时，后应用的一方会因快照版本不符被拒绝 (见 apply_decision)。"""
+        game_instance = self.games.get(group_id); state = game_instance.state if game_instance else None
+        if event is None or not state or state.status != GameStatus.PLAYING or state.turn_owner in (None, self.instance_id): return
+        remaining = state.turn_deadline - time.time()
+        if remaining > 0: self._turn_events[group_id] = event; self.turn_timers.schedule(group_id, remaining, ("watch", state.turn_owner, state.action_count)); return
+        player_id = game_instance.get_current_player_id(); player_data = state.players.get(player_id)
+        if not player_data: return
+        logger.warning(f"[群{group_id}] 节点 {state.turn_owner} 未在期限内推进 {player_data.name} 的回合，由本节点接管。")
+        await self._trigger_next_turn(event, group_id, player_id, player_data.name)
+    def _claim_turn(self, game_instance: LiarDiceGame, seconds: Optional[float]) -> None:
+        """共享后端: 记录由本节点驱动当前回合，seconds (再加一个租约期) 后仍未推进则允许其他节点接管；None 表示回合只等玩家命令，无需驱动"""
+        if not self.state_store.shared: return
+        state = game_instance.state
+        if seconds is None: state.turn_owner = None; state.turn_deadline = 0.0
+        else: state.turn_owner = self.instance_id; state.turn_deadline = time.time() + seconds + float(self.config.get("state_lease_ttl", 120))
+    def _encoded_game(self, group_id: str) -> Optional[bytes]:
+        game_instance = self.games.get(group_id)
+        return encode_state(game_instance.state) if game_instance else None
+    async def _save_game_to_store(self, group_id: str) -> None:
+        expected = self._game_versions.get(group_id, 0); game_instance = self.games.get(group_id)
+        try:
+            if game_instance: self._game_versions[group_id] = await self.state_store.save(group_id, game_instance.state, expected)
+            elif expected: await self.state_store.delete(group_id, expected); self._game_versions.pop(group_id, None)
+        except StateConflictError as e: # 本地副本已知过期，丢弃，下次会话重新加载
+            logger.error(f"[群{group_id}] 写回共享状态失败，丢弃本地副本: {e}"); self.games.pop(group_id, None); self._game_versions.pop(group_id, None); self._unindex_table(group_id)
 
     # --- AstrBot Interaction Helpers ---
     def _get_group_id(self, event: AstrMessageEvent) -> Optional[str]:
@@ -88,18 +373,30 @@ class LiarDicePlugin(Star):
     def _get_user_id(self, event: AstrMessageEvent) -> Optional[str]:
         sender_id = event.get_sender_id()
         return str(sender_id) if sender_id else None
+    def _is_duplicate_event(self, event: AstrMessageEvent) -> bool:
+        """适配器重投或重复触发的同一条消息返回 True，调用方直接静默丢弃"""
+        if self.event_deduper is None: return False
+        message_id = getattr(getattr(event, "message_obj", None), "message_id", None); group_id = self._get_group_id(event); user_id = self._get_user_id(event); content = event.message_str or ""
+        game_instance = self.games.get(self._resolve_table_key(event) or "") if message_id in (None, "") else None; version = game_instance.state.action_count if game_instance else None
+        if not self.event_deduper.seen(event_key(group_id, user_id, content, message_id, version)):
+            # 没有消息 ID 时按牌桌版本区分回合。轮到发送者时这条命令会把版本推进 1，处理完才到的重投按新版本也要认出来；不轮到他时命令被拒绝，版本不变
+            if game_instance and game_instance.get_current_player_id() == user_id: self.event_deduper.register(event_key(group_id, user_id, content, None, version + 1))
+            return False
+        logger.debug(f"丢弃重复事件: 群{self._get_group_id(event)} {self._get_user_id(event)} '{event.message_str}' (消息ID {message_id})"); return True
     async def _get_bot_instance(self, event: AstrMessageEvent) -> Optional[Any]:
         if hasattr(event, 'bot') and hasattr(event.bot, 'send_group_msg'):
              return event.bot
         logger.warning("无法从事件中可靠地获取 bot 实例。")
         return None
-    async def _send_private_message_text(self, event: AstrMessageEvent, user_id: str, text: str) -> bool:
+    async def _send_private_message_text(self, event: AstrMessageEvent, user_id: str, text: str, image: Optional[str] = None) -> bool:
+        """image 为 OneBot 图片段的 file 值 (如 base64://...)，给出时与文字一起发送"""
         bot = await self._get_bot_instance(event)
         if not bot or not hasattr(bot, 'send_private_msg'):
              logger.error(f"无法发送私信给 {user_id}: 无效 bot 实例。")
              return False
         try:
-             await bot.send_private_msg(user_id=int(user_id), message=text)
+             with self.metrics.span("send_private_msg"):
+                  await bot.send_private_msg(user_id=int(user_id), message=[{"type": "text", "data": {"text": text}}, {"type": "image", "data": {"file": image}}] if image else text)
              return True
         except ValueError:
              logger.error(f"无效用户 ID '{user_id}' 用于私信。")
@@ -110,7 +407,9 @@ class LiarDicePlugin(Star):
         except Exception as e:
              logger.error(f"发送私信给 {user_id} 失败: {type(e).__name__}", exc_info=False)
              return False
-    async def _send_hand_update(self, event: AstrMessageEvent, group_id: str, player_id: str, hand: List[str], main_card: Optional[str]) -> bool:
+    async def _send_hand_update(self, event: AstrMessageEvent, group_id: str, player_id: str, hand: List[str], main_card: Optional[str], kind: str = HAND_FULL, force: bool = False) -> bool:
+        """kind 为 HAND_DELTA 时只发 “剩余: ...”；与已送达内容相同的更新被丢弃，发送中到达的更新合并为最新一条 (见 HandDeliveryTracker)。
+        force 表示玩家主动查看，即使内容未变也重发。"""
         game_instance = self.games.get(group_id)
         if not game_instance:
              return False
@@ -120,17 +419,52 @@ class LiarDicePlugin(Star):
              return False
         if player_data.is_eliminated or player_data.is_ai:
              return True
-        main_card_display = main_card or "未定"
+        tracker = self.hand_delivery
+        if tracker is None: return await self._deliver_hand(event, group_id, player_data, hand, main_card, HAND_FULL)
+        record = tracker.record(group_id, player_id); hand_key = tuple(hand)
+        if not tracker.offer(record, hand_key, main_card, kind, force): return True # 重复或已交给正在进行的发送
+        payload = (record.version, hand_key, main_card, kind); success = False
+        try:
+            while payload is not None:
+                version, hand_key, main_card, kind = payload; kind = tracker.kind_for(record, main_card, kind)
+                success = await self._deliver_hand(event, group_id, player_data, list(hand_key), main_card, kind)
+                payload = tracker.finish(record, version, hand_key, main_card, kind, success)
+                if payload is not None: logger.debug(f"[群{group_id}] {player_data.name} 的手牌 v{version} 发送期间又有变化，补发 v{payload[0]}")
+        finally: record.sending = False
+        return success
+    async def _deliver_hand(self, event: AstrMessageEvent, group_id: str, player_data: PlayerData, hand: List[str], main_card: Optional[str], kind: str) -> bool:
+        player_id = player_data.id; main_card_display = main_card or "未定"
+        if kind == HAND_DELTA:
+             success = await self._send_private_message_text(event, player_id, f"🃏 [{self._table_label(group_id)}] 剩余: {format_hand(hand) if hand else '无 (只能 /质疑 或 /等待)'}")
+             if not success: logger.warning(f"向玩家 {player_data.name}({player_id}) 发送剩余手牌私信失败")
+             return success
+        image = await self._hand_image(hand, main_card) if self.hand_images and hand else None
         hand_display = format_hand(hand)
-        if not hand:
-             pm_text = f"游戏: 骗子酒馆 (群: {group_id})\n✋ 手牌: 无\n👑 主牌: 【{main_card_display}】\n👉 无手牌时只能 /质疑 或 /等待"
+        if image:
+             pm_text = f"游戏: 骗子酒馆 (群: {self._table_label(group_id)})\n👑 主牌: 【{main_card_display}】\n👉 出牌请用牌左上角的编号"
+        elif not hand:
+             pm_text = f"游戏: 骗子酒馆 (群: {self._table_label(group_id)})\n✋ 手牌: 无\n👑 主牌: 【{main_card_display}】\n👉 无手牌时只能 /质疑 或 /等待"
         else:
-             pm_text = f"游戏: 骗子酒馆 (群: {group_id})\n✋ 手牌: {hand_display}\n👑 主牌: 【{main_card_display}】\n👉 (出牌请用括号内编号)"
-        success = await self._send_private_message_text(event, player_id, pm_text)
+             pm_text = f"游戏: 骗子酒馆 (群: {self._table_label(group_id)})\n✋ 手牌: {hand_display}\n👑 主牌: 【{main_card_display}】\n👉 (出牌请用括号内编号)"
+        success = await self._send_private_message_text(event, player_id, pm_text, image=image)
         if not success:
              logger.warning(f"向玩家 {player_data.name}({player_id}) 发送手牌私信失败")
         return success
 
+    async def _hand_image(self, hand: List[str], main_card: Optional[str]) -> Optional[str]:
+        """内存命中时直接返回；否则在线程中读磁盘缓存或渲染。失败返回 None，由调用方改发文字。"""
+        image = self.hand_images.lookup(hand, main_card)
+        if image is not None: return image
+        try: return await asyncio.to_thread(self.hand_images.load_or_render, hand, main_card)
+        except Exception as e: logger.warning(f"手牌图片生成失败，改发文字: {e}"); return None
+    def _start_hand_image_prewarm(self) -> None:
+        """后台线程按出现概率预渲染常见开局手牌，事件循环不参与任何图片工作"""
+        limit = int(self.config.get("hand_image_prewarm", 4096))
+        if limit <= 0: return
+        cache = self.hand_images; decks = [(Counter(LiarDiceGame()._build_deck(players)), players) for players in PREWARM_TABLE_SIZES]
+        self._hand_image_thread = threading.Thread(target=lambda: cache.prewarm(common_hands(decks, limit), self._hand_image_stop), name="liar-tavern-hand-images", daemon=True)
+        self._hand_image_thread.start()
+
     # --- 消息转换与发送 (使用直接 API) ---
     def _components_to_onebot(self, components: List[Any], group_id: Optional[str]=None) -> List[Dict]:
         onebot_segments = []
@@ -163,7 +497,7 @@ class LiarDicePlugin(Star):
             if segment:
                  onebot_segments.append(segment)
         return onebot_segments
-    async def _broadcast_message(self, event: AstrMessageEvent, message_components: List[Any]):
+    async def _broadcast_message(self, event: AstrMessageEvent, message_components: List[Any], table_key: Optional[str] = None):
         if not isinstance(event, AstrMessageEvent):
              logger.error(f"_broadcast_message 需要 AstrMessageEvent 对象")
              return
@@ -179,8 +513,10 @@ class LiarDicePlugin(Star):
         except ValueError:
              logger.error(f"无法将群 ID '{group_id}' 转为整数。")
              return
+        lookup_key = table_key or group_id; message_components = self._tag_components(table_key, message_components)
         try:
-             onebot_message = self._components_to_onebot(message_components, group_id=group_id)
+             with self.metrics.span("components_to_onebot", lookup_key):
+                  onebot_message = self._components_to_onebot(message_components, group_id=lookup_key)
         except Exception as e:
              logger.error(f"组件转 OneBot 格式出错: {e}", exc_info=True)
              return
@@ -188,7 +524,8 @@ class LiarDicePlugin(Star):
              logger.warning("转换后 OneBot 消息为空")
              return
         try:
-             await bot.send_group_msg(group_id=group_id_int, message=onebot_message)
+             with self.metrics.span("send_group_msg", lookup_key):
+                  await bot.send_group_msg(group_id=group_id_int, message=onebot_message)
              logger.debug("直接发送 GroupMsg 成功。")
         except ActionFailed as e:
              logger.error(f"直接发送群消息失败 (ActionFailed): group_id={group_id_int}, retcode={e.retcode}, msg='{e.message}', wording='{e.wording}'")
@@ -197,38 +534,26 @@ class LiarDicePlugin(Star):
 
     # --- AI Task Done Callback ---
     def _ai_task_done_callback(self, task: asyncio.Task, group_id: str):
-        self.active_ai_tasks.pop(group_id, None)
+        if self.active_ai_tasks.get(group_id) is task: self.active_ai_tasks.pop(group_id) # 已被新回合的任务替换时不能把新任务摘掉
         try:
             task.result() # 检查异常
         except asyncio.CancelledError:
             logger.debug(f"AI task for group {group_id} was cancelled.")
         except Exception as e:
-            logger.error(f"AI task for group {group_id} finished with error: {e}", exc_info=True)
+            logger.error(f"AI task for group {group_id} finished with error: {e}", exc_info=True); self._dump_trace(group_id, "AI 任务异常")
 
     # --- AI Turn Logic ---
     def _format_chat_history(self, group_id: str) -> str:
-        history_deque = self.group_chat_history.get(group_id)
-        if not history_deque:
+        history = self.group_chat_history.get(group_id)
+        if not history:
             return "（暂无相关聊天记录）"
-        return "\n".join([f"{item['sender']}: {item['text']}" for item in history_deque])
-    def _build_llm_prompt(self, game_state: GameState, ai_player_id: str, include_chat: bool, task_type: str = "action") -> str:
-        ai_player=game_state.players[ai_player_id]; ai_hand=ai_player.hand; main_card=game_state.main_card or "未定"; turn_order=game_state.turn_order; last_play=game_state.last_play
-        prompt = f"你是卡牌游戏“骗子酒馆” AI {ai_player.name}。\n目标：赢。\n\n规则:\n- 主牌【{main_card}】({JOKER}万能)。\n- 打1-{MAX_PLAY_CARDS}张牌，声称主牌/鬼牌。\n- 可【质疑】上家(假则他开枪，真则你开枪)。\n- 可【出牌】跟进。\n- 手牌空只能【质疑】或【等待】。\n- 中弹淘汰。\n\n状态:\n- 主牌:【{main_card}】\n- 你手牌:{format_hand(ai_hand)}\n- 玩家状态:\n"
-        player_statuses=[f"  - {p.name}{'[AI]' if p.is_ai else ''}{' (淘汰)' if p.is_eliminated else ''}:{len(p.hand) if not p.is_eliminated else 0}张" for pid,p in game_state.players.items() if pid in turn_order]; prompt+="\n".join(player_statuses)+"\n"
+        return "\n".join([f"{sender}: {text}" for sender, text in history])
+    def _build_llm_prompt(self, snapshot: GameSnapshot, ai_player_id: str, include_chat: bool, task_type: str = "action") -> str:
+        ai_player=snapshot.players[ai_player_id]; ai_hand=ai_player.hand; main_card=snapshot.main_card or "未定"; turn_order=snapshot.turn_order
+        prompt = f"你是卡牌游戏“骗子酒馆” AI {ai_player.name}。\n目标：赢。\n\n{self._prompt_rules(main_card)}\n状态:\n- 主牌:【{main_card}】\n- 你手牌:{format_hand(ai_hand)}\n- 玩家状态:\n"
+        prompt+="\n".join(self._prompt_player_lines(snapshot, ai_player_id))+"\n"
         prompt+=f"- 当前轮到你。\n";
-        if last_play: last_pdata=game_state.players.get(last_play.player_id); last_tag="[AI] " if last_pdata and last_pdata.is_ai else ""; prompt+=f"- 上家:{last_tag}{last_play.player_name} 声称打出 {last_play.claimed_quantity} 张主牌。\n"
-        else: prompt+="- 上家: 无。\n"
-        group_id = None;
-        # !! 更健壮地获取 group_id !!
-        for pid, pdata in game_state.players.items():
-             # 假设群ID嵌入在AI ID中或所有玩家都在一个群
-             # 这是一个临时的获取方式，需要根据实际情况调整
-             if pid.startswith("ai_"): parts = pid.split('_'); group_id = parts[1] if len(parts) >= 2 and parts[1].isdigit() else None; break
-             # 如果能从 game_state 或 context 获取 group_id 会更好
-
-        if group_id and include_chat:
-             chat_history_str=self._format_chat_history(group_id)
-             prompt+=f"\n最近聊天:\n---\n{chat_history_str}\n---\n"
+        prompt+=self._prompt_context(snapshot, ai_player_id, include_chat)
         if task_type == "trash_talk":
              style_prompt=self.config.get("trash_talk_style_prompt","简短、幽默、挑衅。")
              prompt+=f"\n任务:\n说句垃圾话。风格:'{style_prompt}'。\n结合游戏和聊天。**只输出一句垃圾话文本。**"
@@ -237,23 +562,97 @@ class LiarDicePlugin(Star):
         else:
              prompt+="\n任务:未知。"
         return prompt
-    def _parse_llm_response(self, response_text: str, game_state: GameState, ai_player_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]:
-        reasoning_text=None; decision_dict=None; error_message=None; logger.debug(f"解析 LLM: ```{response_text}```")
-        think_match=re.search(r"<thinking>(.*?)</thinking>", response_text, re.DOTALL|re.IGNORECASE); response_after_think=response_text[think_match.end():].strip() if think_match else response_text.strip();
-        if think_match: reasoning_text=think_match.group(1).strip();
-        json_str=None; json_match=re.search(r'(\{.*\})', response_after_think, re.DOTALL); json_str=json_match.group(1) if json_match else response_after_think;
-        if json_str:
-            try: decision_dict=json.loads(json_str)
-            except json.JSONDecodeError as e: error_message=f"JSON解析失败:{e}"; return reasoning_text, None, error_message
-        else: error_message="未找到JSON"; return reasoning_text, None, error_message
+    def _prompt_rules(self, main_card: str) -> str:
+        return f"规则:\n- 主牌【{main_card}】({JOKER}万能)。\n- 打1-{MAX_PLAY_CARDS}张牌，声称主牌/鬼牌。\n- 可【质疑】上家(假则他开枪，真则你开枪)。\n- 可【出牌】跟进。\n- 手牌空只能【质疑】或【等待】。\n- 中弹淘汰。\n"
+    def _prompt_context(self, snapshot: GameSnapshot, ai_player_id: str, include_chat: bool) -> str:
+        """上家、对手画像与 (可选的) 最近聊天"""
+        prompt=""; last_play=snapshot.last_play
+        if last_play: last_pdata=snapshot.players.get(last_play.player_id); last_tag="[AI] " if last_pdata and last_pdata.is_ai else ""; prompt+=f"- 上家:{last_tag}{last_play.player_name} 声称打出 {last_play.claimed_quantity} 张主牌。\n"
+        else: prompt+="- 上家: 无。\n"
+        risk=snapshot.shot_risk
+        if ai_player_id in risk:
+             prompt+=f"- 下一枪中弹概率: 你 {risk[ai_player_id]:.0%}"
+             if last_play and last_play.player_id != ai_player_id and last_play.player_id in risk: prompt+=f"，上家 {risk[last_play.player_id]:.0%}"
+             prompt+="\n"
+        profile_lines = self._prompt_opponent_lines(snapshot, ai_player_id)
+        if profile_lines: prompt+="- 对手画像(历次对局统计):\n"+"\n".join(profile_lines)+"\n"
+        if include_chat: # 快照自带牌桌键，直接取所在群的聊天记录
+             chat_history_str=self._format_chat_history(snapshot.group_id)
+             prompt+=f"\n最近聊天:\n---\n{chat_history_str}\n---\n"
+        return prompt
+    def _build_llm_plan_prompt(self, snapshot: GameSnapshot, seats: List[str], include_chat: bool) -> str:
+        """连续就座的几名 AI 共用一次请求: 按座次各给出一个动作"""
+        players=snapshot.players; names="、".join(players[pid].name for pid in seats); main_card=snapshot.main_card or "未定"
+        prompt = f"你同时操控卡牌游戏“骗子酒馆”中连续就座的 {len(seats)} 名 AI: {names}，按此顺序依次行动。\n目标：让其中一名 AI 赢。\n\n{self._prompt_rules(main_card)}\n状态:\n- 主牌:【{main_card}】\n- 各 AI 手牌:\n"
+        prompt+="\n".join(f"  - {players[pid].name}:{format_hand(players[pid].hand)}" for pid in seats)+"\n- 玩家状态:\n"
+        prompt+="\n".join(self._prompt_player_lines(snapshot, seats[0]))+"\n"
+        prompt+=f"- 当前轮到 {players[seats[0]].name}。\n"+self._prompt_context(snapshot, seats[0], include_chat)
+        prompt+=f"\n任务:\n按顺序为每名 AI 各选一个动作(play,challenge,wait)。前一名 AI 出牌后，它就是下一名 AI 的上家。\n格式:\n1.<thinking>思考</thinking>\n2.下一行**仅**输出JSON计划:\n   {{\"moves\":[{{\"action\":\"play\",\"indices\":[编号]}},{{\"action\":\"challenge\"}},...]}}\n共 {len(seats)} 项，顺序同上；编号对应该 AI 自己的手牌。"
+        return prompt
+    def _prompt_player_lines(self, snapshot: GameSnapshot, ai_player_id: str) -> List[str]:
+        """按回合顺序列出玩家手牌数；大桌只列出自己前后各几名存活玩家，其余汇总为一行"""
+        ordered = snapshot.seats
+        def line(p: PlayerView) -> str: return f"  - {p.name}{'[AI]' if p.is_ai else ''}{' (淘汰)' if p.is_eliminated else ''}:{len(p.hand) if not p.is_eliminated else 0}张"
+        if len(ordered) <= LARGE_TABLE_THRESHOLD: return [line(p) for p in ordered]
+        active = [p for p in ordered if not p.is_eliminated]; me = next((i for i, p in enumerate(active) if p.id == ai_player_id), 0)
+        seats = dict.fromkeys((me + d) % len(active) for d in range(-PROMPT_NEIGHBOR_SEATS, PROMPT_NEIGHBOR_SEATS + 1)) # 上家在前、下家在后
+        lines = [line(active[i]) for i in seats]
+        rest = [p for i, p in enumerate(active) if i not in seats]
+        if rest: lines.append(f"  - 其余 {len(rest)} 名存活玩家共 {sum(len(p.hand) for p in rest)} 张")
+        if len(ordered) > len(active): lines.append(f"  - 已淘汰 {len(ordered) - len(active)} 人")
+        return lines
+    def _next_active_opponent(self, snapshot: GameSnapshot, player_id: str) -> Optional[str]:
+        turn_order = snapshot.turn_order; players = snapshot.players
+        try: start = turn_order.index(player_id)
+        except ValueError: return None
+        for step in range(1, len(turn_order)):
+            pid = turn_order[(start + step) % len(turn_order)]
+            if pid in players and not players[pid].is_eliminated: return pid
+        return None
+    def _prompt_opponent_lines(self, snapshot: GameSnapshot, ai_player_id: str) -> List[str]:
+        """上家、下家优先，再按回合顺序取有足够样本的存活对手，最多 PROMPT_OPPONENT_PROFILES 行"""
+        players = snapshot.players; candidates = []
+        if snapshot.last_play: candidates.append(snapshot.last_play.player_id)
+        candidates.append(self._next_active_opponent(snapshot, ai_player_id)); candidates.extend(snapshot.turn_order)
+        lines = []; seen = {ai_player_id, None}
+        for pid in candidates:
+            if pid in seen: continue
+            seen.add(pid); pdata = players.get(pid)
+            if not pdata or pdata.is_eliminated or pid not in self.opponent_model: continue
+            line = self.opponent_model.summary_line(pid, pdata.name)
+            if not line.endswith("样本少"): lines.append(f"  - {line}")
+            if len(lines) >= PROMPT_OPPONENT_PROFILES: break
+        return lines
+    def _extract_llm_json(self, response_text: str) -> Tuple[Optional[str], Any, Optional[str]]:
+        """拆出 <thinking> 思路与其后最后一个完整的 JSON 对象，返回 (思路, JSON 对象, 错误)；见 llm_json.py"""
+        logger.debug(f"解析 LLM: ```{response_text}```")
+        return extract_llm_json(response_text)
+    def _parse_llm_plan(self, response_text: str, seat_count: int) -> Tuple[Optional[str], Optional[List[Dict[str, Any]]], Optional[str]]:
+        """解析批量计划 {"moves":[...]}；只检查结构，每一步是否合法要到应用时按当时的局面判断"""
+        reasoning_text, data, error_message = self._extract_llm_json(response_text)
+        if error_message: return reasoning_text, None, error_message
+        moves = data.get("moves") if isinstance(data, dict) else None
+        if not isinstance(moves, list) or not moves: return reasoning_text, None, "缺moves列表"
+        moves = moves[:seat_count]
+        if not all(isinstance(move, dict) and "action" in move for move in moves): return reasoning_text, None, "moves格式错误"
+        return reasoning_text, moves, None
+    def _parse_llm_response(self, response_text: str, snapshot: GameSnapshot, ai_player_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]], Optional[str]]:
+        reasoning_text, decision_dict, error_message = self._extract_llm_json(response_text)
+        if error_message: return reasoning_text, None, error_message
         if not isinstance(decision_dict,dict) or "action" not in decision_dict: error_message="JSON格式错误"; return reasoning_text, None, error_message
-        action=decision_dict.get("action"); ai_player=game_state.players[ai_player_id]; hand_size=len(ai_player.hand); last_play_exists=game_state.last_play is not None
+        error_message=self._validate_decision(decision_dict, snapshot, ai_player_id)
+        return (reasoning_text, None, error_message) if error_message else (reasoning_text, decision_dict, None)
+    def _validate_decision(self, decision_dict: Dict[str, Any], snapshot: GameSnapshot, ai_player_id: str) -> Optional[str]:
+        """按快照检查决策是否合法；合法时把 indices 规范为 int 并返回 None，否则返回错误说明"""
+        error_message=None
+        action=decision_dict.get("action"); ai_player=snapshot.players[ai_player_id]; hand_size=len(ai_player.hand); last_play_exists=snapshot.last_play is not None
         if action=="play":
-            if not ai_player.hand: error_message="手牌空不能play"; return reasoning_text,None,error_message
-            if "indices" not in decision_dict or not isinstance(decision_dict["indices"],list): error_message="'play'缺indices"; return reasoning_text,None,error_message
-            indices=decision_dict["indices"]; count=len(indices)
-            if not(1<=count<=MAX_PLAY_CARDS): error_message=f"play数量({count})无效"; return reasoning_text,None,error_message
-            if count>hand_size: error_message="打超手牌数"; return reasoning_text,None,error_message
+            if not ai_player.hand: error_message="手牌空不能play"; return error_message
+            indices=normalize_indices(decision_dict.get("indices")) # 也接受 "1,2" 这类字符串
+            if indices is None: error_message="'play'缺indices"; return error_message
+            count=len(indices)
+            if not(1<=count<=MAX_PLAY_CARDS): error_message=f"play数量({count})无效"; return error_message
+            if count>hand_size: error_message="打超手牌数"; return error_message
             invalid=[]; valid_0=set(); all_valid=True
             for idx in indices:
                 try: i=int(idx)
@@ -262,57 +661,74 @@ class LiarDicePlugin(Star):
                 else: i0=i-1;
                 if i0 in valid_0: error_message=f"编号{i}重复";all_valid=False;break;
                 valid_0.add(i0)
-            if not all_valid and not error_message: error_message=f"含无效编号{invalid}"; return reasoning_text,None,error_message
-            if error_message: return reasoning_text,None,error_message
+            if not all_valid and not error_message: error_message=f"含无效编号{invalid}"; return error_message
+            if error_message: return error_message
             decision_dict['indices']=[int(i) for i in indices]
         elif action=="challenge":
-            if not last_play_exists: error_message="无法challenge"; return reasoning_text,None,error_message
+            if not last_play_exists: error_message="无法challenge"; return error_message
         elif action=="wait":
-            if ai_player.hand: error_message="手牌非空不能wait"; return reasoning_text,None,error_message
-        else: error_message=f"未知action:{action}"; return reasoning_text,None,error_message
-        return reasoning_text, decision_dict, None
-    async def _get_ai_fallback_decision(self, game_state: GameState, ai_player_id: str) -> Dict[str, Any]:
-        logger.warning(f"AI ({ai_player_id}) 启用备用逻辑。"); ai_player = game_state.players[ai_player_id]; hand_size = len(ai_player.hand); last_play_exists = game_state.last_play is not None
-        if not ai_player.hand: return {"action": "wait"} if not last_play_exists else ({"action": "challenge"} if random.random() < 0.5 else {"action": "wait"})
-        else:
-            if last_play_exists: return {"action": "challenge"} if random.random() < 0.4 else {"action": "play", "indices": [random.randint(1, hand_size)]}
-            else: return {"action": "play", "indices": [random.randint(1, hand_size)]}
+            if ai_player.hand: error_message="手牌非空不能wait"; return error_message
+        else: error_message=f"未知action:{action}"; return error_message
+        return None
+    async def _get_ai_fallback_decision(self, snapshot: GameSnapshot, ai_player_id: str) -> Dict[str, Any]:
+        logger.warning(f"AI ({ai_player_id}) 启用备用逻辑。"); ai_player = snapshot.players[ai_player_id]; hand_size = len(ai_player.hand); last_play = snapshot.last_play
+        # 质疑概率随上家的吹牛率变化 (无样本时先验为 1/2，对应原先的 0.5 / 0.4)
+        bluff = self.opponent_model.bluff_rate(last_play.player_id) if last_play else 0.0
+        # 再按双方下一枪的中弹概率调整: 上家枪里越危险越值得质疑，自己越危险越谨慎 (双方相同时不变)
+        edge = 1.0 + snapshot.shot_risk.get(last_play.player_id, 0.0) - snapshot.shot_risk.get(ai_player_id, 0.0) if last_play else 1.0
+        if not ai_player.hand: return {"action": "wait"} if not last_play else ({"action": "challenge"} if random.random() < (0.2 + 0.6 * bluff) * edge else {"action": "wait"})
+        if last_play and random.random() < (0.1 + 0.6 * bluff) * edge: return {"action": "challenge"}
+        # 下家爱质疑时优先打真牌
+        next_pid = self._next_active_opponent(snapshot, ai_player_id)
+        honest = [i for i, card in enumerate(ai_player.hand, 1) if card == snapshot.main_card or card == JOKER]
+        if honest and next_pid and self.opponent_model.challenge_rate(next_pid) > 0.4: return {"action": "play", "indices": [random.choice(honest)]}
+        return {"action": "play", "indices": [random.randint(1, hand_size)]}
     async def _handle_ai_turn(self, original_event: AstrMessageEvent, group_id: str, ai_player_id: str):
         logger.info(f"AI Task Started for player {ai_player_id} in group {group_id}")
-        game_instance = self.games.get(group_id);
-        if not game_instance: logger.warning(f"AI 回合: 游戏 {group_id} 不存在。Task exiting."); return
-        ai_player_data = game_instance.state.players.get(ai_player_id)
-        if not ai_player_data or ai_player_data.is_eliminated: logger.warning(f"AI 回合: 玩家 {ai_player_id} 无效或淘汰。Task exiting."); await self._trigger_next_turn_safe(original_event, group_id); return
-        current_player_check = game_instance.get_current_player_id();
-        if current_player_check != ai_player_id: logger.warning(f"AI 回合: 非 {ai_player_id} 回合 ({current_player_check})。Task exiting."); return
+        # 会话 (本地锁 + 共享后端租约) 只覆盖读取快照与应用决策两段；垃圾话、LLM 调用和节奏停顿都在会话外，应用时按快照版本重新校验回合归属
+        async with self._game_session(group_id) as ready:
+            if not ready: logger.warning(f"[群{group_id}] AI 回合无法获得租约，跳过。"); return
+            game_instance = self.games.get(group_id);
+            if not game_instance: logger.warning(f"AI 回合: 游戏 {group_id} 不存在。Task exiting."); return
+            # AI 只读这一份快照；期间人类的命令照常修改局面，决策最后按快照版本比较并交换
+            snapshot = game_instance.snapshot(group_id); ai_player_data = snapshot.players.get(ai_player_id)
+            if not ai_player_data or ai_player_data.is_eliminated: logger.warning(f"AI 回合: 玩家 {ai_player_id} 无效或淘汰。Task exiting."); await self._trigger_next_turn_safe(original_event, group_id); return
+            if snapshot.current_player_id != ai_player_id: logger.warning(f"AI 回合: 非 {ai_player_id} 回合 ({snapshot.current_player_id})。Task exiting."); return
 
-        logger.info(f"[群{group_id}] AI {ai_player_data.name} ({ai_player_id}) 回合开始处理。")
-        provider = self.context.get_using_provider()
+        logger.info(f"[群{group_id}] AI {ai_player_data.name} ({ai_player_id}) 回合开始处理 (局面版本 {snapshot.version})。")
+        provider = self.context.get_using_provider(); deadline = self._ai_turn_deadline(); health = self._provider_health_for(provider) if provider else None
+        if provider and self.config.get("ai_batch_turns", False):
+            seats = self._consecutive_ai_seats(snapshot)
+            if len(seats) >= 2 and await self._handle_ai_plan(original_event, group_id, snapshot, seats, provider, deadline): return
 
-        # --- 1. 垃圾话 ---
-        if self.config.get("enable_trash_talk", True) and provider:
-            await self._broadcast_message(original_event, [Comp.Plain(f"轮到 🤖 {ai_player_data.name} 了，它正在想 P 话...")])
+        # --- 1. 垃圾话 (可选，提供方不健康时跳过；最多占用回合预算的三分之一) ---
+        if self.config.get("enable_trash_talk", True) and health and health.healthy and not (group_id in self._tournament_tables and self._llm_priority(group_id) == AI_TABLE): # 锦标赛的纯 AI 桌省掉垃圾话，把 LLM 名额留给动作
+            await self._broadcast_message(original_event, [Comp.Plain(f"轮到 🤖 {ai_player_data.name} 了，它正在想 P 话...")], group_id)
             await asyncio.sleep(random.uniform(0.5, 1.5))
             trash_talk_text = None
-            try: trash_talk_prompt = self._build_llm_prompt(game_instance.state, ai_player_id, include_chat=True, task_type="trash_talk"); logger.debug(f"AI ({ai_player_id}) 请求垃圾话..."); response = await provider.text_chat(prompt=trash_talk_prompt, session_id=None, contexts=[], temperature=0.7); trash_talk_text = response.completion_text.strip(); trash_talk_text = re.sub(r'<[^>]+>', '', trash_talk_text).strip(); logger.info(f"AI ({ai_player_id}) 生成垃圾话: {trash_talk_text}")
+            try:
+                with self.metrics.span("build_llm_prompt", group_id): trash_talk_prompt = self._build_llm_prompt(snapshot, ai_player_id, include_chat=True, task_type="trash_talk")
+                logger.debug(f"AI ({ai_player_id}) 请求垃圾话...")
+                loop = asyncio.get_running_loop(); trash_talk_deadline = loop.time() + (deadline - loop.time()) / 3
+                response = await self._call_llm(provider, trash_talk_prompt, trash_talk_deadline, "llm.text_chat.trash_talk", group_id, temperature=0.7)
+                trash_talk_text = response.completion_text.strip(); trash_talk_text = re.sub(r'<[^>]+>', '', trash_talk_text).strip(); logger.info(f"AI ({ai_player_id}) 生成垃圾话: {trash_talk_text}")
             except Exception as e: logger.error(f"AI ({ai_player_id}) 生成垃圾话失败: {e}", exc_info=False)
-            if trash_talk_text: trash_talk_message=[Comp.Plain(f"🤖 {ai_player_data.name}: {trash_talk_text}")]; await self._broadcast_message(original_event, trash_talk_message); await asyncio.sleep(random.uniform(1.0, 2.5))
+            if trash_talk_text: trash_talk_message=[Comp.Plain(f"🤖 {ai_player_data.name}: {trash_talk_text}")]; await self._broadcast_message(original_event, trash_talk_message, group_id); await asyncio.sleep(random.uniform(1.0, 2.5))
 
         # --- 2. 游戏动作 ---
-        await self._broadcast_message(original_event, [Comp.Plain(f"🤖 {ai_player_data.name} 开始操作...")])
+        await self._broadcast_message(original_event, [Comp.Plain(f"🤖 {ai_player_data.name} 开始操作...")], group_id)
         await asyncio.sleep(random.uniform(1.0, 2.0))
         final_decision_dict = None; reasoning_text = None; error_details = None; include_chat_in_action = self.config.get("include_chat_in_action_prompt", True)
 
         if provider:
-            action_prompt = self._build_llm_prompt(game_instance.state, ai_player_id, include_chat=include_chat_in_action, task_type="action")
+            with self.metrics.span("build_llm_prompt", group_id): action_prompt = self._build_llm_prompt(snapshot, ai_player_id, include_chat=include_chat_in_action, task_type="action")
             for attempt in range(AI_MAX_RETRIES):
-                 current_player_check_loop = game_instance.get_current_player_id();
-                 if group_id not in self.games or game_instance.state.status != GameStatus.PLAYING or current_player_check_loop != ai_player_id: logger.warning(f"AI({ai_player_id}) LLM 循环中状态变更/非本人回合({current_player_check_loop})，退出。"); break
+                 if not self._snapshot_is_current(snapshot): logger.warning(f"AI({ai_player_id}) 局面已不是快照版本 {snapshot.version}，停止调用 LLM。"); break
                  logger.info(f"AI ({ai_player_id}) 决策 LLM 调用 {attempt + 1}/{AI_MAX_RETRIES}...")
                  # !! 修正 Try...Except 块结构 !!
                  try:
-                     llm_response = await provider.text_chat(prompt=action_prompt, session_id=None, contexts=[])
-                     reasoning, decision, error_msg = self._parse_llm_response(llm_response.completion_text, game_instance.state, ai_player_id)
+                     llm_response = await self._call_llm(provider, action_prompt, deadline, "llm.text_chat.action", group_id)
+                     with self.metrics.span("parse_llm_response", group_id): reasoning, decision, error_msg = self._parse_llm_response(llm_response.completion_text, snapshot, ai_player_id)
                      reasoning_text = reasoning or reasoning_text
                      error_details = error_msg
                      if decision:
@@ -322,62 +738,236 @@ class LiarDicePlugin(Star):
                      else:
                          logger.warning(f"AI ({ai_player_id}) 第 {attempt + 1} 次尝试失败: {error_msg}")
                          if attempt < AI_MAX_RETRIES - 1:
-                             await asyncio.sleep(random.uniform(0.5, 1.0))
+                             await self._retry_pause(deadline)
+                 except AIDeadlineError as deadline_err: error_details = str(deadline_err); logger.warning(f"AI ({ai_player_id}) 放弃 LLM 决策: {deadline_err}"); break
                  except Exception as llm_err:
                      # 将异常处理放在 except 块内
                      error_details = f"LLM 调用异常: {type(llm_err).__name__}"
                      logger.error(f"AI ({ai_player_id}) 第 {attempt + 1} 次调用 LLM 时发生异常: {llm_err}", exc_info=False)
                      if attempt < AI_MAX_RETRIES - 1:
-                         await asyncio.sleep(random.uniform(0.5, 1.0))
+                         await self._retry_pause(deadline)
             # 检查是否因状态变更退出循环
-            if final_decision_dict is None and (group_id not in self.games or game_instance.state.status != GameStatus.PLAYING or game_instance.get_current_player_id() != ai_player_id): logger.warning(f"AI({ai_player_id}) LLM 循环结束后状态改变，取消回合处理。"); return
+            if final_decision_dict is None and not self._snapshot_is_current(snapshot): logger.warning(f"AI({ai_player_id}) LLM 循环结束后局面已变化，取消回合处理。"); return
         else: error_details = "无 LLM Provider。"; logger.error(error_details)
 
-        if final_decision_dict is None: final_decision_dict = await self._get_ai_fallback_decision(game_instance.state, ai_player_id); reasoning_text = reasoning_text or "(备用决策)"
+        if final_decision_dict is None: final_decision_dict = await self._get_ai_fallback_decision(snapshot, ai_player_id); reasoning_text = reasoning_text or "(备用决策)"
         if reasoning_text: logger.info(f"AI ({ai_player_data.name}) Decision Reasoning: {reasoning_text.strip()}")
         logger.info(f"AI ({ai_player_data.name}) Chosen Action: {final_decision_dict} (Fallback reason: {error_details})")
 
-        result = None
-        try:
-            if game_instance.get_current_player_id() != ai_player_id: logger.warning(f"AI({ai_player_id})执行前回合变更，取消。"); return
-            action = final_decision_dict['action']
-            if action == 'play': result = game_instance.process_play_card(ai_player_id, final_decision_dict['indices'])
-            elif action == 'challenge': result = game_instance.process_challenge(ai_player_id)
-            elif action == 'wait': result = game_instance.process_wait(ai_player_id)
-            else: raise ValueError(f"AI无效动作:{action}")
-        except GameError as e: logger.error(f"AI({ai_player_id})执行动作{final_decision_dict}游戏错误:{e}"); error_comps=[Comp.Plain(f"🤖 AI({ai_player_data.name})操作({final_decision_dict.get('action')})出错:{build_error_message(e, game_instance, ai_player_id)}")] ; await self._broadcast_message(original_event, error_comps); await self._trigger_next_turn_safe(original_event, group_id); return # 传递 event
-        except Exception as unexpected_err: logger.error(f"AI({ai_player_id})执行意外错误:{unexpected_err}", exc_info=True); error_comps=[Comp.Plain(f"❌处理AI({ai_player_data.name})回合内部错误。")]; await self._broadcast_message(original_event, error_comps); await self._trigger_next_turn_safe(original_event, group_id); return # 传递 event
+        async with self._game_session(group_id) as ready:
+            if not ready: logger.warning(f"[群{group_id}] AI({ai_player_id}) 应用决策时无法获得租约，放弃本回合。"); return
+            result = None; game_instance = self.games.get(group_id) # 共享后端下这是会话重新加载后的局面
+            try:
+                if not game_instance: raise StaleSnapshotError("牌桌已不存在。")
+                with self.metrics.span(f"engine.{final_decision_dict['action']}", group_id): result = game_instance.apply_decision(snapshot, ai_player_id, final_decision_dict)
+            except StaleSnapshotError as e: logger.warning(f"AI({ai_player_id}) 决策未应用: {e}"); return # 推进局面的一方负责触发下一回合
+            except GameError as e: logger.error(f"AI({ai_player_id})执行动作{final_decision_dict}游戏错误:{e}"); self._dump_trace(group_id, "AI 动作被引擎拒绝"); error_comps=[Comp.Plain(f"🤖 AI({ai_player_data.name})操作({final_decision_dict.get('action')})出错:{build_error_message(e, game_instance, ai_player_id)}")] ; await self._broadcast_message(original_event, error_comps, group_id); await self._trigger_next_turn_safe(original_event, group_id); return # 传递 event
+            except Exception as unexpected_err: logger.error(f"AI({ai_player_id})执行意外错误:{unexpected_err}", exc_info=True); self._dump_trace(group_id, "AI 回合意外错误"); error_comps=[Comp.Plain(f"❌处理AI({ai_player_data.name})回合内部错误。")]; await self._broadcast_message(original_event, error_comps, group_id); await self._trigger_next_turn_safe(original_event, group_id); return # 传递 event
+
+            self._annotate_ai_result(result, game_instance)
+            await self._process_and_broadcast_result(original_event, group_id, result, ai_player_id) # 传递 event
+        await self._continue_after_ai_result(original_event, group_id, result, ai_player_id)
 
+    def _annotate_ai_result(self, result: Dict[str, Any], game_instance: LiarDiceGame) -> None:
         if result and isinstance(result, dict):
             result['player_is_ai'] = True; pids_to_check = ['challenger_id', 'challenged_player_id', 'loser_id', 'next_player_id', 'trigger_player_id', 'eliminated_player_id']
             for key in pids_to_check: pid_res = result.get(key); result[key.replace('_id', '_is_ai')] = game_instance.state.players.get(pid_res, PlayerData("","",is_ai=False)).is_ai if pid_res else False
-        await self._process_and_broadcast_result(original_event, group_id, result, ai_player_id) # 传递 event
-        if group_id in self.games and not result.get("game_ended", False):
-            next_pid = result.get("next_player_id"); next_pname = result.get("next_player_name")
-            if next_pid and next_pname is not None: await asyncio.sleep(random.uniform(0.3,0.8)); await self._trigger_next_turn(original_event, group_id, next_pid, next_pname) # 传递 event
+    async def _continue_after_ai_result(self, original_event: AstrMessageEvent, group_id: str, result: Dict[str, Any], ai_player_id: str):
+        """在会话外停顿后重新进入会话触发下一回合；期间局面若已被推进，_trigger_next_turn 会忽略这次过期触发"""
+        if group_id not in self.games or result.get("game_ended", False): return
+        next_pid = result.get("next_player_id"); next_pname = result.get("next_player_name")
+        if next_pid and next_pname is not None: await asyncio.sleep(random.uniform(0.3,0.8))
+        async with self._game_session(group_id) as ready:
+            if not ready or group_id not in self.games: return
+            if next_pid and next_pname is not None: await self._trigger_next_turn(original_event, group_id, next_pid, next_pname) # 传递 event
             else: logger.error(f"AI({ai_player_id})回合后结果缺下一玩家，尝试安全推进。"); await self._trigger_next_turn_safe(original_event, group_id) # 传递 event
 
+    # --- LLM 调用: 回合截止时间与提供方健康分 ---
+    def _provider_health_for(self, provider: Any) -> ProviderHealth:
+        provider_config = getattr(provider, "provider_config", None)
+        name = (provider_config.get("id") if isinstance(provider_config, dict) else None) or type(provider).__name__
+        health = self._provider_health.get(name)
+        if health is None: health = self._provider_health[name] = ProviderHealth(name, cooldown=max(1.0, float(self.config.get("provider_breaker_cooldown_seconds", 30))))
+        return health
+    def _ai_turn_deadline(self) -> float:
+        return asyncio.get_running_loop().time() + max(1.0, float(self.config.get("ai_turn_deadline_seconds", 25)))
+    async def _retry_pause(self, deadline: float) -> None:
+        """重试前的停顿，不越过回合截止时间"""
+        await asyncio.sleep(max(0.0, min(random.uniform(0.5, 1.0), deadline - asyncio.get_running_loop().time())))
+    async def _call_llm(self, provider: Any, prompt: str, deadline: float, span_name: str, group_id: str, **kwargs) -> Any:
+        """在截止时间内调用一次 LLM 并更新提供方健康分。
+        提供方熔断中，或剩余时间不足以完成一次 (按该提供方平均耗时估计的) 调用时，直接抛出 AIDeadlineError 而不发请求。"""
+        health = self._provider_health_for(provider); loop = asyncio.get_running_loop(); remaining = deadline - loop.time()
+        if remaining < health.expected_latency(AI_MIN_LLM_BUDGET): raise AIDeadlineError(f"剩余 {remaining:.1f}s，不足以完成一次 LLM 调用")
+        if not health.available(): raise AIDeadlineError(f"LLM 提供方 {health.name} 熔断中")
+        if self.llm_gate:
+            # 排队时间计入回合预算，并留出一次调用的预计耗时；等不到名额就改用备用决策
+            try: await self.llm_gate.acquire(self._llm_priority(group_id), timeout=max(0.0, remaining - health.expected_latency(AI_MIN_LLM_BUDGET)))
+            except asyncio.TimeoutError: health.abandon_probe(); raise AIDeadlineError(f"LLM 并发已满 ({self.llm_gate.limit})，排队未轮到") from None
+            except asyncio.CancelledError: health.abandon_probe(); raise
+        started = loop.time(); remaining = deadline - started
+        try:
+            with self.metrics.span(span_name, group_id): response = await asyncio.wait_for(provider.text_chat(prompt=prompt, session_id=None, contexts=[], **kwargs), timeout=remaining)
+        except asyncio.TimeoutError:
+            if loop.time() < deadline - 0.05: health.record_failure(); raise # 提供方自身的超时，按普通失败处理
+            health.record_failure(timeout=True); raise AIDeadlineError(f"LLM 调用 {loop.time() - started:.1f}s 未返回，已到截止时间")
+        except asyncio.CancelledError: health.abandon_probe(); raise # 回合被取消，试探没有结果
+        except Exception: health.record_failure(); raise
+        finally:
+            if self.llm_gate: self.llm_gate.release()
+        elapsed = loop.time() - started; health.record_success(elapsed); self._observe_ai_llm_latency(group_id, elapsed); return response
+    def _llm_priority(self, table_key: str) -> int:
+        """还有未淘汰人类玩家的牌桌优先取得 LLM 名额"""
+        game_instance = self.games.get(table_key)
+        return HUMAN_TABLE if game_instance is None or any(not p.is_ai and not p.is_eliminated for p in game_instance.state.players.values()) else AI_TABLE
+    def _observe_ai_llm_latency(self, table_key: str, elapsed: float) -> None:
+        first = table_key in self._llm_cold_tables; self._llm_cold_tables.discard(table_key)
+        self.ai_llm_latency["first" if first else "steady"].observe(elapsed * 1000.0)
+        self.metrics.observe("llm.first_call" if first else "llm.steady_call", elapsed * 1000.0, table_key)
+
+    # --- LLM 提供方预热与保活 ---
+    def _start_provider_warmup(self, table_key: str, game_instance: LiarDiceGame) -> None:
+        """有 AI 的牌桌开局时: 提供方已空闲较久 (连接可能已被回收) 就在后台预热，并确保保活任务在运行"""
+        if not any(p.is_ai for p in game_instance.state.players.values()): return
+        self._llm_cold_tables.add(table_key)
+        provider = self.context.get_using_provider()
+        if not provider or not self.config.get("provider_warmup", True): return
+        keepalive = float(self.config.get("provider_keepalive_seconds", 45))
+        if self._provider_health_for(provider).idle_for() >= (keepalive if keepalive > 0 else 45): self._ping_provider(provider, "预热")
+        if keepalive > 0 and (self._keepalive_task is None or self._keepalive_task.done()): self._keepalive_task = asyncio.create_task(self._provider_keepalive_loop())
+    def _ping_provider(self, provider: Any, reason: str) -> None:
+        health = self._provider_health_for(provider); task = self._provider_pings.get(health.name)
+        if (task and not task.done()) or health.state == PROVIDER_OPEN: return # 同一提供方同时只发一个；熔断中交给冷却后的试探
+        self._provider_pings[health.name] = asyncio.create_task(self._send_provider_ping(provider, health, reason))
+    async def _send_provider_ping(self, provider: Any, health: ProviderHealth, reason: str) -> None:
+        """轻量请求: 优先调用提供方的模型列表接口 (与对话共用同一客户端连接池)，没有时发一句极短的对话"""
+        loop = asyncio.get_running_loop(); started = loop.time()
+        try:
+            get_models = getattr(provider, "get_models", None); pending = get_models() if callable(get_models) else None
+            if not inspect.isawaitable(pending): pending = provider.text_chat(prompt=PING_PROMPT, session_id=None, contexts=[])
+            await asyncio.wait_for(pending, timeout=PING_TIMEOUT)
+            health.record_warmup(); logger.debug(f"LLM 提供方 {health.name} {reason}完成 ({(loop.time() - started) * 1000:.0f}ms)")
+        except Exception as e: logger.info(f"LLM 提供方 {health.name} {reason}失败: {type(e).__name__}: {e}")
+    async def _provider_keepalive_loop(self) -> None:
+        """有 AI 的牌桌进行中时，提供方空闲超过 provider_keepalive_seconds 就发一次保活请求；没有这样的牌桌时退出"""
+        while True:
+            interval = float(self.config.get("provider_keepalive_seconds", 45))
+            if interval <= 0: return
+            await asyncio.sleep(interval / 3)
+            if not any(game.state.status == GameStatus.PLAYING and any(p.is_ai for p in game.state.players.values()) for game in self.games.values()): return
+            provider = self.context.get_using_provider()
+            if provider and self._provider_health_for(provider).idle_for() >= interval: self._ping_provider(provider, "保活")
+
+    # --- 连续 AI 座位的批量决策 ---
+    def _consecutive_ai_seats(self, snapshot: GameSnapshot) -> List[str]:
+        """从当前玩家起按回合顺序连续就座的存活 AI，遇到存活的人类即停止，最多 ai_batch_max_seats 名"""
+        order = snapshot.turn_order; limit = max(2, int(self.config.get("ai_batch_max_seats", 4)))
+        if snapshot.current_player_id not in order: return []
+        start = order.index(snapshot.current_player_id); seats = []
+        for step in range(len(order)):
+            pdata = snapshot.players.get(order[(start + step) % len(order)])
+            if not pdata or pdata.is_eliminated: continue
+            if not pdata.is_ai: break
+            seats.append(pdata.id)
+            if len(seats) >= limit: break
+        return seats
+    async def _handle_ai_plan(self, original_event: AstrMessageEvent, group_id: str, snapshot: GameSnapshot, seats: List[str], provider: Any, deadline: float) -> bool:
+        """一次 LLM 请求得到连续几名 AI 的行动计划，逐步按应用时的局面校验后执行。
+        局面偏离计划 (人类命令、超时、重新发牌) 或某一步不合法时放弃剩余步骤，由正常的下一回合流程接手。
+        返回 False 表示没有得到可用计划且局面未变，调用方继续按单人回合处理。"""
+        players = snapshot.players; names = "、".join(players[pid].name for pid in seats)
+        await self._broadcast_message(original_event, [Comp.Plain(f"🤖 {names} 连坐，正在一起盘算...")], group_id)
+        await asyncio.sleep(random.uniform(1.0, 2.0))
+        moves = None; reasoning_text = None
+        with self.metrics.span("build_llm_prompt", group_id): plan_prompt = self._build_llm_plan_prompt(snapshot, seats, self.config.get("include_chat_in_action_prompt", True))
+        for attempt in range(AI_MAX_RETRIES):
+            if not self._snapshot_is_current(snapshot): logger.warning(f"[群{group_id}] 局面已不是快照版本 {snapshot.version}，放弃 AI 计划。"); return True
+            try:
+                llm_response = await self._call_llm(provider, plan_prompt, deadline, "llm.text_chat.plan", group_id)
+                reasoning_text, moves, error_msg = self._parse_llm_plan(llm_response.completion_text, len(seats))
+                if moves: break
+                logger.warning(f"[群{group_id}] AI 计划第 {attempt + 1} 次解析失败: {error_msg}")
+            except AIDeadlineError as deadline_err: logger.warning(f"[群{group_id}] 放弃 AI 计划: {deadline_err}"); break
+            except Exception as llm_err: logger.error(f"[群{group_id}] AI 计划第 {attempt + 1} 次调用 LLM 异常: {llm_err}", exc_info=False)
+            if attempt < AI_MAX_RETRIES - 1: await self._retry_pause(deadline)
+        if not moves: return not self._snapshot_is_current(snapshot)
+        self.ai_plan_stats["plans"] += 1
+        if reasoning_text: logger.info(f"[群{group_id}] AI 计划 ({names}) 思路: {reasoning_text.strip()}")
+        applied = 0; result = None; last_actor = None
+        for ai_player_id, decision in zip(seats, moves):
+            if applied: await asyncio.sleep(random.uniform(0.3, 0.8))
+            async with self._game_session(group_id) as ready: # 每一步单独进入会话，步间停顿不占用锁与租约
+                game_instance = self.games.get(group_id) if ready else None
+                if not game_instance: break
+                current = game_instance.snapshot(group_id)
+                # 只允许计划内已执行的步骤推进过局面，其他任何动作都会让版本对不上
+                if current.version != snapshot.version + applied or current.current_player_id != ai_player_id: logger.info(f"[群{group_id}] 局面已偏离计划，放弃剩余 {len(moves) - applied} 步。"); break
+                error_msg = self._validate_decision(decision, current, ai_player_id)
+                if error_msg: logger.warning(f"AI({ai_player_id}) 计划动作 {decision} 不合法: {error_msg}，放弃剩余计划。"); break
+                try:
+                    with self.metrics.span(f"engine.{decision['action']}", group_id): result = game_instance.apply_decision(current, ai_player_id, decision)
+                except GameError as e: logger.error(f"AI({ai_player_id}) 执行计划动作 {decision} 出错: {e}"); break
+                logger.info(f"AI ({players[ai_player_id].name}) 按计划行动: {decision}")
+                self._annotate_ai_result(result, game_instance)
+                await self._process_and_broadcast_result(original_event, group_id, result, ai_player_id)
+            applied += 1; last_actor = ai_player_id
+            if group_id not in self.games or result.get("game_ended") or result.get("reshuffled"): break # 重新发牌后计划所依据的手牌已失效
+        self.ai_plan_stats["moves_applied"] += applied; self.ai_plan_stats["moves_discarded"] += len(moves) - applied
+        if not applied: return not self._snapshot_is_current(snapshot)
+        await self._continue_after_ai_result(original_event, group_id, result, last_actor); return True
+
+    def _snapshot_is_current(self, snapshot: GameSnapshot) -> bool:
+        """快照是否仍是牌桌的当前版本 (只比较一个整数)，用于在 LLM 调用之间提前放弃"""
+        game_instance = self.games.get(snapshot.table_key)
+        return game_instance is not None and game_instance.state.status == GameStatus.PLAYING and game_instance.state.action_count == snapshot.version
+
+    async def _profiled_ai_turn(self, original_event: AstrMessageEvent, group_id: str, ai_player_id: str):
+        """AI 回合任务入口: 若本群正在性能分析，则整个回合计入分析区段 (会话由 _handle_ai_turn 按阶段获取)"""
+        with self._profile_section(group_id): await self._handle_ai_turn(original_event, group_id, ai_player_id)
+        await self._profile_turn_done(original_event, group_id)
+
+    # --- 按需性能分析 ---
+    def _profile_section(self, group_id: Optional[str]):
+        profiler = self._profiler
+        if profiler is None or profiler.group_id != group_id: return contextlib.nullcontext()
+        return profiler.section()
+    async def _profile_turn_done(self, event: AstrMessageEvent, group_id: str, force: bool = False):
+        """回合结束时计数；达到目标回合数 (或强制停止) 时写出统计并在群内回复前几项"""
+        profiler = self._profiler
+        if profiler is None or profiler.group_id != group_id: return
+        if not profiler.finish_turn() and not force: return
+        self._profiler = None
+        try: path, top_lines = await asyncio.to_thread(profiler.dump)
+        except Exception as e: logger.error(f"写出性能分析结果失败: {e}", exc_info=True); await self._broadcast_message(event, [Comp.Plain(f"❌性能分析结果写出失败: {e}")], group_id); return
+        turns_done = profiler.turns_total - max(0, profiler.turns_remaining)
+        logger.info(f"[群{group_id}] 性能分析完成 ({turns_done} 回合)，结果: {path}")
+        await self._broadcast_message(event, [Comp.Plain(f"🔬 性能分析完成 ({turns_done} 回合，按累计耗时):\n" + "\n".join(top_lines) + f"\n📁 {path}")], group_id)
+
     # --- Process Result & Trigger Next Turn Helpers ---
     async def _process_and_broadcast_result(self, event: AstrMessageEvent, group_id: str, result: Dict[str, Any], acting_player_id: Optional[str] = None): # ... (保持不变) ...
         game_instance = self.games.get(group_id);
         if not game_instance: return
+        if result: self.opponent_model.observe(result, acting_player_id, ignore={pid for pid, pdata in game_instance.state.players.items() if pdata.is_ai})
+        recorder = self._replay_recorders.get(group_id)
+        if recorder and result: recorder.record(result, acting_player_id)
         messages_to_send = []; pm_failures = []
-        if not result or not result.get("success"): error_msg = result.get("error","未知错误"); messages_to_send.append([Comp.Plain(f"❗处理逻辑出错:{error_msg}")]); logger.warning(f"处理结果逻辑错误:{error_msg}"); [await self._broadcast_message(event, mc) for mc in messages_to_send]; return # 传递 event
+        if not result or not result.get("success"): error_msg = result.get("error","未知错误"); messages_to_send.append([Comp.Plain(f"❗处理逻辑出错:{error_msg}")]); logger.warning(f"处理结果逻辑错误:{error_msg}"); [await self._broadcast_message(event, mc, group_id) for mc in messages_to_send]; return # 传递 event
         action = result.get("action"); current_main_card = result.get("new_main_card") or game_instance.state.main_card or "未知"
-        hands_to_update = result.get("new_hands", {});
-        if action == "play" and "hand_after_play" in result and acting_player_id: hands_to_update[acting_player_id] = result["hand_after_play"]
+        hands_to_update = dict(result.get("new_hands", {})); delta_ids = set()
+        if action == "play" and "hand_after_play" in result and acting_player_id and acting_player_id not in hands_to_update: hands_to_update[acting_player_id] = result["hand_after_play"]; delta_ids.add(acting_player_id) # 出牌只发剩余手牌，重新发牌才发完整手牌
         if hands_to_update:
             logger.debug(f"准备发送手牌更新私信给: {list(hands_to_update.keys())}")
             for p_id, hand in hands_to_update.items():
                  player_data = game_instance.state.players.get(p_id)
                  if player_data and not player_data.is_eliminated and not player_data.is_ai:
-                      if not await self._send_hand_update(event, group_id, p_id, hand, current_main_card): # 传递 event
+                      if not await self._send_hand_update(event, group_id, p_id, hand, current_main_card, HAND_DELTA if p_id in delta_ids else HAND_FULL): # 传递 event
                            pm_failures.append(player_data.name)
         primary_messages = []; acting_player_data = game_instance.state.players.get(acting_player_id) if acting_player_id else None
         if acting_player_data: result['player_is_ai'] = acting_player_data.is_ai
         if action == "play": primary_messages.append(build_play_card_announcement(result))
         elif action == "challenge": primary_messages.extend(build_challenge_result_messages(result))
         elif action == "wait": primary_messages.append(build_wait_announcement(result))
+        if action == "challenge" and self.player_stats: self.player_stats.record_challenge(split_table_key(group_id)[0], result, game_instance.state.players)
         if action == "challenge": messages_to_send.extend(primary_messages)
         elif primary_messages: messages_to_send.append(primary_messages[0])
         game_ended_flag = result.get("game_ended", False); reshuffled_flag = result.get("reshuffled", False)
@@ -391,206 +981,583 @@ class LiarDicePlugin(Star):
             winner_id = result.get("winner_id"); winner_name = result.get("winner_name"); is_winner_ai = False
             if winner_id and winner_id in game_instance.state.players: is_winner_ai = game_instance.state.players[winner_id].is_ai
             end_comps = build_game_end_message(winner_id, winner_name); messages_to_send.append(end_comps); logger.info(f"游戏结束，胜者:{winner_name}")
+            self._record_game_stats(group_id, game_instance.state, winner_id); self._finish_replay(group_id, game_instance.state, winner_id)
             if group_id in self.games: del self.games[group_id]
-            if group_id in self.active_ai_tasks: task = self.active_ai_tasks.pop(group_id); task.cancel()
-        for msg_comps in messages_to_send: await self._broadcast_message(event, msg_comps); await asyncio.sleep(0.2) # 传递 event
-        if pm_failures: await self._broadcast_message(event, [Comp.Plain(f"⚠️未能向{','.join(pm_failures)}发送手牌私信。")]) # 传递 event
+            self._release_group_resources(group_id)
+            task = self.active_ai_tasks.pop(group_id, None)
+            if task and task is not asyncio.current_task(): task.cancel() # AI 的动作结束对局时不能取消自己，否则结束消息发不出去
+        for msg_comps in messages_to_send: await self._broadcast_message(event, msg_comps, group_id); await asyncio.sleep(0.2) # 传递 event
+        if pm_failures: await self._broadcast_message(event, [Comp.Plain(f"⚠️未能向{','.join(pm_failures)}发送手牌私信。")], group_id) # 传递 event
+        if game_ended_flag: self._on_table_ended(group_id, result.get("winner_id"))
     async def _trigger_next_turn(self, event: AstrMessageEvent, group_id: str, next_player_id: str, next_player_name: str): # ... (保持不变) ...
         logger.debug(f"调用 _trigger_next_turn: group={group_id}, next_player={next_player_name}({next_player_id})")
         if group_id not in self.games: logger.warning(f"_trigger_next_turn: 游戏 {group_id} 不存在。"); return
         game_instance = self.games[group_id]; next_player_data = game_instance.state.players.get(next_player_id)
+        # 触发方在广播/停顿期间局面可能已被其他命令推进；过期的触发既不能取消新回合的 AI 任务，也不能再安全推进而跳过别人的回合
+        if game_instance.get_current_player_id() != next_player_id: logger.info(f"_trigger_next_turn: 已不是 {next_player_name} 的回合，忽略过期触发。"); return
         if not next_player_data or next_player_data.is_eliminated: logger.warning(f"_trigger_next_turn: 玩家 {next_player_id} 无效或已淘汰，尝试安全推进。"); await self._trigger_next_turn_safe(event, group_id); return # 传递 event
-        if group_id in self.active_ai_tasks: logger.warning(f"触发新回合时，群 {group_id} 仍有活动的 AI 任务，尝试取消旧任务。"); old_task = self.active_ai_tasks.pop(group_id); old_task.cancel()
+        if group_id in self.active_ai_tasks and self.active_ai_tasks[group_id] is not asyncio.current_task(): logger.warning(f"触发新回合时，群 {group_id} 仍有活动的 AI 任务，尝试取消旧任务。"); old_task = self.active_ai_tasks.pop(group_id); old_task.cancel()
+        else: self.active_ai_tasks.pop(group_id, None) # 由当前 AI 任务自身触发下一回合时不能取消自己
         if next_player_data.is_ai:
             logger.info(f"触发 AI {next_player_name} 回合任务。")
-            ai_task = asyncio.create_task(self._handle_ai_turn(event, group_id, next_player_id)) # !! 传递 event !!
+            self.turn_timers.cancel(group_id); self._claim_turn(game_instance, max(1.0, float(self.config.get("ai_turn_deadline_seconds", 25))))
+            ai_task = asyncio.create_task(self._profiled_ai_turn(event, group_id, next_player_id)) # !! 传递 event !!
             self.active_ai_tasks[group_id] = ai_task
             ai_task.add_done_callback(lambda t: self._ai_task_done_callback(t, group_id))
         else: # 人类玩家
             logger.info(f"轮到人类 {next_player_name}。")
+            self._schedule_turn_timeout(event, group_id, next_player_id)
             next_hand_empty = not next_player_data.hand; msg_comps = [Comp.Plain("轮到你了, "), Comp.At(qq=next_player_id), Comp.Plain(f" ({next_player_name}) ")]
             can_challenge = game_instance.state.last_play is not None
             if next_hand_empty: msg_comps.append(Comp.Plain(".\n✋手牌空，请 "+("/质疑` 或 `"if can_challenge else "")+"/等待`。"))
             else: msg_comps.append(Comp.Plain(".\n请 "+("/质疑` 或 `"if can_challenge else "")+"/出牌 <编号...>`。"))
-            await self._broadcast_message(event, msg_comps) # 传递 event
+            await self._broadcast_message(event, msg_comps, group_id) # 传递 event
+    # --- 回合超时 (AFK) ---
+    def _schedule_turn_timeout(self, event: AstrMessageEvent, group_id: str, player_id: str) -> None:
+        timeout = float(self.config.get("turn_timeout_seconds", 120)); game_instance = self.games.get(group_id)
+        if not game_instance: return
+        if timeout <= 0: self._claim_turn(game_instance, None); return
+        self._claim_turn(game_instance, timeout); marker = game_instance.state.action_count; remind_before = float(self.config.get("turn_reminder_seconds", 30))
+        self._turn_events[group_id] = event
+        if 0 < remind_before < timeout: self.turn_timers.schedule(group_id, timeout - remind_before, ("remind", player_id, marker))
+        else: self.turn_timers.schedule(group_id, timeout, ("expire", player_id, marker))
+    def _on_turn_timer(self, group_id: str, payload: Tuple[str, str, int]) -> None:
+        task = asyncio.create_task(self._handle_turn_timer(group_id, payload)); self._timer_tasks.add(task); task.add_done_callback(self._timer_tasks.discard)
+    async def _handle_turn_timer(self, group_id: str, payload: Tuple[str, str, int]):
+        stage, player_id, marker = payload; event = self._turn_events.get(group_id)
+        if event is None: return
+        async with self._game_session(group_id, event) as ready:
+            if not ready and stage == "watch": self.turn_timers.schedule(group_id, 1.0, payload); return # 其他节点正在处理，稍后再看
+            if not ready or stage == "watch": return # 接管检查已在会话加载后完成
+            game_instance = self.games.get(group_id)
+            # 期间已有任何动作或轮到别人，计时器作废
+            if not game_instance or game_instance.state.status != GameStatus.PLAYING or game_instance.get_current_player_id() != player_id or game_instance.state.action_count != marker: return
+            player_data = game_instance.state.players.get(player_id)
+            if not player_data: return
+            if stage == "remind":
+                remind_before = float(self.config.get("turn_reminder_seconds", 30))
+                await self._broadcast_message(event, [Comp.Plain("⏰ "), Comp.At(qq=player_id), Comp.Plain(f" ({player_data.name}) 还剩 {int(remind_before)} 秒，超时将自动{'等待' if not player_data.hand else '行动'}。")], group_id)
+                self.turn_timers.schedule(group_id, remind_before, ("expire", player_id, marker)); return
+            await self._apply_timeout_action(event, group_id, game_instance, player_data)
+    async def _apply_timeout_action(self, event: AstrMessageEvent, group_id: str, game_instance: LiarDiceGame, player_data: PlayerData):
+        """超时默认动作: 手牌空则等待；否则按配置自动质疑 (有上家出牌时) 或打出第一张牌"""
+        player_id = player_data.id; auto_challenge = game_instance.state.last_play is not None and self.config.get("turn_timeout_action", "play") == "challenge"
+        if auto_challenge: action, action_text = "challenge", "质疑"
+        elif not player_data.hand: action, action_text = "wait", "等待"
+        else: action, action_text = "play", "打出第 1 张牌"
+        logger.info(f"[群{group_id}] 玩家 {player_data.name}({player_id}) 回合超时，自动 {action}")
+        await self._broadcast_message(event, [Comp.Plain("⌛ "), Comp.At(qq=player_id), Comp.Plain(f" ({player_data.name}) 超时未操作，自动{action_text}。")], group_id)
+        try:
+            with self.metrics.span(f"engine.{action}", group_id):
+                if action == "play": result = game_instance.process_play_card(player_id, [1])
+                elif action == "challenge": result = game_instance.process_challenge(player_id)
+                else: result = game_instance.process_wait(player_id)
+        except GameError as e: logger.error(f"[群{group_id}] 超时自动动作失败: {e}"); await self._broadcast_message(event, [Comp.Plain(build_error_message(e, game_instance, player_id))], group_id); return
+        await self._process_and_broadcast_result(event, group_id, result, player_id)
+        if group_id in self.games and not result.get("game_ended", False):
+            next_pid = result.get("next_player_id"); next_pname = result.get("next_player_name")
+            if next_pid and next_pname is not None: await self._trigger_next_turn(event, group_id, next_pid, next_pname)
+            else: await self._trigger_next_turn_safe(event, group_id)
+
     async def _trigger_next_turn_safe(self, event: AstrMessageEvent, group_id: str): # ... (保持不变) ...
          logger.debug(f"安全推进回合...")
          if group_id not in self.games: return
          game_instance = self.games[group_id]; next_player_id, next_player_name = game_instance._advance_turn()
-         if next_player_id and next_player_name is not None: await self._trigger_next_turn(event, group_id, next_player_id, next_player_name) # 传递 event
+         if next_player_id and next_player_name is not None:
+              recorder = self._replay_recorders.get(group_id)
+              if recorder: recorder.skip(next_player_id) # 引擎动作之外的推进也要录制，否则重放时轮次对不上
+              await self._trigger_next_turn(event, group_id, next_player_id, next_player_name) # 传递 event
          else:
               if game_instance._check_game_end_internal():
                    if game_instance.state.status != GameStatus.ENDED: game_instance.state.status = GameStatus.ENDED
                    winner_id=game_instance._get_winner_id(); winner_name=game_instance.state.players[winner_id].name if winner_id else None; end_msg = build_game_end_message(winner_id, winner_name)
-                   await self._broadcast_message(event, end_msg); # 传递 event
+                   self._record_game_stats(group_id, game_instance.state, winner_id); self._finish_replay(group_id, game_instance.state, winner_id)
+                   await self._broadcast_message(event, end_msg, group_id); # 传递 event
                    if group_id in self.games: del self.games[group_id]
-                   if group_id in self.active_ai_tasks: task = self.active_ai_tasks.pop(group_id); task.cancel()
-              else: logger.error(f"游戏状态异常！"); await self._broadcast_message(event, [Comp.Plain("❌游戏状态异常，请/结束游戏")]) # 传递 event
+                   self._release_group_resources(group_id); self._on_table_ended(group_id, winner_id)
+                   task = self.active_ai_tasks.pop(group_id, None)
+                   if task and task is not asyncio.current_task(): task.cancel() # 由 AI 任务自身结束对局时不能取消自己
+              else: logger.error(f"游戏状态异常！"); await self._broadcast_message(event, [Comp.Plain("❌游戏状态异常，请/结束游戏")], group_id) # 传递 event
+
+    # --- 锦标赛 ---
+    def _spawn_tournament_task(self, coro) -> None:
+        task = asyncio.create_task(coro); self._tournament_tasks.add(task); task.add_done_callback(self._tournament_task_done)
+    def _tournament_task_done(self, task: asyncio.Task) -> None:
+        self._tournament_tasks.discard(task)
+        if not task.cancelled() and task.exception(): logger.error(f"锦标赛任务异常: {task.exception()}", exc_info=task.exception())
+    def _on_table_ended(self, table_key: str, winner_id: Optional[str]) -> None:
+        """牌桌结束 (含强制结束) 后调用；锦标赛牌桌交给赛程记录胜者、晋级并补开排队的牌桌"""
+        match = self._tournament_tables.pop(table_key, None)
+        if match is not None: self._spawn_tournament_task(self._advance_tournament(split_table_key(table_key)[0], match, winner_id))
+    async def _advance_tournament(self, group_id: str, match: Match, winner_id: Optional[str]) -> None:
+        tournament = self.tournaments.get(group_id); event = self._tournament_events.get(group_id)
+        if tournament is None or tournament.status != TOURNAMENT_RUNNING or event is None: return
+        new_round = tournament.finish_match(match, winner_id)
+        if tournament.status == TOURNAMENT_FINISHED:
+            del self.tournaments[group_id]; self._tournament_events.pop(group_id, None) # 赛程随锦标赛一起释放
+            logger.info(f"[群{group_id}] 锦标赛结束，冠军: {tournament.name(tournament.champion_id)}，共 {tournament.tables_played} 桌 (同时进行峰值 {tournament.peak_live})")
+            champion = [Comp.Plain("👑 锦标赛冠军: "), Comp.At(qq=tournament.champion_id), Comp.Plain(f" ({tournament.name(tournament.champion_id)})！")] if tournament.champion_id and not tournament.entrants[tournament.champion_id].is_ai else [Comp.Plain(f"👑 锦标赛冠军: {tournament.name(tournament.champion_id)}！")]
+            await self._broadcast_message(event, champion + [Comp.Plain("\n" + "\n".join(tournament.bracket_lines()))], group_id); return
+        if new_round: await self._broadcast_message(event, [Comp.Plain(f"📣 第{new_round[0].round_no - 1}轮结束，{sum(len(m.seats) for m in new_round)} 人晋级。\n" + "\n".join(tournament.bracket_lines()))], group_id)
+        else: await self._broadcast_message(event, [Comp.Plain(f"🏅 锦标赛 {tournament.match_line(match)}")], group_id)
+        await self._pump_tournament(group_id)
+    async def _pump_tournament(self, group_id: str) -> None:
+        """在同时进行的牌桌数上限内依次开出排队的牌桌，相邻两桌间隔 tournament_start_stagger_seconds，避免开局的私信与首轮 LLM 调用挤在同一时刻"""
+        if group_id in self._tournament_pumping: return # 正在开桌的循环会接着检查空出的名额
+        self._tournament_pumping.add(group_id)
+        try:
+            stagger = max(0.0, float(self.config.get("tournament_start_stagger_seconds", 2)))
+            while True:
+                tournament = self.tournaments.get(group_id); match = tournament.next_match() if tournament else None
+                if match is None: break
+                await self._launch_tournament_match(group_id, tournament, match)
+                if stagger: await asyncio.sleep(stagger)
+        finally: self._tournament_pumping.discard(group_id)
+    async def _launch_tournament_match(self, group_id: str, tournament: Tournament, match: Match) -> None:
+        event = self._tournament_events[group_id]; table_key = make_table_key(group_id, match.table_name)
+        if table_key in self.games: # 桌名格式已为锦标赛保留，不应出现；绝不覆盖进行中的对局，该桌按开局失败处理
+            logger.error(f"[群{group_id}] 锦标赛牌桌 {match.table_name} 已被占用，该桌无人晋级。")
+            await self._broadcast_message(event, [Comp.Plain(f"❌锦标赛牌桌 {match.table_name} 已被占用，该桌无人晋级。")], group_id); await self._advance_tournament(group_id, match, None); return
+        game_instance = LiarDiceGame(creator_id=tournament.organizer_id, trace_size=self._trace_size)
+        for pid in match.seats: entrant = tournament.entrants[pid]; game_instance.add_player(pid, entrant.name); game_instance.state.players[pid].is_ai = entrant.is_ai
+        self.games[table_key] = game_instance; self._index_table(table_key); self._tournament_tables[table_key] = match
+        try:
+            start_result, pm_failures = await self._begin_game(event, table_key, game_instance)
+            if not start_result.get("success"): raise GameError(start_result.get("error", "未知"))
+            await self._broadcast_message(event, build_start_game_message(start_result), table_key)
+            if pm_failures: await self._broadcast_message(event, self._pm_failure_components(pm_failures), table_key)
+            await self._begin_first_turn(event, table_key, start_result)
+        except Exception as e:
+            logger.error(f"[群{group_id}] 锦标赛牌桌 {match.table_name} 开局失败: {e}", exc_info=not isinstance(e, GameError)); self._dump_trace(table_key, "锦标赛开局失败")
+            self.games.pop(table_key, None); self._release_group_resources(table_key); self._on_table_ended(table_key, None)
+            await self._broadcast_message(event, [Comp.Plain(f"❌锦标赛牌桌 {match.table_name} 开局失败，该桌无人晋级。")], group_id)
+    async def _cancel_tournament(self, group_id: str, tournament: Tournament) -> int:
+        """结束锦标赛并强制结束其仍在进行的牌桌，返回结束的牌桌数"""
+        live = tournament.cancel(); self.tournaments.pop(group_id, None); self._tournament_events.pop(group_id, None)
+        for match in live:
+            table_key = make_table_key(group_id, match.table_name); self._tournament_tables.pop(table_key, None)
+            task = self.active_ai_tasks.pop(table_key, None)
+            if task and task is not asyncio.current_task(): task.cancel()
+            if self.games.pop(table_key, None): self._release_group_resources(table_key)
+        return len(live)
 
     # --- Command Handlers ---
     # ... (保持不变) ...
     @filter.command("骗子酒馆", alias={'pzjg', 'liardice'})
-    async def create_game(self, event: AstrMessageEvent): # ... (代码同上) ...
+    @_with_game_session(infer_table=False)
+    async def create_game(self, event: AstrMessageEvent, table: str = ""): # ... (代码同上) ...
         logger.info(f"接收到 create_game 命令，来源: {event.get_sender_id()}，群组: {event.get_group_id()}")
-        group_id = self._get_group_id(event);
+        table = table.strip(); group_id = self._resolve_table_key(event, table, infer=False);
         if not group_id: user_id = self._get_user_id(event); await self._send_private_message_text(event, user_id, "请在群聊中使用此命令创建游戏。") if user_id else logger.warning("群外无法获取用户ID"); event.stop_event(); return
+        if len(table) > MAX_TABLE_NAME_LEN or TABLE_KEY_SEP in table: yield event.plain_result(f"❌桌名需不超过{MAX_TABLE_NAME_LEN}字且不含“{TABLE_KEY_SEP}”"); event.stop_event(); return
+        if table and self.state_store.shared: yield event.plain_result("❌多节点部署下只支持每群一张默认牌桌，请不带桌名创建。"); event.stop_event(); return # 命名牌桌的索引与按成员推断只在本节点内存中
+        if is_tournament_table_name(table): yield event.plain_result(f"❌桌名 “{table}” 的格式 (R轮次-桌号) 留给锦标赛牌桌，请换一个桌名。"); event.stop_event(); return
         if group_id in self.games:
             game_instance=self.games.get(group_id); current_status=game_instance.state.status if game_instance else GameStatus.ENDED
-            if current_status!=GameStatus.ENDED: yield event.plain_result(f"⏳ 本群已有游戏 ({current_status.name})。\n➡️ /结束游戏 可强制结束。"); event.stop_event(); return
+            if current_status!=GameStatus.ENDED: yield event.plain_result(f"⏳ {'该牌桌' if table else '本群'}已有游戏 ({current_status.name})。\n➡️ /结束游戏{' ' + table if table else ''} 可强制结束。\n➡️ /骗子酒馆 <桌名> 可另开一桌。"); event.stop_event(); return
             else: del self.games[group_id]; self.active_ai_tasks.pop(group_id, None); logger.info(f"清理已结束游戏 {group_id}。")
-        creator_id = self._get_user_id(event); self.games[group_id] = LiarDiceGame(creator_id=creator_id); logger.info(f"[群{group_id}] 由 {creator_id} 创建新游戏。")
-        announcement = (f"🍻 骗子酒馆开张！(AI版 v1.3.6)\n➡️ /加入 参与 (需{MIN_PLAYERS}人)。\n➡️ /添加AI [数量] 加AI。\n➡️ 发起者({event.get_sender_name()}) /开始 启动。\n\n📜 玩法:\n1. 轮流用 `/出牌 编号 [...]` (1-{MAX_PLAY_CARDS}张) 声称主牌/鬼牌。\n2. 下家可 `/质疑` 或 `/出牌`。\n3. 质疑失败或声称不实者开枪！(中弹淘汰)\n4. 手牌空只能 `/质疑` 或 `/等待`。\n5. 活到最后！")
+        max_tables = max(1, int(self.config.get("max_tables_per_group", 3))); existing_tables = self._group_tables.get(split_table_key(group_id)[0], ())
+        if group_id not in existing_tables and len(existing_tables) >= max_tables: yield event.plain_result(self._no_game_text(group_id, f"⚠️本群牌桌数已达上限({max_tables})")); event.stop_event(); return
+        creator_id = self._get_user_id(event); self.games[group_id] = LiarDiceGame(creator_id=creator_id, trace_size=self._trace_size); self._index_table(group_id); logger.info(f"[群{group_id}] 由 {creator_id} 创建新游戏。")
+        table_arg = f" {table}" if table else ""
+        announcement = (f"🍻 骗子酒馆{'「' + table + '」桌' if table else ''}开张！(AI版 v1.3.6)\n➡️ /加入{table_arg} 参与 (需{MIN_PLAYERS}人，最多{self._max_table_players()}人)。\n➡️ /添加AI [数量]{table_arg} 加AI。\n➡️ 发起者({event.get_sender_name()}) /开始{table_arg} 启动。\n\n📜 玩法:\n1. 轮流用 `/出牌 编号 [...]` (1-{MAX_PLAY_CARDS}张) 声称主牌/鬼牌。\n2. 下家可 `/质疑` 或 `/出牌`。\n3. 质疑失败或声称不实者开枪！(中弹淘汰)\n4. 手牌空只能 `/质疑` 或 `/等待`。\n5. 活到最后！")
         yield event.plain_result(announcement)
         if not event.is_stopped(): event.stop_event(); return
     @filter.command("加入")
-    async def join_game(self, event: AstrMessageEvent): # ... (代码同上) ...
-        group_id = self._get_group_id(event); user_id = self._get_user_id(event); user_name = event.get_sender_name() or f"用户{user_id[:4]}"
+    @_with_game_session
+    async def join_game(self, event: AstrMessageEvent, table: str = ""): # ... (代码同上) ...
+        group_id = self._resolve_table_key(event, table); user_id = self._get_user_id(event); user_name = event.get_sender_name() or f"用户{user_id[:4]}"
         if not group_id or not user_id: yield event.plain_result("❌无法识别来源"); event.stop_event(); return
-        if group_id not in self.games: yield event.plain_result("ℹ️无等待中游戏"); event.stop_event(); return
+        if group_id not in self.games: yield event.plain_result(self._no_game_text(group_id, "ℹ️无等待中游戏")); event.stop_event(); return
         game_instance = self.games[group_id]
-        try: game_instance.add_player(user_id, user_name); player_count = len(game_instance.state.players); yield event.chain_result(build_join_message(user_id, user_name, player_count, is_ai=False))
+        if user_id not in game_instance.state.players:
+            # 同一群内每人同时只能在一张牌桌
+            other_key = next((key for key in self._group_tables.get(split_table_key(group_id)[0], ()) if key != group_id and key in self.games and user_id in self.games[key].state.players), None)
+            if other_key: yield event.plain_result(f"⚠️你已在牌桌「{split_table_key(other_key)[1] or '默认'}」中"); event.stop_event(); return
+            tournament = self.tournaments.get(split_table_key(group_id)[0]) # 锦标赛选手随时可能被排进下一张锦标赛牌桌
+            if tournament and tournament.status in (TOURNAMENT_SIGNUP, TOURNAMENT_RUNNING) and user_id in tournament.entrants: yield event.plain_result("⚠️你已报名本群的锦标赛，锦标赛结束前不能加入其他牌桌" + ("\n➡️ /酒馆锦标赛 退出 可取消报名" if tournament.status == TOURNAMENT_SIGNUP else "")); event.stop_event(); return
+            max_players = self._max_table_players()
+            if game_instance.state.status == GameStatus.WAITING and len(game_instance.state.players) >= max_players: yield event.plain_result(f"⚠️人数已达上限({max_players})"); event.stop_event(); return
+        try: game_instance.add_player(user_id, user_name); player_count = len(game_instance.state.players); yield event.chain_result(self._to_framework(build_join_message(user_id, user_name, player_count, is_ai=False)))
         except GameError as e: yield event.plain_result(f"⚠️加入失败:{e}")
         except Exception as e: logger.error(f"加入错误:{e}", exc_info=True); yield event.plain_result("❌加入内部错误")
         if not event.is_stopped(): event.stop_event(); return
     @filter.command("添加AI", alias={'addai', '加AI'})
-    async def add_ai_player(self, event: AstrMessageEvent, count: int = 1): # ... (代码同上) ...
-        group_id = self._get_group_id(event)
+    @_with_game_session
+    async def add_ai_player(self, event: AstrMessageEvent, count: int = 1, table: str = ""): # ... (代码同上) ...
+        group_id = self._resolve_table_key(event, table)
         if not group_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
-        if group_id not in self.games: yield event.plain_result("ℹ️无等待中游戏"); event.stop_event(); return
+        if group_id not in self.games: yield event.plain_result(self._no_game_text(group_id, "ℹ️无等待中游戏")); event.stop_event(); return
         game_instance = self.games[group_id]
         if game_instance.state.status != GameStatus.WAITING: yield event.plain_result("⚠️游戏非等待状态"); event.stop_event(); return
         requested_count = count # 保存原始请求数量
         if count <= 0: yield event.plain_result("⚠️数量需>0"); event.stop_event(); return
-        added_count = 0; max_players = 8; current_players = len(game_instance.state.players)
+        added_count = 0; max_players = self._max_table_players(); current_players = len(game_instance.state.players)
         adjusted_count = count # 调整后的数量
         if current_players + count > max_players:
              adjusted_count = max_players - current_players
              if adjusted_count <= 0: yield event.plain_result(f"⚠️人数已达上限({max_players})"); event.stop_event(); return
              if adjusted_count != requested_count: yield event.plain_result(f"⚠️ 最多只能再加 {adjusted_count} 个 AI。")
-        ai_names = [f"AI-{i}" for i in range(1,10)]; used_names = {p.name for p in game_instance.state.players.values()}; messages = []
+        used_names = {p.name for p in game_instance.state.players.values()}; messages = []; ai_number = 1
         for i in range(adjusted_count): # 使用调整后的数量
-            ai_id = f"ai_{group_id}_{random.randint(10000,99999)}_{i}"; ai_name = f"AI牌手{i+1}"; # 在ID中包含group_id可能有助于调试
-            for name in ai_names:
-                 if name not in used_names: ai_name=name; break
+            ai_id = f"ai_{group_id}_{random.randint(10000,99999)}_{i}"; # 在ID中包含group_id可能有助于调试
+            while f"AI-{ai_number}" in used_names: ai_number += 1
+            ai_name = f"AI-{ai_number}"
             try: game_instance.add_player(ai_id, ai_name); game_instance.state.players[ai_id].is_ai = True; used_names.add(ai_name); added_count += 1; player_count = len(game_instance.state.players); messages.append(build_join_message(ai_id, ai_name, player_count, is_ai=True))
             except GameError as e: yield event.plain_result(f"⚠️添加第{i+1}个AI失败:{e}"); break
             except Exception as e: logger.error(f"添加AI错误:{e}",exc_info=True); yield event.plain_result(f"❌添加第{i+1}个AI内部错误"); break
-        if messages: combined = []; [combined.extend(m + [Comp.Plain("\n")]) for m in messages]; yield event.chain_result(combined[:-1]) # 合并消息
+        if messages: combined = []; [combined.extend(m + [Comp.Plain("\n")]) for m in messages]; yield event.chain_result(self._tag_components(group_id, combined[:-1])) # 合并消息
         if not event.is_stopped(): event.stop_event(); return
     @filter.command("开始", alias={'start'})
-    async def start_game_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
-        group_id = self._get_group_id(event); user_id = self._get_user_id(event)
+    @_with_game_session
+    async def start_game_cmd(self, event: AstrMessageEvent, table: str = ""): # ... (代码同上) ...
+        group_id = self._resolve_table_key(event, table); user_id = self._get_user_id(event)
         if not group_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
-        if group_id not in self.games: yield event.plain_result("ℹ️无游戏"); event.stop_event(); return
+        if group_id not in self.games: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏")); event.stop_event(); return
         game_instance = self.games[group_id]
         if game_instance.state.status != GameStatus.WAITING: yield event.plain_result(f"⚠️非等待状态"); event.stop_event(); return
         if len(game_instance.state.players) < MIN_PLAYERS: yield event.plain_result(f"❌至少需{MIN_PLAYERS}人"); event.stop_event(); return
-        pm_failures = []
         try:
-            start_result = game_instance.start_game()
-            if not start_result or not start_result.get("success"): yield event.plain_result(f"❌启动失败:{start_result.get('error','未知')}"); event.stop_event(); return
-            hands = start_result.get("initial_hands",{}); card = start_result.get("main_card"); first_pid = start_result.get("first_player_id"); first_is_ai = False
-            if first_pid and first_pid in game_instance.state.players: first_is_ai = game_instance.state.players[first_pid].is_ai; start_result['first_player_is_ai'] = first_is_ai
-            logger.info(f"游戏 {group_id} 开始。主牌:{card}")
-            for pid, hand in hands.items():
-                 player_data = game_instance.state.players.get(pid)
-                 if player_data and not player_data.is_ai:
-                      if not await self._send_hand_update(event, group_id, pid, hand, card):
-                           pm_failures.append({'id': pid, 'name': player_data.name})
-            start_comps = build_start_game_message(start_result); yield event.chain_result(start_comps)
-            if pm_failures: failed_mentions = []; [failed_mentions.extend([Comp.At(qq=detail['id']), Comp.Plain(f"({detail['name']})"), Comp.Plain(", ")]) for detail in pm_failures]; yield event.chain_result([Comp.Plain("⚠️未能向 ")] + failed_mentions[:-1] + [Comp.Plain(" 发送私信。")])
-            if first_is_ai and first_pid: logger.info(f"首位AI({start_result.get('first_player_name')})行动"); await asyncio.sleep(1.0); await self._trigger_next_turn(event, group_id, first_pid, start_result.get('first_player_name','AI')) # !! 传递 event !!
-        except GameError as e: yield event.plain_result(f"⚠️启动失败:{e}")
-        except Exception as e: logger.error(f"开始游戏错误:{e}",exc_info=True); yield event.plain_result("❌开始内部错误")
+            start_result, pm_failures = await self._begin_game(event, group_id, game_instance)
+            if not start_result.get("success"): yield event.plain_result(f"❌启动失败:{start_result.get('error','未知')}"); event.stop_event(); return
+            start_comps = build_start_game_message(start_result); yield event.chain_result(self._tag_components(group_id, start_comps))
+            if pm_failures: yield event.chain_result(self._pm_failure_components(pm_failures))
+            await self._begin_first_turn(event, group_id, start_result)
+        except GameError as e: self._dump_trace(group_id, "启动失败"); yield event.plain_result(f"⚠️启动失败:{e}")
+        except Exception as e: logger.error(f"开始游戏错误:{e}",exc_info=True); self._dump_trace(group_id, "开始游戏错误"); yield event.plain_result("❌开始内部错误")
         if not event.is_stopped(): event.stop_event(); return
+    async def _begin_game(self, event: AstrMessageEvent, group_id: str, game_instance: LiarDiceGame) -> Tuple[Dict[str, Any], List[Dict[str, str]]]:
+        """开局: 引擎发牌、启动录制/聊天记录/提供方预热，并私信初始手牌；返回 (开局结果, 私信失败的玩家)。开局失败时结果的 success 为 False"""
+        with self.metrics.span("engine.start_game", group_id): start_result = game_instance.start_game()
+        if not start_result or not start_result.get("success"): return start_result or {}, []
+        hands = start_result.get("initial_hands",{}); card = start_result.get("main_card"); first_pid = start_result.get("first_player_id"); pm_failures = []
+        if first_pid and first_pid in game_instance.state.players: start_result['first_player_is_ai'] = game_instance.state.players[first_pid].is_ai
+        logger.info(f"游戏 {group_id} 开始。主牌:{card}")
+        if self.replay_archive: self._replay_recorders[group_id] = ReplayRecorder(group_id, game_instance.state)
+        self._update_chat_recording(group_id, game_instance); self._ensure_metrics_exporter(); self._start_provider_warmup(group_id, game_instance)
+        if self.hand_delivery: self.hand_delivery.forget_table(group_id) # 新的一局从完整手牌开始
+        for pid, hand in hands.items():
+             player_data = game_instance.state.players.get(pid)
+             if player_data and not player_data.is_ai:
+                  if not await self._send_hand_update(event, group_id, pid, hand, card):
+                       pm_failures.append({'id': pid, 'name': player_data.name})
+        return start_result, pm_failures
+    async def _begin_first_turn(self, event: AstrMessageEvent, group_id: str, start_result: Dict[str, Any]) -> None:
+        first_pid = start_result.get("first_player_id")
+        if start_result.get("first_player_is_ai") and first_pid: logger.info(f"首位AI({start_result.get('first_player_name')})行动"); await asyncio.sleep(1.0); await self._trigger_next_turn(event, group_id, first_pid, start_result.get('first_player_name','AI')) # !! 传递 event !!
+        elif first_pid: self._schedule_turn_timeout(event, group_id, first_pid)
+    @staticmethod
+    def _pm_failure_components(pm_failures: List[Dict[str, str]]) -> List[Any]:
+        failed_mentions = []; [failed_mentions.extend([Comp.At(qq=detail['id']), Comp.Plain(f"({detail['name']})"), Comp.Plain(", ")]) for detail in pm_failures]
+        return [Comp.Plain("⚠️未能向 ")] + failed_mentions[:-1] + [Comp.Plain(" 发送私信。")]
+    @_with_game_session
     async def _handle_human_action(self, event: AstrMessageEvent, action_type: str, params: Optional[Any] = None): # ... (代码同上) ...
-        group_id = self._get_group_id(event); player_id = self._get_user_id(event)
+        group_id = self._resolve_table_key(event); player_id = self._get_user_id(event)
         if not group_id or not player_id: yield event.plain_result("❌无法识别来源"); event.stop_event(); return
         game_instance = self.games.get(group_id)
-        if not game_instance: yield event.plain_result("ℹ️无游戏"); event.stop_event(); return
+        if not game_instance: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏")); event.stop_event(); return
         player_data = game_instance.state.players.get(player_id)
         if player_data and player_data.is_ai: yield event.plain_result("🤖AI请勿用命令"); event.stop_event(); return
         # !! event 对象将传递下去 !!
-        result = None
-        try:
-            if action_type == "play": result = game_instance.process_play_card(player_id, params)
-            elif action_type == "challenge": result = game_instance.process_challenge(player_id)
-            elif action_type == "wait": result = game_instance.process_wait(player_id)
-            else: raise ValueError(f"未知动作:{action_type}")
-        except GameError as e: error_string = build_error_message(e, game_instance, player_id); yield event.plain_result(error_string); event.stop_event(); return
-        except Exception as e: logger.error(f"处理玩家{player_id}动作'{action_type}'错误:{e}",exc_info=True); error_string=build_error_message(e); yield event.plain_result(error_string); event.stop_event(); return
-        if result:
-            await self._process_and_broadcast_result(event, group_id, result, player_id) # !! 传递 event !!
-            if group_id not in self.games: event.stop_event(); return
-            if not result.get("game_ended", False):
-                 next_pid = result.get("next_player_id"); next_pname = result.get("next_player_name")
-                 if next_pid and next_pname is not None: await asyncio.sleep(0.1); await self._trigger_next_turn(event, group_id, next_pid, next_pname) # !! 传递 event !!
-                 else: await self._trigger_next_turn_safe(event, group_id) # !! 传递 event !!
+        result = None; error_string = None
+        with self._profile_section(group_id):
+            try:
+                with self.metrics.span(f"engine.{action_type}", group_id):
+                    if action_type == "play": result = game_instance.process_play_card(player_id, params)
+                    elif action_type == "challenge": result = game_instance.process_challenge(player_id)
+                    elif action_type == "wait": result = game_instance.process_wait(player_id)
+                    else: raise ValueError(f"未知动作:{action_type}")
+            except GameError as e: error_string = build_error_message(e, game_instance, player_id)
+            except Exception as e: logger.error(f"处理玩家{player_id}动作'{action_type}'错误:{e}",exc_info=True); self._dump_trace(group_id, "处理玩家动作错误"); error_string=build_error_message(e)
+            if result and error_string is None:
+                await self._process_and_broadcast_result(event, group_id, result, player_id) # !! 传递 event !!
+                if group_id in self.games and not result.get("game_ended", False):
+                     next_pid = result.get("next_player_id"); next_pname = result.get("next_player_name")
+                     if next_pid and next_pname is not None: await asyncio.sleep(0.1); await self._trigger_next_turn(event, group_id, next_pid, next_pname) # !! 传递 event !!
+                     else: await self._trigger_next_turn_safe(event, group_id) # !! 传递 event !!
+        if error_string: yield event.plain_result(error_string); event.stop_event(); return
+        if result: await self._profile_turn_done(event, group_id)
         if not event.is_stopped(): event.stop_event()
     @filter.command("出牌", alias={'play', '打出'})
     async def play_cards_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
+        if self._is_duplicate_event(event): event.stop_event(); return
         card_indices_1based = []; parse_error = None
-        try:
-            full_msg = event.message_str.strip(); match = re.match(r'^\S+\s+(.*)', full_msg)
-            param_part = match.group(1).strip() if match else ""
-            if not param_part:
-                 command_name = getattr(event, 'command_name', ''); prefix = getattr(self.context.get_config(), 'command_prefix', '/'); full_command = prefix + command_name if command_name else ""
-                 if full_msg == full_command or (command_name and full_msg.startswith(command_name)): parse_error = f"请提供1-{MAX_PLAY_CARDS}个编号。"
-                 else: parse_error = "未找到有效数字编号。"
-            else:
-                indices_str = re.findall(r'\d+', param_part)
-                if not indices_str: parse_error = "未找到有效数字编号。"
-                else: card_indices_1based = [int(s) for s in indices_str]; assert card_indices_1based
-        except (ValueError, AssertionError): parse_error = "编号必须是数字。"
-        except Exception as e: parse_error = f"解析错误:{e}"
+        with self.metrics.span("command_parse", self._get_group_id(event)):
+            try:
+                full_msg = event.message_str.strip(); match = re.match(r'^\S+\s+(.*)', full_msg)
+                param_part = match.group(1).strip() if match else ""
+                if not param_part:
+                     command_name = getattr(event, 'command_name', ''); prefix = getattr(self.context.get_config(), 'command_prefix', '/'); full_command = prefix + command_name if command_name else ""
+                     if full_msg == full_command or (command_name and full_msg.startswith(command_name)): parse_error = f"请提供1-{MAX_PLAY_CARDS}个编号。"
+                     else: parse_error = "未找到有效数字编号。"
+                else:
+                    indices_str = re.findall(r'\d+', param_part)
+                    if not indices_str: parse_error = "未找到有效数字编号。"
+                    else: card_indices_1based = [int(s) for s in indices_str]; assert card_indices_1based
+            except (ValueError, AssertionError): parse_error = "编号必须是数字。"
+            except Exception as e: parse_error = f"解析错误:{e}"
         if parse_error: yield event.plain_result(f"❌命令错误:{parse_error}"); event.stop_event(); return
         async for _ in self._handle_human_action(event, "play", card_indices_1based): yield _
     @filter.command("质疑", alias={'challenge', '抓'})
     async def challenge_play_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
+        if self._is_duplicate_event(event): event.stop_event(); return
         async for _ in self._handle_human_action(event, "challenge"): yield _
     @filter.command("等待", alias={'wait', 'pass', '过'})
     async def wait_turn_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
+        if self._is_duplicate_event(event): event.stop_event(); return
         async for _ in self._handle_human_action(event, "wait"): yield _
     @filter.command("状态", alias={'status', '游戏状态'})
-    async def game_status_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
-        group_id = self._get_group_id(event); player_id = self._get_user_id(event)
+    @_with_game_session
+    async def game_status_cmd(self, event: AstrMessageEvent, table: str = ""): # ... (代码同上) ...
+        group_id = self._resolve_table_key(event, table); player_id = self._get_user_id(event)
         if not group_id: yield event.plain_result("群聊命令"); event.stop_event(); return
-        if group_id not in self.games: yield event.plain_result("ℹ️无游戏"); event.stop_event(); return
+        if group_id not in self.games: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏")); event.stop_event(); return
         game_instance = self.games[group_id]
-        try: yield event.chain_result(build_game_status_message(game_instance.state, player_id))
+        shot_odds = game_instance.shot_risk() if self.config.get("show_shot_odds", False) and game_instance.state.status == GameStatus.PLAYING else None
+        try: yield event.chain_result(self._tag_components(group_id, build_game_status_message(game_instance.state, player_id, shot_odds)))
         except Exception as e: logger.error(f"获取状态错误:{e}"); yield event.plain_result("❌获取状态内部错误")
         if not event.is_stopped(): event.stop_event(); return
     @filter.command("我的手牌", alias={'hand', '手牌'})
+    @_with_game_session
     async def show_my_hand_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
-        group_id = self._get_group_id(event); user_id = self._get_user_id(event)
+        group_id = self._resolve_table_key(event); user_id = self._get_user_id(event)
         if not group_id or not user_id: yield event.plain_result("❌无法识别来源"); event.stop_event(); return
-        if group_id not in self.games: yield event.plain_result("ℹ️无游戏"); event.stop_event(); return
+        if group_id not in self.games: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏")); event.stop_event(); return
         game_instance = self.games[group_id]; player_data = game_instance.state.players.get(user_id)
         if not player_data: yield event.plain_result("ℹ️未参与"); event.stop_event(); return
         if player_data.is_ai: yield event.plain_result("🤖AI无需查牌"); event.stop_event(); return
         if player_data.is_eliminated: yield event.plain_result("☠️已淘汰"); event.stop_event(); return
-        success = await self._send_hand_update(event, group_id, user_id, player_data.hand, game_instance.state.main_card)
+        wait = self.hand_delivery.throttle_remaining(group_id, user_id, tuple(player_data.hand), game_instance.state.main_card) if self.hand_delivery else 0.0
+        if wait > 0: yield event.plain_result(f"🤫手牌没有变化，请查看之前的私信 ({wait:.0f} 秒后可再次获取)"); event.stop_event(); return
+        success = await self._send_hand_update(event, group_id, user_id, player_data.hand, game_instance.state.main_card, force=True)
         if success: yield event.plain_result("🤫已私信")
         else: yield event.chain_result([ Comp.At(qq=user_id), Comp.Plain(text="，私信失败，请检查好友或设置。") ])
         if not event.is_stopped(): event.stop_event(); return
     @filter.command("结束游戏", alias={'endgame', '强制结束'})
-    async def force_end_game_cmd(self, event: AstrMessageEvent): # ... (代码同上) ...
-        group_id = self._get_group_id(event); user_id = self._get_user_id(event); user_name = event.get_sender_name() or "未知用户"
+    @_with_game_session
+    async def force_end_game_cmd(self, event: AstrMessageEvent, table: str = ""): # ... (代码同上) ...
+        group_id = self._resolve_table_key(event, table); user_id = self._get_user_id(event); user_name = event.get_sender_name() or "未知用户"
         if not group_id: yield event.plain_result("群聊命令"); event.stop_event(); return
         if group_id in self.games:
-            if group_id in self.active_ai_tasks: task = self.active_ai_tasks.pop(group_id); task.cancel()
+            task = self.active_ai_tasks.pop(group_id, None)
+            if task and task is not asyncio.current_task(): task.cancel()
             game_instance = self.games.pop(group_id); game_status = game_instance.state.status.name if game_instance else '未知'
+            self._release_group_resources(group_id); self._on_table_ended(group_id, None) # 锦标赛牌桌被强制结束时无人晋级
             logger.info(f"[群{group_id}]游戏被{user_name}({user_id})强制结束(原状态:{game_status})")
-            yield event.plain_result("🛑游戏已被强制结束。")
-        else: yield event.plain_result("ℹ️无游戏")
+            yield event.plain_result(f"🛑{'牌桌「' + split_table_key(group_id)[1] + '」的' if split_table_key(group_id)[1] else ''}游戏已被强制结束。")
+        else: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏"))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.command("牌桌", alias={'tables', '桌子'})
+    async def list_tables_cmd(self, event: AstrMessageEvent):
+        group_id = self._get_group_id(event)
+        if not group_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
+        keys = sorted(self._group_tables.get(group_id, ()))
+        if not keys: yield event.plain_result("ℹ️本群暂无牌桌\n➡️ /骗子酒馆 [桌名] 开一桌"); event.stop_event(); return
+        lines = [f"🍻 本群牌桌 ({len(keys)}/{max(1, int(self.config.get('max_tables_per_group', 3)))})"]
+        for key in keys:
+            game_instance = self.games.get(key)
+            if not game_instance: continue
+            state = game_instance.state; line = f"- {split_table_key(key)[1] or '默认'}: {state.status.name} {len(state.players)}人"
+            if state.status == GameStatus.PLAYING: line += f"，存活 {sum(1 for p in state.players.values() if not p.is_eliminated)}，轮到 {game_instance.get_current_player_name() or '未知'}"
+            lines.append(line)
+        lines.append("➡️ 命令后加桌名可指定牌桌 (如 /加入 桌名)；出牌/质疑/等待/手牌会自动对应你所在的牌桌")
+        yield event.plain_result("\n".join(lines))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.command("酒馆锦标赛", alias={'liarcup', '锦标赛'})
+    async def tournament_cmd(self, event: AstrMessageEvent, action: str = "", arg: str = ""):
+        group_id = self._get_group_id(event); user_id = self._get_user_id(event); user_name = event.get_sender_name() or f"用户{(user_id or '')[:4]}"
+        if not group_id or not user_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
+        tournament = self.tournaments.get(group_id); action = action.strip(); arg = str(arg).strip()
+        usage = "➡️ /酒馆锦标赛 创建 [每桌人数] | 报名 | 退出 | AI [数量] | 开赛 | 对阵 | 取消"
+        if action in ("", "对阵", "状态"): yield event.plain_result("\n".join(tournament.bracket_lines()) if tournament else f"ℹ️本群暂无锦标赛\n{usage}")
+        elif action == "创建":
+            if self.state_store.shared: yield event.plain_result("⚠️共享状态后端下不支持锦标赛 (赛程只保存在本节点)")
+            elif tournament: yield event.plain_result(f"⏳本群已有锦标赛 ({tournament.status})\n➡️ /酒馆锦标赛 对阵 查看")
+            else:
+                table_size = max(MIN_PLAYERS, min(int(arg) if arg.isdigit() else int(self.config.get("tournament_table_size", 4)), self._max_table_players()))
+                self.tournaments[group_id] = Tournament(group_id, user_id, table_size, int(self.config.get("tournament_max_live_tables", 8)), int(self.config.get("tournament_max_entrants", 64)))
+                self._tournament_events[group_id] = event; logger.info(f"[群{group_id}] {user_id} 创建锦标赛，每桌 {table_size} 人")
+                yield event.plain_result(f"🏆 骗子酒馆锦标赛开放报名！每桌 {table_size} 人，各桌胜者晋级下一轮，直到决出冠军。\n➡️ /酒馆锦标赛 报名\n➡️ 发起者({user_name}) 可 /酒馆锦标赛 AI [数量] 加入 AI 选手，/酒馆锦标赛 开赛 开始。")
+        elif tournament is None: yield event.plain_result(f"ℹ️本群暂无锦标赛\n{usage}")
+        elif action == "报名":
+            seated = next((key for key in self._group_tables.get(group_id, ()) if key in self.games and user_id in self.games[key].state.players), None)
+            if seated: yield event.plain_result(f"⚠️你正在牌桌「{split_table_key(seated)[1] or '默认'}」中，结束后再报名")
+            else:
+                try: count = tournament.sign_up(Entrant(user_id, user_name)); yield event.chain_result([Comp.At(qq=user_id), Comp.Plain(f" ({user_name}) 报名成功，当前 {count} 人。")])
+                except TournamentError as e: yield event.plain_result(f"⚠️{e}")
+        elif action == "退出":
+            try: tournament.withdraw(user_id); yield event.plain_result(f"👋 {user_name} 已退出报名，当前 {len(tournament.entrants)} 人。")
+            except TournamentError as e: yield event.plain_result(f"⚠️{e}")
+        elif user_id != tournament.organizer_id: yield event.plain_result("⚠️只有锦标赛发起者可以执行此操作")
+        elif action.upper() == "AI":
+            count = int(arg) if arg.isdigit() else 1; used_names = {e.name for e in tournament.entrants.values()}; added = 0; ai_number = 1
+            try:
+                for _ in range(max(0, count)):
+                    while f"AI-{ai_number}" in used_names: ai_number += 1
+                    ai_name = f"AI-{ai_number}"; tournament.sign_up(Entrant(f"ai_{group_id}_cup{random.randint(10000,99999)}_{len(tournament.entrants)}", ai_name, is_ai=True)); used_names.add(ai_name); added += 1
+            except TournamentError as e: yield event.plain_result(f"⚠️{e}")
+            if added: yield event.plain_result(f"🤖 已加入 {added} 名 AI 选手，当前 {len(tournament.entrants)} 人。")
+        elif action == "开赛":
+            try: matches = tournament.start()
+            except TournamentError as e: yield event.plain_result(f"⚠️{e}"); event.stop_event(); return
+            self._tournament_events[group_id] = event; logger.info(f"[群{group_id}] 锦标赛开赛: {len(tournament.entrants)} 人 / 首轮 {len(matches)} 桌")
+            yield event.plain_result("\n".join(tournament.bracket_lines() + ["➡️ 各桌依次开局，出牌/质疑/等待会自动对应你所在的牌桌。"]))
+            self._spawn_tournament_task(self._pump_tournament(group_id))
+        elif action == "取消": ended = await self._cancel_tournament(group_id, tournament); yield event.plain_result(f"🛑 锦标赛已取消{f'，强制结束 {ended} 张进行中的牌桌' if ended else ''}。")
+        else: yield event.plain_result(usage)
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.command("酒馆战绩", alias={'liarme', '我的战绩'})
+    async def player_stats_cmd(self, event: AstrMessageEvent):
+        group_id = self._get_group_id(event); user_id = self._get_user_id(event); user_name = event.get_sender_name() or "你"
+        if not self.player_stats: yield event.plain_result("ℹ️战绩统计未启用 (配置 enable_player_stats)"); event.stop_event(); return
+        if not user_id: yield event.plain_result("❌无法获取用户ID"); event.stop_event(); return
+        try:
+            group_row = await self.player_stats.player(group_id, user_id) if group_id else None
+            global_row = await self.player_stats.player(GLOBAL_SCOPE, user_id)
+        except Exception as e: logger.error(f"查询战绩失败: {e}", exc_info=True); yield event.plain_result("❌战绩查询失败，请稍后再试"); event.stop_event(); return
+        yield event.plain_result(build_player_stats_message(user_name, group_row, global_row))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.command("酒馆排行", alias={'liarrank', '排行榜'})
+    async def leaderboard_cmd(self, event: AstrMessageEvent, metric: str = "胜场", scope: str = ""):
+        if not self.player_stats: yield event.plain_result("ℹ️战绩统计未启用 (配置 enable_player_stats)"); event.stop_event(); return
+        if metric in ("全局", "all"): metric, scope = "胜场", metric # 允许 /酒馆排行 全局
+        metric = LEADERBOARD_ALIASES.get(metric.lower(), metric)
+        if metric not in LEADERBOARD_METRICS: yield event.plain_result(f"❌未知排行指标，可选: {'/'.join(LEADERBOARD_METRICS)}"); event.stop_event(); return
+        group_id = self._get_group_id(event); is_global = scope in ("全局", "all") or not group_id
+        min_games = max(1, int(self.config.get("leaderboard_min_games", 5)))
+        try: rows = await self.player_stats.leaderboard(GLOBAL_SCOPE if is_global else group_id, metric, limit=10, min_games=min_games)
+        except Exception as e: logger.error(f"查询排行榜失败: {e}", exc_info=True); yield event.plain_result("❌排行榜查询失败，请稍后再试"); event.stop_event(); return
+        yield event.plain_result(build_leaderboard_message("全局" if is_global else "本群", metric, rows, min_games))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.command("酒馆回放", alias={'liarreplay', '回放'})
+    async def replay_cmd(self, event: AstrMessageEvent, replay_id: str = ""):
+        group_id = self._get_group_id(event)
+        if not self.replay_archive: yield event.plain_result("ℹ️回放未启用 (配置 enable_replays；共享状态后端下不可用)"); event.stop_event(); return
+        if not group_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
+        try:
+            if not replay_id:
+                rows = await self.replay_archive.recent(group_id)
+                if not rows: yield event.plain_result("ℹ️本群还没有回放记录"); event.stop_event(); return
+                lines = ["📼 本群最近的对局回放"] + [f"#{rid} {time.strftime('%m-%d %H:%M', time.localtime(ended))} {table_name + ' ' if table_name else ''}{players}人 胜者:{winner or '无'} ({size}B)" for rid, table_name, ended, players, winner, size in rows]
+                lines.append("➡️ /酒馆回放 编号 获取回放码")
+                yield event.plain_result("\n".join(lines)); event.stop_event(); return
+            record = await self.replay_archive.get(int(replay_id.lstrip("#"))) if replay_id.lstrip("#").isdigit() else None
+        except Exception as e: logger.error(f"查询回放失败: {e}", exc_info=True); yield event.plain_result("❌回放查询失败，请稍后再试"); event.stop_event(); return
+        if not record or record[0] != group_id: yield event.plain_result(f"❌本群没有编号为 {replay_id} 的回放"); event.stop_event(); return
+        replay = decode_replay(record[1]); winner = replay.winner
+        yield event.plain_result(f"📼 回放 #{replay_id.lstrip('#')}: {len(replay.seats)}人 {replay.turn_count}回合 胜者:{winner.name if winner else '无'} ({len(record[1])}B)\n回放码:\n{replay_to_code(record[1])}\n➡️ 本地查看: python benchmarks/replay_viewer.py --code <回放码>")
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("酒馆统计", alias={'liarstats'})
+    async def plugin_stats_cmd(self, event: AstrMessageEvent):
+        stats = self.chat_record_stats; recording = len(self._chat_record_groups)
+        lines = ["📊 骗子酒馆运行统计", f"进行中牌桌: {len(self.games)} (分布于 {len(self._group_tables)} 个群) | AI 任务: {len(self.active_ai_tasks)}",
+                 f"聊天记录: 快速跳过 {stats['fast_path']} 条 / 已记录 {stats['recorded']} 条 (记录中的群: {recording})"]
+        lines.extend(f"LLM {health.summary()}" for health in self._provider_health.values())
+        first, steady = self.ai_llm_latency["first"], self.ai_llm_latency["steady"]
+        if self.hand_images: lines.append(self.hand_images.summary())
+        if self.hand_delivery: lines.append(self.hand_delivery.summary())
+        if self.llm_gate: lines.append(self.llm_gate.summary())
+        if self.tournaments: lines.append(f"锦标赛: {len(self.tournaments)} 个 (进行中牌桌 {len(self._tournament_tables)})")
+        if self.event_deduper: lines.append(f"重复事件: 已丢弃 {self.event_deduper.dropped} / 检查 {self.event_deduper.checked} 条 (窗口 {self.event_deduper.window:g}s，索引 {len(self.event_deduper)} 条)")
+        if first.count or steady.count: lines.append(f"AI LLM 耗时: 开局首次 {first.count} 次 均值 {first.avg_ms:.0f}ms / 稳态 {steady.count} 次 均值 {steady.avg_ms:.0f}ms p90 {steady.percentile(0.9):.0f}ms")
+        if self.config.get("ai_batch_turns", False): plan = self.ai_plan_stats; lines.append(f"AI 批量计划: {plan['plans']} 次，执行 {plan['moves_applied']} 步 / 作废 {plan['moves_discarded']} 步")
+        if self.replay_archive: lines.append(f"回放: 录制中 {len(self._replay_recorders)} 局 / 已保存 {self.replay_archive.saved} 局")
+        lines.append(f"对手画像: {len(self.opponent_model)} 名玩家 (淘汰 {self.opponent_model.evicted})")
+        if self.player_stats: lines.append(f"战绩落盘: {self.player_stats.flushed_batches} 批 / {self.player_stats.flushed_rows} 行，待写 {self.player_stats.pending_rows} 行")
+        if self._memory_report: lines.append(f"内存估算 ({time.strftime('%H:%M:%S', time.localtime(self._memory_report.taken_at))}): 共 {format_bytes(self._memory_report.total)}，详见 /酒馆内存")
+        yield event.plain_result("\n".join(lines))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("酒馆内存", alias={'liarmem'})
+    async def memory_report_cmd(self, event: AstrMessageEvent, action: str = "", arg: str = ""):
+        """估算各群占用的内存 (可带前 N 个群)；快照 / 对比 / 停止 用 tracemalloc 查看两次快照之间增长最多的分配位置"""
+        if action in ("快照", "snapshot"):
+            summary = await asyncio.to_thread(self.tracemalloc_diff.snapshot)
+            yield event.plain_result(f"📸 {summary}\n➡️ 过一段时间后用 /酒馆内存 对比 查看增长，/酒馆内存 停止 关闭追踪 (追踪期间内存分配变慢)")
+        elif action in ("对比", "diff"):
+            try: limit = max(1, min(int(arg or 10), 30))
+            except ValueError: yield event.plain_result("❌条数需为数字"); event.stop_event(); return
+            try: lines = await asyncio.to_thread(self.tracemalloc_diff.diff, limit)
+            except RuntimeError as e: yield event.plain_result(f"ℹ️{e}，请先 /酒馆内存 快照"); event.stop_event(); return
+            yield event.plain_result("🔍 tracemalloc " + "\n".join(lines))
+        elif action in ("停止", "stop"): self.tracemalloc_diff.stop(); yield event.plain_result("⏹️已停止 tracemalloc 追踪并丢弃基准快照")
+        else:
+            try: top_n = max(0, min(int(action) if action else int(self.config.get("memory_report_top_groups", 10)), 50))
+            except ValueError: yield event.plain_result("❌用法: /酒馆内存 [前N个群 | 快照 | 对比 [条数] | 停止]"); event.stop_event(); return
+            report = await self._measure_memory(); yield event.plain_result("\n".join(report.lines(top_n)))
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("酒馆延迟", alias={'liarlatency'})
+    async def latency_stats_cmd(self, event: AstrMessageEvent, scope: str = ""):
+        if not self.metrics.enabled: yield event.plain_result("ℹ️延迟统计未启用 (配置 enable_latency_metrics)"); event.stop_event(); return
+        group_id = self._get_group_id(event)
+        if scope in ("全局", "all") or not group_id: title = "⏱️ 全局延迟"; summary = self.metrics.format_summary()
+        else: target = scope if scope.isdigit() else self._resolve_table_key(event, scope, infer=False); title = f"⏱️ 群 {self._table_label(target)} 延迟"; summary = self.metrics.format_summary(target) # 纯数字为其他群号，否则为本群桌名 (空为默认桌)
+        yield event.plain_result(f"{title}\n{summary}")
+        if not event.is_stopped(): event.stop_event(); return
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("酒馆性能分析", alias={'liarprofile'})
+    async def profile_table_cmd(self, event: AstrMessageEvent, turns: str = "5"):
+        group_id = self._resolve_table_key(event)
+        if not group_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
+        if turns in ("停止", "stop"):
+            if self._profiler and self._profiler.group_id == group_id: yield event.plain_result("⏹️停止性能分析并输出结果..."); await self._profile_turn_done(event, group_id, force=True)
+            else: yield event.plain_result("ℹ️本群没有进行中的性能分析")
+            event.stop_event(); return
+        if self._profiler: yield event.plain_result(f"⚠️群 {self._profiler.group_id} 正在进行性能分析 (剩余 {self._profiler.turns_remaining} 回合)，同一时间只能分析一个群"); event.stop_event(); return
+        try: turn_count = int(turns)
+        except ValueError: yield event.plain_result("❌回合数需为数字"); event.stop_event(); return
+        turn_count = max(1, min(turn_count, 50))
+        output_dir = self.config.get("profile_output_dir", "data/liar_tavern_profiles")
+        self._profiler = TableProfiler(group_id, turn_count, output_dir)
+        logger.info(f"[群{group_id}] 开始性能分析，覆盖接下来 {turn_count} 个回合")
+        yield event.plain_result(f"🔬 已开始分析本群接下来 {turn_count} 个回合 (命令处理 / AI 回合 / 结果广播)")
+        if not event.is_stopped(): event.stop_event(); return
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("酒馆追踪", alias={'liartrace'})
+    async def trace_table_cmd(self, event: AstrMessageEvent, count: str = "30", table: str = ""):
+        """私信管理员本牌桌最近的引擎事件 (含手牌与弹膛，不能发到群里)，同时写入日志"""
+        group_id = self._resolve_table_key(event, table); user_id = self._get_user_id(event)
+        if not group_id or not user_id: yield event.plain_result("❌群聊命令"); event.stop_event(); return
+        game_instance = self.games.get(group_id)
+        if not game_instance: yield event.plain_result(self._no_game_text(group_id, "ℹ️无游戏")); event.stop_event(); return
+        try: limit = max(1, int(count))
+        except ValueError: yield event.plain_result("❌条数需为数字"); event.stop_event(); return
+        lines = game_instance.trace.lines(limit)
+        if not lines: yield event.plain_result("ℹ️没有追踪记录 (engine_trace_size 为 0 或尚无事件)"); event.stop_event(); return
+        game_instance.trace.dump(logger, f"[群{group_id}] 管理员 {user_id} 查看追踪，", limit)
+        header = f"🧾 牌桌 {self._table_label(group_id)} 最近 {len(lines)} 条引擎事件 (累计 {game_instance.trace.recorded}，容量 {game_instance.trace.capacity}):\n"
+        if await self._send_private_message_text(event, user_id, header + "\n".join(lines)): yield event.plain_result("🧾已私信")
+        else: yield event.chain_result([Comp.At(qq=user_id), Comp.Plain(text="，私信失败，追踪已写入日志。")])
         if not event.is_stopped(): event.stop_event(); return
 
     # --- Plugin Lifecycle ---
     async def terminate(self): # ... (保持不变) ...
         logger.info("骗子酒馆插件卸载/停用，清理...")
+        if self._metrics_export_task and not self._metrics_export_task.done(): self._metrics_export_task.cancel()
+        if self._keepalive_task and not self._keepalive_task.done(): self._keepalive_task.cancel()
+        if self._memory_scan and not self._memory_scan.done(): self._memory_scan.cancel()
+        self.tracemalloc_diff.stop()
+        [t.cancel() for t in self._provider_pings.values() if not t.done()]
+        self._hand_image_stop.set() # 停止后台预热
+        self._profiler = None
+        self.turn_timers.close(); [t.cancel() for t in self._timer_tasks if not t.done()]; self._turn_events.clear()
+        [t.cancel() for t in self._tournament_tasks if not t.done()]; self.tournaments.clear(); self._tournament_tables.clear(); self._tournament_events.clear()
+        try: await self.state_store.close()
+        except Exception as e: logger.warning(f"关闭状态存储失败: {e}")
+        if self.player_stats: await self.player_stats.close() # 写完剩余的战绩增量
+        if self._replay_tasks: await asyncio.gather(*self._replay_tasks, return_exceptions=True) # 等待已结束对局的回放写完
+        if self.replay_archive: await self.replay_archive.close()
+        if self._opponent_model_task and not self._opponent_model_task.done(): self._opponent_model_task.cancel(); await asyncio.gather(self._opponent_model_task, return_exceptions=True)
+        if self._opponent_model_path and len(self.opponent_model): await self._save_opponent_model() # 排在进行中的后台写入之后
+        self._opponent_model_executor.shutdown(wait=False)
         active_tasks = list(self.active_ai_tasks.values())
         if active_tasks: logger.info(f"取消{len(active_tasks)}个AI任务..."); [t.cancel() for t in active_tasks if not t.done()]; self.active_ai_tasks.clear(); logger.info("AI任务已取消。")
         if self.games: logger.info(f"清理{len(self.games)}个游戏实例..."); self.games.clear(); logger.info("游戏实例数据已清理。")
+        self._chat_record_groups.clear(); self.group_chat_history.clear(); self._group_tables.clear()
+        logger.info(f"聊天记录统计: 快速跳过 {self.chat_record_stats['fast_path']} 条, 已记录 {self.chat_record_stats['recorded']} 条。")
         logger.info("清理完成。")
 
 # --- End of LiarDicePlugin Class ---
\ No newline at end of file
@@ -0,0 +1,185 @@
+# liar_tavern/memory_report.py
+
+# -*- coding: utf-8 -*-
+
+"""内存账目: 估算每个群的对局、聊天缓冲、AI 任务与缓存各占多少内存，用来找出常驻内存增长来自哪些群、哪些功能。
+
+sizeof() 对容器、带 __dict__ 的对象和 __slots__ 递归累加 sys.getsizeof。一轮测量内同一对象只计一次，按首次遇到时的类别计入。
+类、模块、函数、枚举成员等全局共享对象不计。结果只是近似值: 不含分配器开销，驻留的小整数/短字符串也会被计入。
+MemoryAccountant.run() 在事件循环中分片执行，每测完一个条目检查时间片，用完就让出事件循环，测量不会卡住其他群的回合。
+条目在让出期间可能已被释放，测量的是登记时的引用。
+另外可用 tracemalloc 拍快照，与上一份快照对比，列出增长最多的分配位置 (TracemallocDiff)。
+"""
+
+import os
+import sys
+import time
+import types
+import asyncio
+import logging
+import tracemalloc
+from enum import Enum
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import escape_label_value
+
+logger = logging.getLogger(__name__)
+
+HANDS, GAME, CHAT, TASKS, CACHE = range(5) # 类别
+CATEGORY_NAMES = ("手牌与牌堆", "对局其他", "聊天缓冲", "AI任务", "渲染缓存")
+CATEGORY_LABELS = ("hands", "game", "chat", "tasks", "cache") # Prometheus 标签
+GLOBAL_GROUP = "*" # 不属于任何群的条目 (如手牌图片内存缓存)
+TRACEMALLOC_FRAMES = 1 # 只记录分配点所在的一帧，开销最小
+_LEAVES = (str, bytes, bytearray, int, float, complex, bool, type(None), range)
+_SHARED = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType, types.CodeType, Enum, logging.Logger, asyncio.AbstractEventLoop)
+
+def sizeof(obj: Any, seen: set) -> int:
+    """obj 及其引用的对象的大小 (字节)，跳过 seen 中已计过的对象并把新对象加入 seen"""
+    total = 0; stack = [obj]
+    while stack:
+        o = stack.pop(); oid = id(o)
+        if oid in seen or isinstance(o, _SHARED): continue
+        seen.add(oid); total += sys.getsizeof(o)
+        if isinstance(o, _LEAVES): continue
+        if isinstance(o, dict): stack.extend(o.keys()); stack.extend(o.values()); continue
+        if isinstance(o, (list, tuple, set, frozenset, deque)): stack.extend(o); continue
+        attrs = getattr(o, "__dict__", None)
+        if attrs is not None: stack.append(attrs)
+        for cls in type(o).__mro__:
+            slots = cls.__dict__.get("__slots__", ())
+            for name in (slots,) if isinstance(slots, str) else slots:
+                if name not in ("__dict__", "__weakref__") and hasattr(o, name): stack.append(getattr(o, name))
+    return total
+
+def task_size(task: asyncio.Task, seen: set) -> int:
+    """任务、协程链与各层帧本身的大小；帧里的局部变量可能引用插件本身，不展开"""
+    total = 0
+    if id(task) not in seen: seen.add(id(task)); total += sys.getsizeof(task)
+    coro = task.get_coro()
+    while coro is not None and id(coro) not in seen:
+        seen.add(id(coro)); total += sys.getsizeof(coro)
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is not None and id(frame) not in seen: seen.add(id(frame)); total += sys.getsizeof(frame)
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+        if coro is not None and not hasattr(coro, "cr_frame") and not hasattr(coro, "gi_frame"): break # 等待的是 Future 等，不属于该任务
+    return total
+
+def format_bytes(size: float) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024: return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024.0
+    return f"{size:.1f}GiB"
+
+class MemoryReport:
+    """一次测量的结果: 每个群各类别的字节数"""
+
+    def __init__(self):
+        self.groups: Dict[str, List[int]] = {}
+        self.entries = [0] * len(CATEGORY_NAMES) # 各类别测量的条目数
+        self.taken_at = time.time(); self.seconds = 0.0; self.slices = 0
+
+    def add(self, group_id: str, category: int, size: int) -> None:
+        sizes = self.groups.get(group_id)
+        if sizes is None: sizes = self.groups[group_id] = [0] * len(CATEGORY_NAMES)
+        sizes[category] += size
+
+    @property
+    def totals(self) -> List[int]: return [sum(sizes[i] for sizes in self.groups.values()) for i in range(len(CATEGORY_NAMES))]
+
+    @property
+    def total(self) -> int: return sum(self.totals)
+
+    def top_groups(self, limit: int) -> List[Tuple[str, List[int]]]:
+        ranked = sorted(((gid, sizes) for gid, sizes in self.groups.items() if gid != GLOBAL_GROUP), key=lambda item: -sum(item[1]))
+        return ranked[:max(0, limit)]
+
+    def lines(self, top_n: int) -> List[str]:
+        totals = self.totals; shared = self.groups.get(GLOBAL_GROUP)
+        lines = [f"🧠 内存估算: 共 {format_bytes(self.total)} (牌桌 {self.entries[GAME]} / 聊天缓冲 {self.entries[CHAT]} / AI 任务 {self.entries[TASKS]}，{len(self.groups) - (shared is not None)} 个群，测量 {self.seconds * 1000:.0f}ms 分 {self.slices} 片)",
+                 " | ".join(f"{name} {format_bytes(size)}" for name, size in zip(CATEGORY_NAMES, totals))]
+        if shared: lines.append("不属于群: " + " | ".join(f"{name} {format_bytes(size)}" for name, size in zip(CATEGORY_NAMES, shared) if size))
+        top = self.top_groups(top_n)
+        if top: lines.append(f"占用最多的 {len(top)} 个群:")
+        lines.extend(f"  群{gid}: {format_bytes(sum(sizes))} (" + " / ".join(f"{name} {format_bytes(size)}" for name, size in zip(CATEGORY_NAMES, sizes) if size) + ")" for gid, sizes in top)
+        return lines
+
+    def render_prometheus(self, top_n: int) -> str:
+        out = ["# HELP liar_tavern_memory_bytes Approximate memory held by plugin state.", "# TYPE liar_tavern_memory_bytes gauge"]
+        for label, size in zip(CATEGORY_LABELS, self.totals): out.append(f'liar_tavern_memory_bytes{{category="{label}",group="all"}} {size}')
+        for gid, sizes in self.top_groups(top_n):
+            for label, size in zip(CATEGORY_LABELS, sizes): out.append(f'liar_tavern_memory_bytes{{category="{label}",group="{escape_label_value(gid)}"}} {size}')
+        out.extend(["# HELP liar_tavern_memory_entries Entries measured by the last memory accounting pass.", "# TYPE liar_tavern_memory_entries gauge"])
+        for label, count in zip(CATEGORY_LABELS, self.entries): out.append(f'liar_tavern_memory_entries{{category="{label}"}} {count}')
+        out.extend(["# HELP liar_tavern_memory_scan_seconds Duration of the last memory accounting pass.", "# TYPE liar_tavern_memory_scan_seconds gauge", f"liar_tavern_memory_scan_seconds {self.seconds:.6f}"])
+        return "\n".join(out) + "\n"
+
+class MemoryAccountant:
+    """登记要测量的条目 (只保存引用)，run() 在事件循环中分片测量"""
+
+    def __init__(self, slice_seconds: float = 0.005):
+        self.slice_seconds = max(0.0005, slice_seconds)
+        self._jobs: List[Tuple[str, int, Callable[[set], List[Tuple[int, int]]]]] = []
+
+    def add(self, group_id: str, category: int, obj: Any, count: bool = False) -> None:
+        self._jobs.append((group_id, category if count else -1, lambda seen: [(category, sizeof(obj, seen))]))
+
+    def add_game(self, group_id: str, game: Any) -> None:
+        """一张牌桌 (LiarDiceGame): 手牌与牌堆、快照/视图缓存、其余状态 (含追踪缓冲区) 分开计"""
+        def measure(seen: set) -> List[Tuple[int, int]]:
+            state = game.state
+            hands = sum(sizeof(p.hand, seen) for p in list(state.players.values())) + sizeof(state.deck, seen) + sizeof(state.discard_pile, seen) + sizeof(state.last_play, seen)
+            cache = sizeof(game._snapshot, seen) + sizeof(game._player_views, seen)
+            return [(HANDS, hands), (CACHE, cache), (GAME, sizeof(game, seen))]
+        self._jobs.append((group_id, GAME, measure))
+
+    def add_measure(self, group_id: str, category: int, measure: Callable[[], int]) -> None:
+        """自带计量方法的条目 (如需要加锁读取的缓存)"""
+        self._jobs.append((group_id, -1, lambda seen: [(category, measure())]))
+
+    def add_task(self, group_id: str, task: asyncio.Task) -> None:
+        self._jobs.append((group_id, TASKS, lambda seen: [(TASKS, task_size(task, seen))]))
+
+    async def run(self) -> MemoryReport:
+        report = MemoryReport(); seen: set = set(); started = time.perf_counter(); slice_start = started
+        for group_id, counted, measure in self._jobs:
+            for category, size in measure(seen): report.add(group_id, category, size)
+            if counted >= 0: report.entries[counted] += 1
+            if time.perf_counter() - slice_start >= self.slice_seconds:
+                report.slices += 1; await asyncio.sleep(0); slice_start = time.perf_counter() # 让出事件循环
+        report.slices += 1; report.seconds = time.perf_counter() - started; self._jobs = []
+        return report
+
+class TracemallocDiff:
+    """tracemalloc 快照对比。snapshot()/diff() 会遍历全部分配记录，应通过 asyncio.to_thread 调用"""
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None; self.baseline_at = 0.0
+        self.started_here = False # 由本插件开启的追踪，stop() 时关闭
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")))
+
+    def snapshot(self) -> str:
+        """开启追踪 (若未开启) 并把当前快照设为基准"""
+        if not tracemalloc.is_tracing(): tracemalloc.start(TRACEMALLOC_FRAMES); self.started_here = True
+        self.baseline = self._take(); self.baseline_at = time.time()
+        current, peak = tracemalloc.get_traced_memory()
+        return f"已记录基准快照: 追踪中 {format_bytes(current)} (峰值 {format_bytes(peak)})，{len(self.baseline.traces)} 条分配记录"
+
+    def diff(self, limit: int = 10) -> List[str]:
+        """与基准对比，列出净增长最多的分配位置，并把当前快照设为新基准"""
+        if self.baseline is None or not tracemalloc.is_tracing(): raise RuntimeError("尚未记录基准快照")
+        current = self._take(); stats = current.compare_to(self.baseline, "lineno")
+        grown = sum(stat.size_diff for stat in stats); elapsed = time.time() - self.baseline_at
+        lines = [f"距基准 {elapsed:.0f}s，净增长 {format_bytes(grown)}，增长最多的 {min(limit, len(stats))} 处:"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]; path = os.path.join(*frame.filename.replace("\\", "/").split("/")[-2:])
+            lines.append(f"  {'+' if stat.size_diff >= 0 else '-'}{format_bytes(abs(stat.size_diff))} ({stat.count_diff:+d} 块，现 {format_bytes(stat.size)}) {path}:{frame.lineno}")
+        self.baseline = current; self.baseline_at = time.time()
+        return lines
+
+    def stop(self) -> None:
+        if self.started_here and tracemalloc.is_tracing(): tracemalloc.stop()
+        self.baseline = None; self.started_here = False
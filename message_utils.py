@@ -3,35 +3,36 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Mapping
 
-# Import framework components and models
-import astrbot.api.message_components as Comp
+# Import message segments (与框架无关，由 main.py 转换为 AstrBot 组件) and models
+from .messages import Plain, At
 from .exceptions import (
     GameError, NotPlayersTurnError, InvalidCardIndexError, PlayerNotInGameError,
     EmptyHandError, InvalidActionError, AIDecisionError
 )
-from .models import PlayerData, GameState, GameStatus, LastPlay, ChallengeResult, ShotResult, MIN_PLAYERS, JOKER
+from .models import PlayerData, GameState, GameStatus, LastPlay, ChallengeResult, ShotResult, MIN_PLAYERS, JOKER, LARGE_TABLE_THRESHOLD
 
 logger = logging.getLogger(__name__)
+SHOT_ODDS_LARGE_TABLE_ROWS = 8
 
 # --- Helper to create At or Plain based on ID ---
 def _get_player_mention(player_id: str, player_name: str, is_ai: bool) -> List[Any]:
-    """根据玩家 ID 和是否 AI 返回 Comp.At 或 Comp.Plain"""
+    """根据玩家 ID 和是否 AI 返回 At 或 Plain"""
     if not is_ai and player_id.isdigit():
         # 如果不是 AI 且 ID 是数字，尝试 @
         try:
-            return [Comp.At(qq=int(player_id)), Comp.Plain(f"({player_name})")]
+            return [At(qq=int(player_id)), Plain(f"({player_name})")]
         except ValueError:
             # 如果 ID 是数字但转换失败（理论上不应发生），回退到 Plain
             logger.warning(f"玩家 ID '{player_id}' 是数字但无法转换为 int 用于 At。")
-            return [Comp.Plain(f"{player_name}")]
+            return [Plain(f"{player_name}")]
     elif is_ai:
         # 如果是 AI，使用 Plain
-        return [Comp.Plain(f"🤖 {player_name}")]
+        return [Plain(f"🤖 {player_name}")]
     else:
         # 其他情况（非 AI 但 ID 不是纯数字），使用 Plain
-        return [Comp.Plain(f"{player_name}")]
+        return [Plain(f"{player_name}")]
 
 
 # --- Formatting Helpers ---
@@ -57,10 +58,10 @@ def build_join_message(player_id: str, player_name: str, player_count: int, is_a
     """构建玩家加入/添加 AI 的消息"""
     action_text = "添加 AI" if is_ai else "加入"
     mention_comps = _get_player_mention(player_id, player_name, is_ai) # 获取提及组件
-    prefix_comp = Comp.Plain(text="🤖 " if is_ai else "✅ ")
-    suffix_comp = Comp.Plain(text=f" 已{action_text}！当前 {player_count} 人。")
+    prefix_comp = Plain(text="🤖 " if is_ai else "✅ ")
+    suffix_comp = Plain(text=f" 已{action_text}！当前 {player_count} 人。")
     # 组合消息，注意 mention_comps 返回的是列表
-    return [prefix_comp] + mention_comps[:-1] + [Comp.Plain(mention_comps[-1].text.replace('(','').replace(')',''))] + [suffix_comp] # 移除括号并组合
+    return [prefix_comp] + mention_comps[:-1] + [Plain(mention_comps[-1].text.replace('(','').replace(')',''))] + [suffix_comp] # 移除括号并组合
 
 def build_start_game_message(result: Dict[str, Any]) -> List[Any]:
     """构建游戏开始的消息"""
@@ -70,7 +71,7 @@ def build_start_game_message(result: Dict[str, Any]) -> List[Any]:
     mention_comps = _get_player_mention(first_player_id, first_player_name, is_first_player_ai)
 
     components = [
-        Comp.Plain(text=f"🎉 游戏开始！{len(result['turn_order_names'])} 人参与。\n"
+        Plain(text=f"🎉 游戏开始！{len(result['turn_order_names'])} 人参与。\n"
                     f"👑 本轮主牌: 【{result['main_card']}】\n"
                     f"(初始手牌已尝试私信发送)\n"
                     f"📜 顺序: {', '.join(result['turn_order_names'])}\n\n"
@@ -79,9 +80,9 @@ def build_start_game_message(result: Dict[str, Any]) -> List[Any]:
     components.extend(mention_comps) # 添加提及组件列表
 
     if is_first_player_ai:
-        components.append(Comp.Plain(text=" 行动..."))
+        components.append(Plain(text=" 行动..."))
     else:
-        components.append(Comp.Plain(text=" 出牌！\n(/出牌 编号 [编号...])"))
+        components.append(Plain(text=" 出牌！\n(/出牌 编号 [编号...])"))
     return components
 
 def build_play_card_announcement(result: Dict[str, Any]) -> List[Any]:
@@ -95,19 +96,19 @@ def build_play_card_announcement(result: Dict[str, Any]) -> List[Any]:
     player_mention_comps = _get_player_mention(player_id, player_name, is_ai)
     components = []
     action_prefix = "✨ " if played_hand_empty else "➡️ "
-    components.append(Comp.Plain(action_prefix))
+    components.append(Plain(action_prefix))
     components.extend(player_mention_comps) # 添加出牌者提及
-    components.append(Comp.Plain(text=f" 打出 {quantity} 张，声称主牌【{main_card}】。\n"))
+    components.append(Plain(text=f" 打出 {quantity} 张，声称主牌【{main_card}】。\n"))
 
     if next_player_id and next_player_name is not None:
         next_mention_comps = _get_player_mention(next_player_id, next_player_name, next_is_ai)
-        components.append(Comp.Plain(text="轮到 "))
+        components.append(Plain(text="轮到 "))
         components.extend(next_mention_comps) # 添加下一位玩家提及
         if next_is_ai:
-            components.append(Comp.Plain(text=" 行动..."))
+            components.append(Plain(text=" 行动..."))
         else:
-            if next_hand_empty: components.append(Comp.Plain(text=" 反应 (手牌空，请 /质疑 或 /等待)"))
-            else: components.append(Comp.Plain(text=" 反应。\n请 /质疑 或 /出牌 <编号...>"))
+            if next_hand_empty: components.append(Plain(text=" 反应 (手牌空，请 /质疑 或 /等待)"))
+            else: components.append(Plain(text=" 反应。\n请 /质疑 或 /出牌 <编号...>"))
     return components
 
 def build_challenge_result_messages(result: Dict[str, Any]) -> List[List[Any]]:
@@ -125,12 +126,12 @@ def build_challenge_result_messages(result: Dict[str, Any]) -> List[List[Any]]:
     loser_mention = _get_player_mention(loser_id, loser_name, loser_is_ai)
 
     # 1. 宣布质疑和亮牌
-    reveal_comps = [Comp.Plain("🤔 ")] + challenger_mention + [Comp.Plain(" 质疑 ")] + challenged_mention + [Comp.Plain(f" 的 {quantity} 张 👑{main_card}！\n亮牌: 【{actual_cards_str}】")]
+    reveal_comps = [Plain("🤔 ")] + challenger_mention + [Plain(" 质疑 ")] + challenged_mention + [Plain(f" 的 {quantity} 张 👑{main_card}！\n亮牌: 【{actual_cards_str}】")]
     messages.append(reveal_comps)
 
     # 2. 宣布质疑结果和开枪者
     outcome_text = f"✅ 质疑失败！{challenged_mention[0].text if challenged_is_ai else challenged_name} 确实是主牌/{JOKER}。" if challenge_outcome == ChallengeResult.FAILURE else f"❌ 质疑成功！{challenged_mention[0].text if challenged_is_ai else challenged_name} 没有完全打出主牌/{JOKER}。"
-    shot_trigger_comps = [Comp.Plain(f"{outcome_text}\n轮到 ")] + loser_mention + [Comp.Plain(" 开枪！")]
+    shot_trigger_comps = [Plain(f"{outcome_text}\n轮到 ")] + loser_mention + [Plain(" 开枪！")]
     messages.append(shot_trigger_comps)
 
     # 3. 宣布开枪结果
@@ -139,7 +140,7 @@ def build_challenge_result_messages(result: Dict[str, Any]) -> List[List[Any]]:
     elif shot_outcome == ShotResult.HIT: shot_result_text = f"💥 {loser_mention[0].text if loser_is_ai else loser_name} 扣动扳机... 砰！【实弹】！{loser_name} 被淘汰！"
     elif shot_outcome == ShotResult.ALREADY_ELIMINATED: shot_result_text = f"ℹ️ {loser_mention[0].text if loser_is_ai else loser_name} 已被淘汰。"
     elif shot_outcome == ShotResult.GUN_ERROR: shot_result_text = f"❌ 内部错误：{loser_mention[0].text if loser_is_ai else loser_name} 枪支错误！"
-    if shot_result_text: messages.append([Comp.Plain(shot_result_text)])
+    if shot_result_text: messages.append([Plain(shot_result_text)])
 
     # 4. 宣布下一轮
     if not result.get("game_ended") and not result.get("reshuffled"):
@@ -147,13 +148,13 @@ def build_challenge_result_messages(result: Dict[str, Any]) -> List[List[Any]]:
         next_hand_empty = result.get("next_player_hand_empty"); next_is_ai = result.get('next_player_is_ai', False)
         if next_player_id and next_player_name is not None:
             next_mention = _get_player_mention(next_player_id, next_player_name, next_is_ai)
-            next_turn_comps = [Comp.Plain(text="下一轮，轮到 ")] + next_mention
-            if next_is_ai: next_turn_comps.append(Comp.Plain(" 行动..."))
+            next_turn_comps = [Plain(text="下一轮，轮到 ")] + next_mention
+            if next_is_ai: next_turn_comps.append(Plain(" 行动..."))
             else:
-                 if next_hand_empty: next_turn_comps.append(Comp.Plain("。\n(手牌空，请 /质疑 或 /等待)"))
-                 else: next_turn_comps.append(Comp.Plain(" 出牌。\n请使用 `/出牌 <编号...>`"))
+                 if next_hand_empty: next_turn_comps.append(Plain("。\n(手牌空，请 /质疑 或 /等待)"))
+                 else: next_turn_comps.append(Plain(" 出牌。\n请使用 `/出牌 <编号...>`"))
             messages.append(next_turn_comps)
-        else: messages.append([Comp.Plain("错误：无法确定下一位玩家。")])
+        else: messages.append([Plain("错误：无法确定下一位玩家。")])
     return messages
 
 def build_wait_announcement(result: Dict[str, Any]) -> List[Any]:
@@ -163,16 +164,16 @@ def build_wait_announcement(result: Dict[str, Any]) -> List[Any]:
     next_hand_empty = result.get('next_player_hand_empty', False); next_is_ai = result.get('next_player_is_ai', False)
 
     player_mention = _get_player_mention(player_id, player_name, is_ai)
-    components = [Comp.Plain("😑 ")] + player_mention + [Comp.Plain(" (空手牌) 选择等待。\n")]
+    components = [Plain("😑 ")] + player_mention + [Plain(" (空手牌) 选择等待。\n")]
 
     if next_player_id and next_player_name is not None:
         next_mention = _get_player_mention(next_player_id, next_player_name, next_is_ai)
-        components.append(Comp.Plain(text="轮到 "))
+        components.append(Plain(text="轮到 "))
         components.extend(next_mention)
-        if next_is_ai: components.append(Comp.Plain(" 行动..."))
+        if next_is_ai: components.append(Plain(" 行动..."))
         else:
-             if next_hand_empty: components.append(Comp.Plain("。\n(手牌空，请 /质疑 或 /等待)"))
-             else: components.append(Comp.Plain(" 出牌。\n请使用 `/出牌 <编号...>`"))
+             if next_hand_empty: components.append(Plain("。\n(手牌空，请 /质疑 或 /等待)"))
+             else: components.append(Plain(" 出牌。\n请使用 `/出牌 <编号...>`"))
     return components
 
 def build_reshuffle_announcement(result: Dict[str, Any]) -> List[Any]:
@@ -190,10 +191,10 @@ def build_reshuffle_announcement(result: Dict[str, Any]) -> List[Any]:
         prefix_text = f"✨ {trigger_mention_text} 打出最后 {result.get('played_quantity','?')} 张！\n" if result.get("played_hand_empty") else f"➡️ {trigger_mention_text} 打出 {result.get('played_quantity','?')} 张。\n"
     elif trigger_action == "wait" and trigger_player_name: prefix_text = f"😑 {trigger_mention_text} (空手牌) 等待。\n"
     elif trigger_action == "elimination" and trigger_player_name: prefix_text = f"☠️ {trigger_mention_text} 被淘汰！\n"
-    if prefix_text: components.append(Comp.Plain(prefix_text))
+    if prefix_text: components.append(Plain(prefix_text))
 
     # 添加洗牌核心信息
-    components.append(Comp.Plain(text=f"🔄 {reason}！重新洗牌发牌！\n"
+    components.append(Plain(text=f"🔄 {reason}！重新洗牌发牌！\n"
                     f"👑 新主牌: 【{new_main_card}】\n"
                     f"📜 顺序: {', '.join(turn_order_display)}\n" # 已包含 AI 标记
                     f"(新手牌已尝试私信发送)\n👉 轮到 "))
@@ -201,51 +202,61 @@ def build_reshuffle_announcement(result: Dict[str, Any]) -> List[Any]:
     # 添加下一位玩家信息
     next_mention = _get_player_mention(next_player_id, next_player_name, next_is_ai)
     components.extend(next_mention)
-    if next_is_ai: components.append(Comp.Plain(" 行动..."))
-    else: components.append(Comp.Plain(" 出牌。"))
+    if next_is_ai: components.append(Plain(" 行动..."))
+    else: components.append(Plain(" 出牌。"))
 
     return components
 
 
-def build_game_status_message(game: GameState, requesting_player_id: Optional[str]) -> List[Any]:
-    """构建游戏状态查询的回复消息"""
+def build_game_status_message(game: GameState, requesting_player_id: Optional[str], shot_odds: Optional[Mapping[str, float]] = None) -> List[Any]:
+    """构建游戏状态查询的回复消息；shot_odds 为各存活玩家下一枪中弹的公开概率 (配置开启时才传入)"""
     status_text = f"🎲 骗子酒馆状态\n状态: {game.status.name}\n"
     if game.status == GameStatus.WAITING:
         player_list = [f"- {pdata.name}{' [AI]' if pdata.is_ai else ''}" for pdata in game.players.values()]
         status_text += f"玩家 ({len(player_list)}人):\n" + ('\n'.join(player_list) if player_list else "暂无")
         status_text += f"\n\n➡️ /加入 参与 (需 {MIN_PLAYERS} 人)\n➡️ /添加AI [数量]\n➡️ 发起者可 /开始"
-        return [Comp.Plain(status_text)]
+        return [Plain(status_text)]
 
-    main_card = game.main_card or "未定"; turn_order_display = format_player_list(game.players, game.turn_order)
-    status_text += f"👑 主牌: 【{main_card}】\n📜 顺序: {turn_order_display}\n"
-    status_components = [Comp.Plain(status_text)]
+    main_card = game.main_card or "未定"; large_table = len(game.turn_order) > LARGE_TABLE_THRESHOLD
+    if large_table: status_text += f"👑 主牌: 【{main_card}】\n📜 {len(game.turn_order)} 人桌，顺序见下方玩家状态\n" # 大桌不重复列出整个顺序
+    else: status_text += f"👑 主牌: 【{main_card}】\n📜 顺序: {format_player_list(game.players, game.turn_order)}\n"
+    status_components = [Plain(status_text)]
 
     current_player_id = game.turn_order[game.current_player_index] if 0 <= game.current_player_index < len(game.turn_order) else None
     current_player_data = game.players.get(current_player_id) if current_player_id else None
     if current_player_data:
         current_player_name = current_player_data.name; current_is_ai = current_player_data.is_ai
         current_mention = _get_player_mention(current_player_id, current_player_name, current_is_ai)
-        status_components.append(Comp.Plain("当前轮到: "))
+        status_components.append(Plain("当前轮到: "))
         status_components.extend(current_mention)
-    else: status_components.append(Comp.Plain("当前轮到: 未知"))
+    else: status_components.append(Plain("当前轮到: 未知"))
 
-    player_statuses = []
+    player_statuses = []; eliminated_names = []
     for pid in game.turn_order:
         pdata = game.players.get(pid)
-        if pdata: status_icon = "☠️" if pdata.is_eliminated else ("🤖" if pdata.is_ai else "😀"); hand_count = len(pdata.hand) if not pdata.is_eliminated else 0; hand_text = f"{hand_count}张" if not pdata.is_eliminated else "淘汰"; player_statuses.append(f"{status_icon} {pdata.name}: {hand_text}")
-    status_components.append(Comp.Plain("\n--------------------\n玩家状态:\n" + "\n".join(player_statuses)))
+        if pdata and large_table and pdata.is_eliminated: eliminated_names.append(pdata.name)
+        elif pdata: status_icon = "☠️" if pdata.is_eliminated else ("🤖" if pdata.is_ai else "😀"); hand_count = len(pdata.hand) if not pdata.is_eliminated else 0; hand_text = f"{hand_count}张" if not pdata.is_eliminated else "淘汰"; player_statuses.append(f"{status_icon} {pdata.name}: {hand_text}")
+    if eliminated_names: player_statuses.append(f"☠️ 已淘汰 {len(eliminated_names)} 人: {'、'.join(eliminated_names)}")
+    status_components.append(Plain("\n--------------------\n玩家状态:\n" + "\n".join(player_statuses)))
 
     last_play_text = "无"
     if game.last_play:
         lp = game.last_play; lp_pdata = game.players.get(lp.player_id); lp_mention = _get_player_mention(lp.player_id, lp.player_name, lp_pdata.is_ai if lp_pdata else False)
         current_mention_text = current_player_data.name if current_player_data else "未知"
         last_play_text = f"{lp_mention[0].text if lp_pdata and lp_pdata.is_ai else lp.player_name} 声称打出 {lp.claimed_quantity} 张【{main_card}】 (等待 {current_mention_text} 反应)"
-    status_components.append(Comp.Plain(f"\n--------------------\n等待处理: {last_play_text}\n弃牌堆: {len(game.discard_pile)}张 | 牌堆余: {len(game.deck)}张"))
+    status_components.append(Plain(f"\n--------------------\n等待处理: {last_play_text}\n弃牌堆: {len(game.discard_pile)}张 | 牌堆余: {len(game.deck)}张"))
+    if shot_odds:
+        # 大桌只列出最危险的几名玩家
+        ranked = sorted((pid for pid in game.turn_order if pid in shot_odds), key=lambda pid: -shot_odds[pid])
+        shown = ranked[:SHOT_ODDS_LARGE_TABLE_ROWS] if large_table else ranked
+        odds_text = " | ".join(f"{game.players[pid].name} {shot_odds[pid]:.0%}" for pid in shown)
+        if len(shown) < len(ranked): odds_text += f" | 其余 {len(ranked) - len(shown)} 人"
+        status_components.append(Plain(f"\n🎯 下一枪中弹概率: {odds_text}"))
 
     requesting_pdata = game.players.get(requesting_player_id) if requesting_player_id else None
     if requesting_pdata and not requesting_pdata.is_eliminated and not requesting_pdata.is_ai:
         my_hand_display = format_hand(requesting_pdata.hand)
-        status_components.append(Comp.Plain(f"\n--------------------\n你的手牌: {my_hand_display}"))
+        status_components.append(Plain(f"\n--------------------\n你的手牌: {my_hand_display}"))
     return status_components
 
 def build_game_end_message(winner_id: Optional[str], winner_name: Optional[str])-> List[Any]:
@@ -260,12 +271,34 @@ def build_game_end_message(winner_id: Optional[str], winner_name: Optional[str])
         announcement += f"最后的胜者是: {winner_name}！"
         # 检查 winner_id 是否是数字来决定是否 @
         if winner_id.isdigit():
-             return [Comp.Plain(announcement + "\n恭喜 "), Comp.At(qq=int(winner_id)), Comp.Plain(" !")]
+             return [Plain(announcement + "\n恭喜 "), At(qq=int(winner_id)), Plain(" !")]
         else: # 如果是 AI 或其他非数字 ID
-             return [Comp.Plain(announcement)]
+             return [Plain(announcement)]
     else:
         announcement += "没有玩家幸存..."
-        return [Comp.Plain(announcement)]
+        return [Plain(announcement)]
+
+def _format_stat_line(row: Dict[str, Any]) -> str:
+    games = row["games"]; rate = f"{row['wins'] / games:.0%}" if games else "-"
+    catch = f"{row['challenges_won']}/{row['challenges']}" if row["challenges"] else "0/0"
+    return f"{games}局 {row['wins']}胜 (胜率 {rate}) | 质疑成功 {catch} | 吹牛被抓 {row['bluffs_caught']} | 开枪幸存 {row['shots_survived']}/{row['shots_fired']}"
+
+def build_player_stats_message(player_name: str, group_row: Optional[Dict[str, Any]], global_row: Optional[Dict[str, Any]]) -> str:
+    """构建个人战绩消息 (本群 + 全局)"""
+    if not group_row and not global_row: return f"ℹ️{player_name} 还没有战绩记录，快来一局吧！"
+    lines = [f"📈 {player_name} 的战绩"]
+    lines.append(f"本群: {_format_stat_line(group_row)}" if group_row else "本群: 暂无记录")
+    if global_row: lines.append(f"全局: {_format_stat_line(global_row)}")
+    return "\n".join(lines)
+
+def build_leaderboard_message(title: str, metric: str, rows: List[Dict[str, Any]], min_games: int = 0) -> str:
+    """构建排行榜消息; rows 为 PlayerStatsStore.leaderboard 的结果"""
+    if not rows: return f"ℹ️{title}暂无数据" + (f" (胜率榜需至少 {min_games} 局)" if metric == "胜率" and min_games else "")
+    medals = ("🥇", "🥈", "🥉"); lines = [f"🏆 {title} · {metric}榜"]
+    for rank, row in enumerate(rows, 1):
+        score = f"{row['score']:.0%}" if metric == "胜率" else str(row["score"])
+        lines.append(f"{medals[rank - 1] if rank <= 3 else f'{rank}.'} {row['name'] or row['user_id']}  {score}  ({row['games']}局{row['wins']}胜)")
+    return "\n".join(lines)
 
 def build_error_message(
     error: Exception,
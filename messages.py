@@ -0,0 +1,30 @@
+# liar_tavern/messages.py
+
+# -*- coding: utf-8 -*-
+
+"""与框架无关的消息段。
+
+message_utils 只产出这里的 Plain / At，属性名与 AstrBot 的 message_components 一致 (text / qq)；
+适配层 (main.py) 在发送前统一转换为框架组件。引擎与消息构建因此不依赖 AstrBot，
+模拟、基准脚本与进程池子进程可以直接导入 models / game_logic / message_utils 并渲染消息。
+"""
+
+from typing import Any, Iterable, Union
+
+class Plain:
+    __slots__ = ("text",)
+    def __init__(self, text: str = ""): self.text = text
+    def __repr__(self) -> str: return f"Plain({self.text!r})"
+    def __eq__(self, other: Any) -> bool: return isinstance(other, Plain) and other.text == self.text
+
+class At:
+    __slots__ = ("qq",)
+    def __init__(self, qq: Union[int, str]): self.qq = qq
+    def __repr__(self) -> str: return f"At({self.qq!r})"
+    def __eq__(self, other: Any) -> bool: return isinstance(other, At) and other.qq == self.qq
+
+Segment = Union[Plain, At]
+
+def to_text(components: Iterable[Any]) -> str:
+    """拼成纯文本 (@ 写成 @QQ号)，供日志、模拟与基准使用"""
+    return "".join(c.text if isinstance(c, Plain) else f"@{c.qq}" if isinstance(c, At) else str(c) for c in components)
@@ -0,0 +1,128 @@
+# liar_tavern/metrics.py
+
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 直方图桶上界 (毫秒)，最后一个桶为 +Inf
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+class LatencyHistogram:
+    """固定桶延迟直方图 (毫秒)，记录为 O(log 桶数)。"""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, value_ms)] += 1
+        self.count += 1; self.total_ms += value_ms
+        if value_ms > self.max_ms: self.max_ms = value_ms
+
+    def percentile(self, q: float) -> float:
+        """按桶上界估算分位数 (落在 +Inf 桶时返回最大值)。"""
+        if not self.count: return 0.0
+        rank = q * self.count; seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank: return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    @property
+    def avg_ms(self) -> float:
+        return self.total_ms / self.count if self.count else 0.0
+
+class _Span:
+    __slots__ = ("_recorder", "_name", "_group_id", "_start")
+
+    def __init__(self, recorder: "LatencyRecorder", name: str, group_id: Optional[str]):
+        self._recorder = recorder; self._name = name; self._group_id = group_id; self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter(); return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._recorder.observe(self._name, (time.perf_counter() - self._start) * 1000.0, self._group_id)
+        return False
+
+class _NoopSpan:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, exc_type, exc, tb): return False
+
+_NOOP_SPAN = _NoopSpan()
+
+class LatencyRecorder:
+    """按 span 名称记录延迟，分全局和每群两级。关闭时 span() 返回共享的空操作对象。"""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.global_hists: Dict[str, LatencyHistogram] = {}
+        self.group_hists: Dict[str, Dict[str, LatencyHistogram]] = {}
+
+    def span(self, name: str, group_id: Optional[str] = None):
+        if not self.enabled: return _NOOP_SPAN
+        return _Span(self, name, group_id)
+
+    def observe(self, name: str, value_ms: float, group_id: Optional[str] = None) -> None:
+        if not self.enabled: return
+        hist = self.global_hists.get(name)
+        if hist is None: hist = self.global_hists[name] = LatencyHistogram()
+        hist.observe(value_ms)
+        if group_id:
+            group = self.group_hists.get(group_id)
+            if group is None: group = self.group_hists[group_id] = {}
+            ghist = group.get(name)
+            if ghist is None: ghist = group[name] = LatencyHistogram()
+            ghist.observe(value_ms)
+
+    def drop_group(self, group_id: str) -> None:
+        self.group_hists.pop(group_id, None)
+
+    def format_summary(self, group_id: Optional[str] = None) -> str:
+        """生成聊天命令用的文本摘要"""
+        hists = self.global_hists if group_id is None else self.group_hists.get(group_id, {})
+        if not hists: return "暂无延迟数据。"
+        lines = []
+        for name in sorted(hists):
+            h = hists[name]
+            lines.append(f"{name}: n={h.count} avg={h.avg_ms:.1f}ms p50≤{h.percentile(0.5):g}ms p99≤{h.percentile(0.99):g}ms max={h.max_ms:.1f}ms")
+        return "\n".join(lines)
+
+    def render_prometheus(self, include_groups: bool = True) -> str:
+        """以 Prometheus 文本格式导出 (单位秒)"""
+        out = ["# HELP liar_tavern_span_seconds Latency of plugin hot-path spans.", "# TYPE liar_tavern_span_seconds histogram"]
+        def emit(hist: LatencyHistogram, labels: str):
+            cumulative = 0
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                cumulative += hist.counts[i]
+                out.append(f'liar_tavern_span_seconds_bucket{{{labels},le="{bound / 1000.0:g}"}} {cumulative}')
+            out.append(f'liar_tavern_span_seconds_bucket{{{labels},le="+Inf"}} {hist.count}')
+            out.append(f'liar_tavern_span_seconds_sum{{{labels}}} {hist.total_ms / 1000.0:.6f}')
+            out.append(f'liar_tavern_span_seconds_count{{{labels}}} {hist.count}')
+        for name in sorted(self.global_hists): emit(self.global_hists[name], f'span="{escape_label_value(name)}",group="all"')
+        if include_groups:
+            for gid in sorted(self.group_hists):
+                for name in sorted(self.group_hists[gid]): emit(self.group_hists[gid][name], f'span="{escape_label_value(name)}",group="{escape_label_value(gid)}"')
+        return "\n".join(out) + "\n"
+
+def escape_label_value(value: str) -> str:
+    """Prometheus 标签值转义 (反斜杠、双引号、换行)；牌桌键含用户输入的桌名"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def write_prometheus_file(path: str, text: str) -> None:
+    """原子写入 (先写临时文件再替换)，供 node_exporter textfile collector 读取。
+    文本须先在事件循环中渲染好，本函数只做文件 IO，可放到 asyncio.to_thread 中执行。"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f: f.write(text)
+    os.replace(tmp_path, path)
@@ -5,7 +5,7 @@
 import random # 确保导入 random
 from dataclasses import dataclass, field
 from enum import Enum, auto
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Mapping
 import math # 导入 math 用于四舍五入
 import logging
 logger = logging.getLogger(__name__)
@@ -21,6 +21,16 @@ JOKER = "Joker" # 万能牌
 
 MAX_PLAY_CARDS = 3
 AI_MAX_RETRIES = 3 # AI 调用 LLM 的最大重试次数
+AI_MIN_LLM_BUDGET = 1.0 # 尚无耗时样本时，回合剩余时间少于此值 (秒) 就不再发起 LLM 调用
+
+# 牌桌规模与多桌
+DEFAULT_MAX_PLAYERS = 8 # 单桌默认人数上限 (可通过配置 max_table_players 调整)
+MAX_PLAYERS_LIMIT = 64 # 单桌人数硬上限
+LARGE_TABLE_THRESHOLD = 12 # 超过该人数时状态消息/AI Prompt 使用紧凑格式
+MAX_TABLE_NAME_LEN = 12
+TABLE_KEY_SEP = "#" # 牌桌键: 默认桌为 "群号"，命名桌为 "群号#桌名"
+PROMPT_NEIGHBOR_SEATS = 3 # 大桌 AI Prompt 中列出自己前后各几名存活玩家
+PROMPT_OPPONENT_PROFILES = 4 # AI Prompt 中最多列出几名对手的画像
 
 # --- Enums (保持不变) ---
 class GameStatus(Enum):
@@ -44,11 +54,16 @@ class PlayerData:
     id: str
     name: str
     hand: List[str] = field(default_factory=list)
-    gun: List[str] = field(default_factory=list) # 弹膛顺序
+    gun: int = 0 # 弹膛位掩码: 第 i 位为 1 表示第 i 格是实弹
     gun_position: int = 0 # 当前指针
+    gun_chambers: int = GUN_CHAMBERS
+    shots_survived: int = 0 # 已开枪且空响的次数 (公开信息，用于估计中弹概率)
     is_eliminated: bool = False
     is_ai: bool = False # 新增字段，标记是否为 AI 玩家
 
+    @property
+    def live_bullets(self) -> int: return self.gun.bit_count()
+
 @dataclass
 class LastPlay:
     player_id: str
@@ -68,10 +83,53 @@ class GameState:
     discard_pile: List[str] = field(default_factory=list)
     creator_id: Optional[str] = None
     round_start_reason: str = "游戏开始"
+    action_count: int = 0 # 已处理的动作数 (出牌/质疑/等待)，用于判断回合是否已变化
+    turn_owner: Optional[str] = None # 共享后端: 负责驱动当前回合 (AI 任务或超时计时器) 的节点
+    turn_deadline: float = 0.0 # 共享后端: 超过该墙钟时间回合仍未推进时，其他节点可以接管
+
+# --- 只读快照 (供 AI 在 await 期间使用) ---
+@dataclass(frozen=True)
+class PlayerView:
+    id: str
+    name: str
+    hand: Tuple[str, ...]
+    is_eliminated: bool
+    is_ai: bool
+
+@dataclass(frozen=True)
+class LastPlayView:
+    player_id: str
+    player_name: str
+    claimed_quantity: int # 不含实际牌面，AI 看不到
+
+@dataclass(frozen=True)
+class GameSnapshot:
+    """某一版本局面的不可变视图。version 即 GameState.action_count，用于应用决策时的比较并交换。"""
+    table_key: str
+    version: int
+    status: GameStatus
+    main_card: Optional[str]
+    turn_order: Tuple[str, ...]
+    players: Mapping[str, PlayerView] # 只读映射；未变化的 PlayerView 在相邻版本间共享
+    seats: Tuple[PlayerView, ...] # 按回合顺序排列的玩家，供 Prompt 逐座遍历
+    last_play: Optional[LastPlayView]
+    current_player_id: Optional[str]
+    shot_risk: Mapping[str, float] # 存活玩家下一枪中弹的公开概率 (见 risk.py)
+
+    @property
+    def group_id(self) -> str: return split_table_key(self.table_key)[0]
+
+# --- 牌桌键 ---
+def make_table_key(group_id: str, table_name: str = "") -> str:
+    return f"{group_id}{TABLE_KEY_SEP}{table_name}" if table_name else group_id
+
+def split_table_key(table_key: str) -> Tuple[str, str]:
+    """返回 (群号, 桌名)，默认桌的桌名为空串"""
+    group_id, _, table_name = table_key.partition(TABLE_KEY_SEP); return group_id, table_name
 
 # --- Helper for Gun Initialization (保持不变) ---
-def initialize_gun() -> Tuple[List[str], int]:
-    """Initializes gun chamber and pointer."""
+def initialize_gun() -> Tuple[int, int]:
+    """Initializes gun chamber mask and pointer."""
     live_count = LIVE_BULLETS
     empty_count = GUN_CHAMBERS - live_count
     if empty_count < 0:
@@ -81,8 +139,8 @@ def initialize_gun() -> Tuple[List[str], int]:
          empty_count = 1
          live_count = GUN_CHAMBERS - 1
 
-    bullets = ["空弹"] * empty_count + ["实弹"] * live_count
-    random.shuffle(bullets)
+    mask = 0
+    for chamber in random.sample(range(GUN_CHAMBERS), live_count): mask |= 1 << chamber
     position = random.randint(0, GUN_CHAMBERS - 1)
-    logger.debug(f"Initialized gun: Bullets={bullets}, StartPosition={position}")
-    return bullets, position
\ No newline at end of file
+    logger.debug(f"Initialized gun: Mask={mask:0{GUN_CHAMBERS}b}, StartPosition={position}")
+    return mask, position
\ No newline at end of file
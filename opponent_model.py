@@ -0,0 +1,118 @@
+# liar_tavern/opponent_model.py
+
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import logging
+from typing import Any, Container, Dict, Iterable, List, Optional, Tuple
+
+from .models import ChallengeResult
+
+logger = logging.getLogger(__name__)
+
+# 每名玩家 4 个 8 位计数器打包进一个 int: 被翻牌次数 / 其中吹牛次数 / 可质疑的回合数 / 其中质疑次数
+_REVEALS, _BLUFFS, _CHANCES, _CHALLENGES = 0, 8, 16, 24
+_COUNTER_MAX = 0xFF
+_HALVE_MASK = 0x7F7F7F7F # 四个计数器同时右移一位后清掉跨字节借位
+MIN_SAMPLES = 3 # 少于此样本数时摘要里标为“样本少”
+
+def _get(packed: int, shift: int) -> int: return packed >> shift & _COUNTER_MAX
+def _key(player_id: str): return int(player_id) if player_id.isdigit() else player_id # QQ 号存为 int，比 str 省约一半内存
+
+class OpponentModel:
+    """在线的对手画像: 每名玩家的吹牛率与质疑率。
+
+    每次质疑翻牌或跟牌都只做 O(1) 的计数更新；任一计数器达到 255 时四个计数器一起减半，
+    既保持比例又让旧行为逐渐失去权重。估计值使用 Beta 先验平滑 (吹牛率先验 1/2，质疑率先验 1/3)，
+    因此新玩家也能给出合理的默认值。
+
+    淘汰采用两代字典: 更新写入当前代，当前代满 max_players/2 时丢弃上一代 (这一整代里没再更新过的玩家)，
+    当前代变为上一代。相比逐条 LRU 链表，每名玩家只占一个普通 dict 条目。
+    """
+
+    def __init__(self, max_players: int = 200000):
+        self.max_players = max_players
+        self._current: Dict[Any, int] = {}
+        self._previous: Dict[Any, int] = {}
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def __contains__(self, player_id: str) -> bool:
+        key = _key(player_id); return key in self._current or key in self._previous
+
+    def _packed(self, player_id: str) -> int:
+        key = _key(player_id); packed = self._current.get(key)
+        return packed if packed is not None else self._previous.get(key, 0)
+
+    def _bump(self, player_id: str, shifts: Iterable[int]) -> None:
+        key = _key(player_id); packed = self._current.get(key)
+        if packed is None: packed = self._previous.pop(key, 0) # 上一代的条目更新时提升到当前代
+        for shift in shifts:
+            if _get(packed, shift) == _COUNTER_MAX: packed = packed >> 1 & _HALVE_MASK
+            packed += 1 << shift
+        self._current[key] = packed
+        if len(self._current) >= max(1, self.max_players // 2): self._rotate()
+
+    def _rotate(self) -> None:
+        self.evicted += len(self._previous)
+        self._previous = self._current; self._current = {}
+
+    # --- 更新 ---
+    def observe(self, result: Dict[str, Any], acting_player_id: Optional[str] = None, ignore: Container[str] = ()) -> None:
+        """根据引擎动作结果更新画像: 质疑结算翻牌时记录双方，跟牌/等待时记录一次“未质疑”。
+        ignore 中的玩家不记录 (AI 座位的 ID 每局随机生成，记下来只会占满画像)。"""
+        action = result.get("action")
+        if action == "challenge":
+            challenger_id = result.get("challenger_id"); challenged_id = result.get("challenged_player_id")
+            if challenger_id and challenger_id not in ignore: self._bump(challenger_id, (_CHANCES, _CHALLENGES))
+            if challenged_id and challenged_id not in ignore: self._bump(challenged_id, (_REVEALS, _BLUFFS) if result.get("challenge_result") == ChallengeResult.SUCCESS else (_REVEALS,))
+        elif action in ("play", "wait") and result.get("accepted_play_info"):
+            player_id = acting_player_id or result.get("player_id") or result.get("player_who_played_id")
+            if player_id and player_id not in ignore: self._bump(player_id, (_CHANCES,))
+
+    # --- 查询 ---
+    def counts(self, player_id: str) -> Tuple[int, int, int, int]:
+        """(被翻牌次数, 吹牛次数, 可质疑回合数, 质疑次数)"""
+        packed = self._packed(player_id)
+        return _get(packed, _REVEALS), _get(packed, _BLUFFS), _get(packed, _CHANCES), _get(packed, _CHALLENGES)
+
+    def bluff_rate(self, player_id: str) -> float:
+        reveals, bluffs, _chances, _challenges = self.counts(player_id)
+        return (bluffs + 1) / (reveals + 2)
+
+    def challenge_rate(self, player_id: str) -> float:
+        _reveals, _bluffs, chances, challenges = self.counts(player_id)
+        return (challenges + 1) / (chances + 3)
+
+    def summary_line(self, player_id: str, name: str) -> str:
+        """提示词用的一行摘要，如 “张三: 吹牛 60% (3/5), 质疑 22% (2/9)”"""
+        reveals, bluffs, chances, challenges = self.counts(player_id)
+        if reveals + chances < MIN_SAMPLES: return f"{name}: 样本少"
+        parts = []
+        if reveals: parts.append(f"吹牛 {self.bluff_rate(player_id):.0%} ({bluffs}/{reveals})")
+        if chances: parts.append(f"质疑 {self.challenge_rate(player_id):.0%} ({challenges}/{chances})")
+        return f"{name}: " + ", ".join(parts)
+
+    # --- 持久化 ---
+    def snapshot(self) -> List[Tuple[str, int]]:
+        """[(玩家ID, 打包计数), ...]，上一代在前。应在事件循环内调用，写文件可交给线程。"""
+        return [(str(key), packed) for generation in (self._previous, self._current) for key, packed in generation.items()]
+
+    @staticmethod
+    def write_snapshot(path: str, snapshot: List[Tuple[str, int]]) -> int:
+        directory = os.path.dirname(path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f: json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, path); return len(snapshot)
+
+    def load(self, path: str) -> int:
+        """读入 snapshot() 写出的文件。只保留最后 max_players // 2 条 (快照中上一代在前，末尾是最近更新的玩家)，
+        全部放入当前代；更早的条目视为已淘汰，不计入 evicted。返回载入后的玩家数。"""
+        if not os.path.exists(path): return 0
+        with open(path, "r", encoding="utf-8") as f: snapshot: List[Tuple[str, int]] = json.load(f)
+        for player_id, packed in snapshot[-(self.max_players // 2):]: self._current[_key(str(player_id))] = int(packed) # 只保留最近的半代，其余视为过期
+        return len(self)
@@ -0,0 +1,213 @@
+# liar_tavern/player_stats.py
+
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import sqlite3
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import GameState, ChallengeResult, ShotResult
+
+logger = logging.getLogger(__name__)
+
+# 统计列 (顺序即增量数组的下标)
+STAT_FIELDS = ("games", "wins", "challenges", "challenges_won", "bluffs_caught", "shots_fired", "shots_survived")
+_GAMES, _WINS, _CHALLENGES, _CHALLENGES_WON, _BLUFFS_CAUGHT, _SHOTS_FIRED, _SHOTS_SURVIVED = range(len(STAT_FIELDS))
+GLOBAL_SCOPE = "*" # 跨群汇总行使用的 group_id
+
+# 排行榜: 名称 -> (分数表达式, 同分时的次序, 额外过滤条件)；ORDER BY 与下方索引的列完全一致，查询无需排序
+LEADERBOARD_METRICS: Dict[str, Tuple[str, str, str]] = {
+    "胜场": ("wins", "games ASC", ""),
+    "胜率": ("CAST(wins AS REAL) / games", "games DESC", "AND games > 0 AND games >= ?"), # games > 0 与部分索引的 WHERE 相同，规划器才会选用该索引
+    "抓谎": ("challenges_won", "games ASC", ""),
+    "幸存": ("shots_survived", "games ASC", ""),
+}
+LEADERBOARD_ALIASES = {"wins": "胜场", "winrate": "胜率", "catches": "抓谎", "survived": "幸存"}
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS player_stats (
+    group_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    {", ".join(f"{field} INTEGER NOT NULL DEFAULT 0" for field in STAT_FIELDS)},
+    updated_at INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_player_stats_wins ON player_stats (group_id, wins DESC, games ASC);
+CREATE INDEX IF NOT EXISTS idx_player_stats_winrate ON player_stats (group_id, (CAST(wins AS REAL) / games) DESC, games DESC) WHERE games > 0;
+CREATE INDEX IF NOT EXISTS idx_player_stats_catches ON player_stats (group_id, challenges_won DESC, games ASC);
+CREATE INDEX IF NOT EXISTS idx_player_stats_survived ON player_stats (group_id, shots_survived DESC, games ASC);
+CREATE TABLE IF NOT EXISTS group_stats (
+    group_id TEXT PRIMARY KEY,
+    games INTEGER NOT NULL DEFAULT 0,
+    last_played INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+"""
+_UPSERT_PLAYER = f"""
+INSERT INTO player_stats (group_id, user_id, name, {", ".join(STAT_FIELDS)}, updated_at) VALUES ({", ".join("?" * (len(STAT_FIELDS) + 4))})
+ON CONFLICT (group_id, user_id) DO UPDATE SET name = excluded.name, {", ".join(f"{field} = {field} + excluded.{field}" for field in STAT_FIELDS)}, updated_at = excluded.updated_at
+"""
+_UPSERT_GROUP = """
+INSERT INTO group_stats (group_id, games, last_played) VALUES (?, ?, ?)
+ON CONFLICT (group_id) DO UPDATE SET games = games + excluded.games, last_played = excluded.last_played
+"""
+
+class PlayerStatsStore:
+    """玩家/群战绩的 SQLite 存储，写后批量落盘。
+
+    record_* 只在内存里合并增量 (事件循环上 O(玩家数))，后台任务每 flush_interval 秒把整批增量
+    在单个事务中 upsert；所有 SQLite 访问都在一个专用线程里进行，事件循环从不等待磁盘。
+    每条增量同时写入本群行与 group_id="*" 的全局行，排行榜查询都是按索引的范围扫描 + LIMIT。
+    """
+
+    def __init__(self, db_path: str, flush_interval: float = 5.0, max_pending: int = 2000):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending # 待写玩家行超过此数时提前落盘
+        self._pending: Dict[Tuple[str, str], List[int]] = {}
+        self._names: Dict[Tuple[str, str], str] = {}
+        self._pending_groups: Dict[str, int] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="liar_stats")
+        self._conn: Optional[sqlite3.Connection] = None # 仅在专用线程中使用
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.flushed_batches = 0
+        self.flushed_rows = 0
+
+    # --- 记录 (事件循环内调用) ---
+    def _delta(self, group_id: str, user_id: str, name: str) -> List[int]:
+        key = (group_id, user_id); self._names[key] = name
+        delta = self._pending.get(key)
+        if delta is None: delta = self._pending[key] = [0] * len(STAT_FIELDS)
+        return delta
+
+    def _add(self, group_id: str, user_id: str, name: str, index: int) -> None:
+        for scope in (group_id, GLOBAL_SCOPE): self._delta(scope, user_id, name)[index] += 1
+
+    def record_challenge(self, group_id: str, result: Dict[str, Any], players: Dict[str, Any]) -> None:
+        """根据质疑结算结果记录: 发起质疑/质疑成功、吹牛被抓、开枪与幸存 (AI 玩家不计)"""
+        challenger_id = result.get("challenger_id"); challenged_id = result.get("challenged_player_id"); loser_id = result.get("loser_id")
+        challenger = players.get(challenger_id)
+        if challenger and not challenger.is_ai:
+            self._add(group_id, challenger_id, challenger.name, _CHALLENGES)
+            if result.get("challenge_result") == ChallengeResult.SUCCESS: self._add(group_id, challenger_id, challenger.name, _CHALLENGES_WON)
+        challenged = players.get(challenged_id)
+        if challenged and not challenged.is_ai and result.get("challenge_result") == ChallengeResult.SUCCESS: self._add(group_id, challenged_id, challenged.name, _BLUFFS_CAUGHT)
+        loser = players.get(loser_id)
+        if loser and not loser.is_ai and result.get("shot_outcome") in (ShotResult.SAFE, ShotResult.HIT):
+            self._add(group_id, loser_id, loser.name, _SHOTS_FIRED)
+            if result.get("shot_outcome") == ShotResult.SAFE: self._add(group_id, loser_id, loser.name, _SHOTS_SURVIVED)
+        self._after_record()
+
+    def record_game(self, group_id: str, state: GameState, winner_id: Optional[str]) -> None:
+        """记录一局结束: 所有人类玩家局数 +1，胜者胜场 +1"""
+        for pid, player in state.players.items():
+            if player.is_ai: continue
+            self._add(group_id, pid, player.name, _GAMES)
+            if pid == winner_id: self._add(group_id, pid, player.name, _WINS)
+        self._pending_groups[group_id] = self._pending_groups.get(group_id, 0) + 1
+        self._after_record()
+
+    def _after_record(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            try: self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+            except RuntimeError: return # 无事件循环 (如脚本直接调用)，等待显式 flush
+        if len(self._pending) >= self.max_pending and self._wakeup: self._wakeup.set()
+
+    @property
+    def pending_rows(self) -> int:
+        return len(self._pending)
+
+    # --- 落盘 ---
+    async def _flush_loop(self):
+        self._wakeup = asyncio.Event()
+        while True:
+            try: await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError: pass
+            self._wakeup.clear()
+            try: await self.flush()
+            except Exception as e: logger.error(f"战绩落盘失败，将在下次重试: {e}", exc_info=True)
+
+    async def flush(self) -> int:
+        """把当前累积的增量写入数据库，返回写入的玩家行数"""
+        if self._flush_lock is None: self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending and not self._pending_groups: return 0
+            pending, names, groups = self._pending, self._names, self._pending_groups
+            self._pending = {}; self._names = {}; self._pending_groups = {}
+            now = int(time.time())
+            player_rows = [(group_id, user_id, names.get((group_id, user_id), ""), *delta, now) for (group_id, user_id), delta in pending.items()]
+            group_rows = [(group_id, count, now) for group_id, count in groups.items()]
+            try: await self._run(self._write_batch, player_rows, group_rows)
+            except Exception:
+                self._merge_back(pending, names, groups); raise
+            self.flushed_batches += 1; self.flushed_rows += len(player_rows)
+            return len(player_rows)
+
+    def _merge_back(self, pending, names, groups) -> None:
+        """写入失败时把增量并回缓冲区，期间新产生的增量不会丢失"""
+        for key, delta in pending.items():
+            current = self._pending.get(key)
+            if current is None: self._pending[key] = delta
+            else: self._pending[key] = [a + b for a, b in zip(current, delta)]
+            self._names.setdefault(key, names.get(key, ""))
+        for group_id, count in groups.items(): self._pending_groups[group_id] = self._pending_groups.get(group_id, 0) + count
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path)
+            conn.execute("PRAGMA journal_mode=WAL"); conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA); self._conn = conn
+        return self._conn
+
+    def _write_batch(self, player_rows: List[tuple], group_rows: List[tuple]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(_UPSERT_PLAYER, player_rows)
+            if group_rows: conn.executemany(_UPSERT_GROUP, group_rows)
+
+    # --- 查询 ---
+    async def leaderboard(self, group_id: str, metric: str = "胜场", limit: int = 10, min_games: int = 5) -> List[Dict[str, Any]]:
+        """按指标返回排行 (group_id 为 GLOBAL_SCOPE 时为全局榜)；查询前先落盘，保证包含刚结束的对局"""
+        await self.flush()
+        return await self._run(self._query_leaderboard, group_id, metric, limit, min_games)
+
+    def _query_leaderboard(self, group_id: str, metric: str, limit: int, min_games: int) -> List[Dict[str, Any]]:
+        order, tie_break, extra = LEADERBOARD_METRICS[metric]
+        params: List[Any] = [group_id] + ([min_games] if extra else []) + [limit]
+        sql = f"SELECT user_id, name, {', '.join(STAT_FIELDS)}, {order} AS score FROM player_stats WHERE group_id = ? {extra} ORDER BY {order} DESC, {tie_break} LIMIT ?"
+        columns = ("user_id", "name") + STAT_FIELDS + ("score",)
+        return [dict(zip(columns, row)) for row in self._connect().execute(sql, params)]
+
+    async def player(self, group_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        await self.flush()
+        return await self._run(self._query_player, group_id, user_id)
+
+    def _query_player(self, group_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(f"SELECT name, {', '.join(STAT_FIELDS)} FROM player_stats WHERE group_id = ? AND user_id = ?", (group_id, user_id)).fetchone()
+        return dict(zip(("name",) + STAT_FIELDS, row)) if row else None
+
+    async def group_games(self, group_id: str) -> int:
+        await self.flush()
+        row = await self._run(lambda: self._connect().execute("SELECT games FROM group_stats WHERE group_id = ?", (group_id,)).fetchone())
+        return row[0] if row else 0
+
+    async def close(self) -> None:
+        """停止后台任务并把剩余增量写完"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        try: await self.flush()
+        except Exception as e: logger.error(f"关闭时写入战绩失败，{len(self._pending)} 行增量丢失: {e}")
+        if self._conn is not None: await self._run(self._conn.close); self._conn = None
+        self._executor.shutdown(wait=False)
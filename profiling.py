@@ -0,0 +1,66 @@
+# liar_tavern/profiling.py
+
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import time
+import cProfile
+import pstats
+import logging
+from contextlib import contextmanager
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TableProfiler:
+    """针对单个群的 cProfile 采集会话，覆盖接下来 N 个回合。
+
+    cProfile 是进程级的: 分析区段内若有 await，同一时间段其它协程的开销也会被计入，
+    因此同一时刻只允许一个会话。
+    """
+
+    def __init__(self, group_id: str, turns: int, output_dir: str, top_n: int = 12):
+        self.group_id = group_id
+        self.turns_total = turns
+        self.turns_remaining = turns
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.started_at = time.time()
+        self._profile = cProfile.Profile()
+        self._depth = 0 # 嵌套区段计数 (人类命令 -> 结果广播 -> ...)
+
+    @contextmanager
+    def section(self):
+        if self._depth == 0: self._profile.enable()
+        self._depth += 1
+        try: yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0: self._profile.disable()
+
+    def finish_turn(self) -> bool:
+        """记录完成一个回合；返回是否已达到目标回合数"""
+        self.turns_remaining -= 1
+        return self.turns_remaining <= 0
+
+    def dump(self) -> Tuple[str, List[str]]:
+        """写出按累计时间排序的统计文件，返回 (文件路径, 前 N 条摘要)。可在线程中调用。"""
+        if self._depth: self._profile.disable(); self._depth = 0
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.localtime(self.started_at))
+        safe_key = re.sub(r"[^\w.-]", "_", self.group_id) # 牌桌键含用户输入的桌名，不能带路径分隔符等字符进入文件名
+        base = os.path.join(self.output_dir, f"profile_{safe_key}_{stamp}")
+        self._profile.dump_stats(base + ".prof")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            stats = pstats.Stats(self._profile, stream=f); stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(50)
+        return base + ".prof", self.top_entries()
+
+    def top_entries(self) -> List[str]:
+        stats = pstats.Stats(self._profile).stats # {(file, line, func): (cc, nc, tt, ct, callers)}
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.top_n]
+        lines = []
+        for (filename, lineno, func), (_cc, nc, tt, ct, _callers) in rows:
+            location = f"{os.path.basename(filename)}:{lineno}" if lineno else filename
+            lines.append(f"{ct * 1000:.1f}ms (自身 {tt * 1000:.1f}ms, {nc}次) {func} [{location}]")
+        return lines
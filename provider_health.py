@@ -0,0 +1,93 @@
+# liar_tavern/provider_health.py
+
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED, OPEN, HALF_OPEN = "正常", "熔断", "试探"
+PING_TIMEOUT = 15.0 # 预热/保活请求的超时 (秒)
+PROBE_TIMEOUT = 60.0 # 试探调用超过这么久仍无结果 (请求丢失) 时放行下一次试探 (秒)
+PING_PROMPT = "ping，只回复 OK" # 提供方没有模型列表接口时，用这句极短的对话预热
+
+class ProviderHealth:
+    """单个 LLM 提供方的健康分与熔断器。
+
+    健康分是调用结果的指数滑动平均 (成功记 1，异常/超时记 0)，同时记录成功调用的平均耗时。
+    连续失败达到 min_failures 且健康分低于 open_below 时熔断: 冷却期内 available() 为 False，
+    AI 回合直接使用备用决策；冷却结束后进入试探状态，只放行一个试探调用 (其余调用者仍按熔断处理)，成功即恢复，
+    失败则以加倍的冷却期 (有上限) 再次熔断；试探超过 probe_timeout 仍无结果时放行下一个试探，丢失的试探不会卡住熔断器。
+    解析失败等“回答了但答得不对”的情况不影响健康分。
+    """
+
+    def __init__(self, name: str, alpha: float = 0.3, open_below: float = 0.35, degraded_below: float = 0.6, min_failures: int = 3,
+                 cooldown: float = 30.0, max_cooldown: float = 300.0, probe_timeout: float = PROBE_TIMEOUT, clock: Callable[[], float] = time.monotonic):
+        self.name = name; self.alpha = alpha; self.open_below = open_below; self.degraded_below = degraded_below; self.min_failures = min_failures
+        self.base_cooldown = cooldown; self.max_cooldown = max_cooldown; self.probe_timeout = probe_timeout; self._clock = clock
+        self.score = 1.0
+        self.latency: Optional[float] = None # 成功调用耗时的滑动平均 (秒)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None # 试探状态下已放行的试探调用的放行时刻
+        self.calls = 0; self.failures = 0; self.timeouts = 0; self.skipped = 0
+        self.last_used = float("-inf") # 最近一次请求 (含预热) 结束的时刻，用于判断连接是否可能已被空闲回收
+        self.warmups = 0
+
+    def available(self) -> bool:
+        """是否应该调用该提供方；熔断中 (及试探调用未有结果时) 返回 False 并计入 skipped。
+        试探状态下返回 True 的调用者须以 record_success/record_failure 报告结果，没有发出请求时调用 abandon_probe()"""
+        if self.state == CLOSED: return True
+        now = self._clock()
+        if self.state == OPEN:
+            if now - self.opened_at < self.cooldown: self.skipped += 1; return False
+            self.state = HALF_OPEN; self.probe_started = None; logger.info(f"LLM 提供方 {self.name} 冷却结束，试探调用。")
+        if self.probe_started is not None:
+            if now - self.probe_started < self.probe_timeout: self.skipped += 1; return False
+            logger.warning(f"LLM 提供方 {self.name} 的试探调用 {self.probe_timeout:.0f}s 无结果，重新试探。")
+        self.probe_started = now; return True
+
+    def abandon_probe(self) -> None:
+        """拿到试探名额却没有发出请求 (预算不足、排队超时、任务取消): 让出名额给下一个调用者"""
+        if self.state == HALF_OPEN: self.probe_started = None
+
+    @property
+    def healthy(self) -> bool:
+        """未熔断且健康分不低于 degraded_below；不健康时只保留必要的调用 (如 AI 决策)，跳过垃圾话等可选调用"""
+        return self.state == CLOSED and self.score >= self.degraded_below
+
+    def expected_latency(self, default: float) -> float:
+        return self.latency if self.latency is not None else default
+
+    def idle_for(self) -> float:
+        return self._clock() - self.last_used
+
+    def record_warmup(self) -> None:
+        """预热/保活请求成功: 只刷新空闲时间，不计入健康分与平均耗时 (轻量请求的耗时不代表一次对话)"""
+        self.warmups += 1; self.last_used = self._clock()
+
+    def record_success(self, elapsed: float) -> None:
+        self.last_used = self._clock(); self.calls += 1; self.score += self.alpha * (1.0 - self.score); self.consecutive_failures = 0
+        self.latency = elapsed if self.latency is None else self.latency + self.alpha * (elapsed - self.latency)
+        if self.state != CLOSED: logger.info(f"LLM 提供方 {self.name} 已恢复 (健康分 {self.score:.2f})。")
+        self.state = CLOSED; self.cooldown = self.base_cooldown; self.probe_started = None
+
+    def record_failure(self, timeout: bool = False) -> None:
+        self.last_used = self._clock(); self.calls += 1; self.failures += 1; self.timeouts += timeout
+        self.score -= self.alpha * self.score; self.consecutive_failures += 1; self.probe_started = None
+        if self.state == HALF_OPEN: self.cooldown = min(self.max_cooldown, self.cooldown * 2); self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.min_failures and self.score < self.open_below: self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN; self.opened_at = self._clock()
+        logger.warning(f"LLM 提供方 {self.name} 连续失败 {self.consecutive_failures} 次 (健康分 {self.score:.2f})，熔断 {self.cooldown:.0f}s。")
+
+    def summary(self) -> str:
+        latency = f"{self.latency:.1f}s" if self.latency is not None else "-"
+        return (f"{self.name}: 健康分 {self.score:.2f} ({self.state}) | 平均耗时 {latency} | "
+                f"调用 {self.calls} 次，失败 {self.failures} (超时 {self.timeouts})，熔断跳过 {self.skipped}，预热/保活 {self.warmups} 次")
@@ -0,0 +1,316 @@
+# liar_tavern/replay.py
+
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import base64
+import sqlite3
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from .models import GameState, PlayerData, GameStatus, ChallengeResult, ShotResult, CARD_TYPES_BASE, JOKER
+from .exceptions import ReplayError
+from .game_logic import LiarDiceGame
+
+logger = logging.getLogger(__name__)
+
+# --- 二进制格式 ---
+# 头部: MAGIC, 版本, varint(开始时间), varint(结束时间), 字符串表, 玩家表, 座次, 事件流
+# 字符串表 (群号/玩家ID/昵称) 只写一次，其余位置用下标引用；每张牌 2 位，一字节 4 张。
+# 事件头为 varint(玩家下标 << 3 | 操作码):
+#   DEAL      头部玩家位存主牌编码；随后 varint(人数)，每人 varint(玩家下标) + 手牌
+#   PLAY      1 字节: 低 2 位张数，其余每 2 位一张牌
+#   CHALLENGE 1 字节: bit0 质疑成功，bit1 中弹
+#   WAIT / END (END 的玩家位为 胜者下标 + 1，0 表示无人)
+#   SKIP      回合外推进 (跳过无效/已淘汰的玩家)，玩家位为推进后的当前玩家；不计回合
+MAGIC = b"LTR"
+REPLAY_FORMAT_VERSION = 1
+OP_DEAL, OP_PLAY, OP_CHALLENGE, OP_WAIT, OP_END, OP_SKIP = range(6)
+_CARDS = list(CARD_TYPES_BASE) + [JOKER]
+_CARD_CODE = {card: code for code, card in enumerate(_CARDS)}
+
+def _write_varint(buf: bytearray, value: int) -> None:
+    while value >= 0x80: buf.append(value & 0x7F | 0x80); value >>= 7
+    buf.append(value)
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(data): raise ReplayError("回放数据被截断")
+        byte = data[pos]; pos += 1; value |= (byte & 0x7F) << shift
+        if byte < 0x80: return value, pos
+        shift += 7
+
+def _write_cards(buf: bytearray, cards: List[str]) -> None:
+    _write_varint(buf, len(cards))
+    for start in range(0, len(cards), 4):
+        byte = 0
+        for i, card in enumerate(cards[start:start + 4]): byte |= _CARD_CODE[card] << (2 * i)
+        buf.append(byte)
+
+def _read_cards(data: bytes, pos: int) -> Tuple[List[str], int]:
+    count, pos = _read_varint(data, pos); cards = []
+    for start in range(0, count, 4):
+        if pos >= len(data): raise ReplayError("回放数据被截断")
+        byte = data[pos]; pos += 1
+        cards.extend(_CARDS[byte >> (2 * i) & 3] for i in range(min(4, count - start)))
+    return cards, pos
+
+@dataclass
+class ReplaySeat:
+    id: str
+    name: str
+    is_ai: bool
+    gun: int # 弹膛位掩码
+    gun_chambers: int
+    gun_position: int
+
+@dataclass
+class ReplayEvent:
+    op: int
+    player: int = -1 # 玩家下标 (END 为胜者下标，-1 表示无人；SKIP 为推进后的当前玩家)
+    cards: List[str] = field(default_factory=list) # PLAY 打出的牌
+    success: bool = False # CHALLENGE: 质疑成功 (出牌者撒谎)
+    hit: bool = False # CHALLENGE: 输家中弹
+    main_card: Optional[str] = None # DEAL
+    hands: List[Tuple[int, List[str]]] = field(default_factory=list) # DEAL: [(玩家下标, 手牌)]
+
+@dataclass
+class Replay:
+    group_id: str
+    started_at: int
+    ended_at: int
+    seats: List[ReplaySeat]
+    seating: List[int] # 回合顺序 (玩家下标)
+    events: List[ReplayEvent]
+
+    @property
+    def winner(self) -> Optional[ReplaySeat]:
+        end = self.events[-1] if self.events and self.events[-1].op == OP_END else None
+        return self.seats[end.player] if end and end.player >= 0 else None
+
+    @property
+    def turn_count(self) -> int:
+        return sum(1 for e in self.events if e.op in (OP_PLAY, OP_CHALLENGE, OP_WAIT))
+
+def encode_replay(replay: Replay) -> bytes:
+    strings: Dict[str, int] = {}
+    def intern(text: str) -> int: return strings.setdefault(text, len(strings))
+    group_ref = intern(replay.group_id); seat_refs = [(intern(s.id), intern(s.name)) for s in replay.seats]
+    buf = bytearray(MAGIC); buf.append(REPLAY_FORMAT_VERSION)
+    _write_varint(buf, replay.started_at); _write_varint(buf, max(0, replay.ended_at - replay.started_at))
+    _write_varint(buf, len(strings))
+    for text in strings: raw = text.encode("utf-8"); _write_varint(buf, len(raw)); buf += raw
+    _write_varint(buf, group_ref); _write_varint(buf, len(replay.seats))
+    for seat, (id_ref, name_ref) in zip(replay.seats, seat_refs):
+        _write_varint(buf, id_ref); _write_varint(buf, name_ref); _write_varint(buf, seat.gun_chambers << 1 | int(seat.is_ai))
+        _write_varint(buf, seat.gun); _write_varint(buf, seat.gun_position)
+    _write_varint(buf, len(replay.seating))
+    for index in replay.seating: _write_varint(buf, index)
+    for event in replay.events:
+        if event.op == OP_DEAL:
+            _write_varint(buf, _CARD_CODE[event.main_card] << 3 | OP_DEAL); _write_varint(buf, len(event.hands))
+            for index, hand in event.hands: _write_varint(buf, index); _write_cards(buf, hand)
+        elif event.op == OP_PLAY:
+            _write_varint(buf, event.player << 3 | OP_PLAY); byte = len(event.cards)
+            for i, card in enumerate(event.cards): byte |= _CARD_CODE[card] << (2 + 2 * i)
+            buf.append(byte)
+        elif event.op == OP_CHALLENGE: _write_varint(buf, event.player << 3 | OP_CHALLENGE); buf.append(int(event.success) | int(event.hit) << 1)
+        elif event.op == OP_WAIT: _write_varint(buf, event.player << 3 | OP_WAIT)
+        elif event.op == OP_END: _write_varint(buf, (event.player + 1) << 3 | OP_END)
+        elif event.op == OP_SKIP: _write_varint(buf, event.player << 3 | OP_SKIP)
+    return bytes(buf)
+
+def decode_replay(data: bytes) -> Replay:
+    if data[:3] != MAGIC: raise ReplayError("不是骗子酒馆回放数据")
+    if len(data) < 4 or data[3] != REPLAY_FORMAT_VERSION: raise ReplayError(f"不支持的回放格式版本: {data[3] if len(data) > 3 else '?'}")
+    pos = 4; started_at, pos = _read_varint(data, pos); duration, pos = _read_varint(data, pos)
+    count, pos = _read_varint(data, pos); strings = []
+    for _ in range(count):
+        length, pos = _read_varint(data, pos); strings.append(data[pos:pos + length].decode("utf-8")); pos += length
+    try:
+        group_ref, pos = _read_varint(data, pos); count, pos = _read_varint(data, pos); seats = []
+        for _ in range(count):
+            id_ref, pos = _read_varint(data, pos); name_ref, pos = _read_varint(data, pos); flags, pos = _read_varint(data, pos)
+            gun_mask, pos = _read_varint(data, pos); gun_position, pos = _read_varint(data, pos)
+            seats.append(ReplaySeat(strings[id_ref], strings[name_ref], bool(flags & 1), gun_mask, flags >> 1, gun_position))
+        count, pos = _read_varint(data, pos); seating = []
+        for _ in range(count): index, pos = _read_varint(data, pos); seating.append(index)
+        events = []
+        while pos < len(data):
+            head, pos = _read_varint(data, pos); op = head & 7; arg = head >> 3
+            if op == OP_DEAL:
+                count, pos = _read_varint(data, pos); hands = []
+                for _ in range(count): index, pos = _read_varint(data, pos); hand, pos = _read_cards(data, pos); hands.append((index, hand))
+                events.append(ReplayEvent(OP_DEAL, main_card=_CARDS[arg], hands=hands))
+            elif op == OP_PLAY:
+                byte = data[pos]; pos += 1
+                events.append(ReplayEvent(OP_PLAY, arg, cards=[_CARDS[byte >> (2 + 2 * i) & 3] for i in range(byte & 3)]))
+            elif op == OP_CHALLENGE: byte = data[pos]; pos += 1; events.append(ReplayEvent(OP_CHALLENGE, arg, success=bool(byte & 1), hit=bool(byte & 2)))
+            elif op == OP_WAIT: events.append(ReplayEvent(OP_WAIT, arg))
+            elif op == OP_END: events.append(ReplayEvent(OP_END, arg - 1))
+            elif op == OP_SKIP: events.append(ReplayEvent(OP_SKIP, arg))
+            else: raise ReplayError(f"未知的回放操作码: {op}")
+    except IndexError as e: raise ReplayError(f"回放数据损坏: {e}") from e
+    return Replay(strings[group_ref], started_at, started_at + duration, seats, seating, events)
+
+def replay_to_code(data: bytes) -> str: return base64.b64encode(data).decode("ascii")
+def replay_from_code(code: str) -> bytes:
+    try: return base64.b64decode("".join(code.split()), validate=True)
+    except ValueError as e: raise ReplayError(f"回放码无效: {e}") from e
+
+# --- 录制 ---
+class ReplayRecorder:
+    """跟随一局游戏录制回放: start_game 之后创建，record() 接收每个引擎动作结果，finish() 输出字节"""
+
+    def __init__(self, group_id: str, state: GameState):
+        self.group_id = group_id; self.started_at = int(time.time())
+        self._index = {pid: i for i, pid in enumerate(state.players)}
+        self.seats = [ReplaySeat(p.id, p.name, p.is_ai, p.gun, p.gun_chambers, p.gun_position or 0) for p in state.players.values()]
+        self.seating = [self._index[pid] for pid in state.turn_order]
+        self.events: List[ReplayEvent] = [self._deal(state.main_card, {pid: p.hand for pid, p in state.players.items() if not p.is_eliminated})]
+
+    def _deal(self, main_card: str, hands: Dict[str, List[str]]) -> ReplayEvent:
+        return ReplayEvent(OP_DEAL, main_card=main_card, hands=[(self._index[pid], list(hand)) for pid, hand in hands.items()])
+
+    def record(self, result: Dict[str, Any], acting_player_id: Optional[str]) -> None:
+        action = result.get("action"); index = self._index.get(acting_player_id, -1)
+        if action == "play": self.events.append(ReplayEvent(OP_PLAY, index, cards=list(result.get("actual_cards") or result.get("played_cards") or [])))
+        elif action == "challenge":
+            index = self._index.get(result.get("challenger_id"), index)
+            self.events.append(ReplayEvent(OP_CHALLENGE, index, success=result.get("challenge_result") == ChallengeResult.SUCCESS, hit=result.get("shot_outcome") == ShotResult.HIT))
+        elif action == "wait": self.events.append(ReplayEvent(OP_WAIT, index))
+        else: return
+        if result.get("reshuffled") and result.get("new_hands"): self.events.append(self._deal(result.get("new_main_card"), result["new_hands"]))
+
+    def skip(self, next_player_id: str) -> None:
+        """引擎动作之外的回合推进 (插件跳过无效/已淘汰的玩家)，重放时据此同样推进"""
+        self.events.append(ReplayEvent(OP_SKIP, self._index.get(next_player_id, -1)))
+
+    def finish(self, winner_id: Optional[str]) -> bytes:
+        self.events.append(ReplayEvent(OP_END, self._index.get(winner_id, -1)))
+        return encode_replay(Replay(self.group_id, self.started_at, int(time.time()), self.seats, self.seating, self.events))
+
+# --- 重放 ---
+class ReplayCursor:
+    """用 LiarDiceGame 逐回合重放: step() 前进一回合，seek(n) 快进/回退到第 n 回合 (回退即从头重放)。
+
+    洗牌时引擎会重新随机发牌，重放时用录制的发牌结果覆盖；质疑结果与开枪结果会与录制值核对，不一致时抛出 ReplayError。
+    回合外的推进 (SKIP) 紧跟在上一回合之后执行，不计回合。
+    """
+
+    def __init__(self, replay: Replay):
+        self.replay = replay; self.reset()
+
+    def reset(self) -> None:
+        replay = self.replay; first = replay.events[0] if replay.events else None
+        if not first or first.op != OP_DEAL: raise ReplayError("回放缺少初始发牌")
+        state = GameState(status=GameStatus.PLAYING, main_card=first.main_card, turn_order=[replay.seats[i].id for i in replay.seating], current_player_index=0, round_start_reason="游戏开始")
+        for seat in replay.seats: state.players[seat.id] = PlayerData(id=seat.id, name=seat.name, gun=seat.gun, gun_position=seat.gun_position, gun_chambers=seat.gun_chambers, is_ai=seat.is_ai)
+        self.game = LiarDiceGame.from_state(state); self._apply_deal(first)
+        self.turn = 0; self._pos = 1; self.last_result: Optional[Dict[str, Any]] = None
+        self._apply_skips()
+
+    def _apply_deal(self, event: ReplayEvent) -> None:
+        state = self.game.state; state.main_card = event.main_card; state.deck = []
+        for index, hand in event.hands: state.players[self.replay.seats[index].id].hand = list(hand)
+
+    def _apply_skips(self) -> None:
+        events = self.replay.events
+        while self._pos < len(events) and events[self._pos].op == OP_SKIP:
+            event = events[self._pos]; self._pos += 1; next_player_id, _ = self.game._advance_turn()
+            if event.player < 0 or next_player_id != self.replay.seats[event.player].id: raise ReplayError(f"第 {self.turn} 回合后的回合推进与录制不一致")
+
+    @property
+    def finished(self) -> bool:
+        return self._pos >= len(self.replay.events) or self.replay.events[self._pos].op == OP_END
+
+    def step(self) -> Dict[str, Any]:
+        """执行下一回合并返回引擎结果"""
+        if self.finished: raise ReplayError("回放已结束")
+        event = self.replay.events[self._pos]; self._pos += 1
+        seat = self.replay.seats[event.player]; game = self.game
+        if event.op == OP_PLAY: result = game.process_play_card(seat.id, self._indices_for(seat.id, event.cards))
+        elif event.op == OP_CHALLENGE:
+            result = game.process_challenge(seat.id)
+            if (result["challenge_result"] == ChallengeResult.SUCCESS) != event.success or (result["shot_outcome"] == ShotResult.HIT) != event.hit:
+                raise ReplayError(f"第 {self.turn + 1} 回合质疑结果与录制不一致")
+        elif event.op == OP_WAIT: result = game.process_wait(seat.id)
+        else: raise ReplayError(f"第 {self.turn + 1} 回合位置出现意外事件 {event.op}")
+        if self._pos < len(self.replay.events) and self.replay.events[self._pos].op == OP_DEAL:
+            if not result.get("reshuffled"): raise ReplayError(f"第 {self.turn + 1} 回合录制了洗牌但引擎未洗牌")
+            self._apply_deal(self.replay.events[self._pos]); self._pos += 1
+            result["new_main_card"] = game.state.main_card; result["new_hands"] = {pid: p.hand for pid, p in game.state.players.items() if not p.is_eliminated}
+        elif result.get("reshuffled") and not result.get("game_ended"): raise ReplayError(f"第 {self.turn + 1} 回合引擎洗牌但录制中没有发牌")
+        self.turn += 1; self.last_result = result; self._apply_skips()
+        return result
+
+    def _indices_for(self, player_id: str, cards: List[str]) -> List[int]:
+        hand = self.game.state.players[player_id].hand; used = set(); indices = []
+        for card in cards:
+            index = next((i for i, c in enumerate(hand) if c == card and i not in used), None)
+            if index is None: raise ReplayError(f"第 {self.turn + 1} 回合: 手牌中没有录制的 {card}")
+            used.add(index); indices.append(index + 1)
+        return indices
+
+    def seek(self, turn: int) -> None:
+        if turn < self.turn: self.reset()
+        while self.turn < turn and not self.finished: self.step()
+
+# --- 存档 ---
+class ReplayArchive:
+    """回放的 SQLite 存档。写入与查询都在专用线程中执行，不阻塞事件循环。"""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS replays (
+        id INTEGER PRIMARY KEY,
+        group_id TEXT NOT NULL,
+        table_name TEXT NOT NULL DEFAULT '',
+        ended_at INTEGER NOT NULL,
+        players INTEGER NOT NULL,
+        winner TEXT NOT NULL DEFAULT '',
+        data BLOB NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_replays_group ON replays (group_id, id DESC);
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="liar_replay")
+        self._conn: Optional[sqlite3.Connection] = None # 仅在专用线程中使用
+        self.saved = 0
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory: os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path); conn.execute("PRAGMA journal_mode=WAL"); conn.executescript(self._SCHEMA); self._conn = conn
+        return self._conn
+
+    async def save(self, group_id: str, table_name: str, players: int, winner: str, data: bytes) -> int:
+        replay_id = await self._run(self._insert, group_id, table_name, players, winner, data); self.saved += 1
+        return replay_id
+
+    def _insert(self, group_id, table_name, players, winner, data) -> int:
+        conn = self._connect()
+        with conn: return conn.execute("INSERT INTO replays (group_id, table_name, ended_at, players, winner, data) VALUES (?, ?, ?, ?, ?, ?)", (group_id, table_name, int(time.time()), players, winner, data)).lastrowid
+
+    async def recent(self, group_id: str, limit: int = 5) -> List[Tuple[int, str, int, int, str, int]]:
+        """[(id, 桌名, 结束时间, 人数, 胜者, 字节数)]，按时间倒序"""
+        return await self._run(lambda: self._connect().execute("SELECT id, table_name, ended_at, players, winner, length(data) FROM replays WHERE group_id = ? ORDER BY id DESC LIMIT ?", (group_id, limit)).fetchall())
+
+    async def get(self, replay_id: int) -> Optional[Tuple[str, bytes]]:
+        """(群号, 回放数据)"""
+        row = await self._run(lambda: self._connect().execute("SELECT group_id, data FROM replays WHERE id = ?", (replay_id,)).fetchone())
+        return (row[0], bytes(row[1])) if row else None
+
+    async def close(self) -> None:
+        if self._conn is not None: await self._run(self._conn.close); self._conn = None
+        self._executor.shutdown(wait=False)
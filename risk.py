@@ -0,0 +1,44 @@
+# liar_tavern/risk.py
+
+# -*- coding: utf-8 -*-
+
+"""左轮中弹风险估计。
+
+只使用公开信息: 每把枪的弹膛数、规则规定的实弹数、该玩家已开枪且空响的次数。
+实弹排列与起始指针在开局时均匀随机，对所有人都是未知的；空响 k 次后，剩下的 N-k 格中仍有 L 发实弹，
+所以下一枪中弹的概率为 L / (N - k)。有 NumPy 时整桌一次向量化计算，否则逐人计算，结果一致。
+NumPy 在第一次计算时才导入，只导入引擎的进程 (基准、进程池子进程) 不必付出它的导入开销。
+"""
+
+import logging
+from typing import Dict, Iterable, List, Sequence
+
+np = None; _numpy_checked = False # 可选依赖，见 _numpy()
+
+from .models import PlayerData
+
+logger = logging.getLogger(__name__)
+
+def _numpy():
+    global np, _numpy_checked
+    if not _numpy_checked:
+        _numpy_checked = True
+        try: import numpy as np
+        except ImportError: np = None
+    return np
+
+def shot_risks(live: Sequence[int], chambers: Sequence[int], survived: Sequence[int]) -> List[float]:
+    """按位置对应的 (实弹数, 弹膛数, 空响次数) 计算下一枪中弹概率"""
+    np = _numpy()
+    if np is not None:
+        live_arr = np.asarray(live, dtype=np.float64); remaining = np.asarray(chambers, dtype=np.float64) - np.asarray(survived, dtype=np.float64)
+        risk = np.divide(live_arr, remaining, out=np.ones_like(live_arr), where=remaining > 0) # 空膛数已用尽时下一枪必中
+        return np.where(live_arr > 0, np.minimum(risk, 1.0), 0.0).tolist()
+    return [0.0 if l <= 0 else (min(1.0, l / (n - k)) if n > k else 1.0) for l, n, k in zip(live, chambers, survived)]
+
+def table_shot_risk(players: Iterable[PlayerData]) -> Dict[str, float]:
+    """整桌存活玩家 {玩家 ID: 下一枪中弹概率}"""
+    rows = [(p.id, p.live_bullets, p.gun_chambers, p.shots_survived) for p in players if not p.is_eliminated]
+    if not rows: return {}
+    ids, live, chambers, survived = zip(*rows)
+    return dict(zip(ids, shot_risks(live, chambers, survived)))
@@ -0,0 +1,178 @@
+# liar_tavern/state_store.py
+
+# -*- coding: utf-8 -*-
+
+import abc
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from .models import GameState, PlayerData, LastPlay, GameStatus, JOKER
+from .exceptions import StateConflictError
+
+logger = logging.getLogger(__name__)
+
+# --- 紧凑序列化 ---
+STATE_FORMAT_VERSION = 3 # 2: 玩家数组末尾增加 shots_survived；3: 末尾增加回合驱动节点与接管期限 (仍可读取 1、2)
+_CARD_TO_CODE = {"A": "A", "K": "K", "Q": "Q", JOKER: "J"}
+_CODE_TO_CARD = {code: card for card, code in _CARD_TO_CODE.items()}
+
+def _encode_cards(cards) -> str: return "".join(_CARD_TO_CODE[c] for c in cards)
+def _decode_cards(codes: str): return [_CODE_TO_CARD[c] for c in codes]
+
+def encode_state(state: GameState) -> bytes:
+    """把 GameState 编码为紧凑的位置数组 JSON (牌用单字符，弹膛用位掩码)"""
+    players = []
+    for p in state.players.values():
+        players.append([p.id, p.name, _encode_cards(p.hand), p.gun, p.gun_chambers, p.gun_position, int(p.is_eliminated) | (int(p.is_ai) << 1), p.shots_survived])
+    lp = state.last_play
+    payload = [STATE_FORMAT_VERSION, state.status.value, state.main_card or "", state.creator_id, state.round_start_reason, state.current_player_index,
+               state.turn_order, players, _encode_cards(state.deck), _encode_cards(state.discard_pile),
+               [lp.player_id, lp.player_name, lp.claimed_quantity, _encode_cards(lp.actual_cards)] if lp else None, state.action_count,
+               state.turn_owner, state.turn_deadline]
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode_state(data: bytes) -> GameState:
+    payload = json.loads(data)
+    if payload[0] not in (1, 2, STATE_FORMAT_VERSION): raise ValueError(f"不支持的状态格式版本: {payload[0]}")
+    _fmt, status, main_card, creator_id, reason, current_index, turn_order, players, deck, discard, lp, action_count, *driver = payload
+    turn_owner, turn_deadline = driver if driver else (None, 0.0)
+    state = GameState(status=GameStatus(status), main_card=main_card or None, creator_id=creator_id, round_start_reason=reason, current_player_index=current_index,
+                      turn_order=list(turn_order), deck=_decode_cards(deck), discard_pile=_decode_cards(discard), action_count=action_count,
+                      turn_owner=turn_owner, turn_deadline=turn_deadline)
+    for pid, name, hand, gun_mask, gun_len, gun_pos, flags, *rest in players:
+        state.players[pid] = PlayerData(id=pid, name=name, hand=_decode_cards(hand), gun=gun_mask, gun_position=gun_pos, gun_chambers=gun_len,
+                                        shots_survived=rest[0] if rest else 0, is_eliminated=bool(flags & 1), is_ai=bool(flags & 2))
+    if lp: state.last_play = LastPlay(lp[0], lp[1], lp[2], _decode_cards(lp[3]))
+    return state
+
+# --- 存储后端 ---
+class GameStateStore(abc.ABC):
+    """牌桌状态存储接口。version 从 1 开始单调递增，0 表示不存在。
+
+    shared=False 的后端只服务本进程，插件不会为其做加载/保存/租约。
+    """
+
+    shared = False
+
+    @abc.abstractmethod
+    async def load(self, group_id: str) -> Tuple[Optional[GameState], int]: ...
+    @abc.abstractmethod
+    async def save(self, group_id: str, state: GameState, expected_version: int) -> int:
+        """版本匹配时写入并返回新版本，否则抛出 StateConflictError"""
+    @abc.abstractmethod
+    async def delete(self, group_id: str, expected_version: int) -> None: ...
+    @abc.abstractmethod
+    async def acquire_lease(self, group_id: str, owner: str, ttl_s: float) -> bool:
+        """获取 (或续期自己持有的) 群租约"""
+    @abc.abstractmethod
+    async def release_lease(self, group_id: str, owner: str) -> None: ...
+    async def close(self) -> None: pass
+
+class MemoryStateStore(GameStateStore):
+    """默认后端: 单进程内存 (保存编码后的字节以与远端后端行为一致)"""
+
+    def __init__(self):
+        self._records: Dict[str, Tuple[int, bytes]] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    async def load(self, group_id):
+        record = self._records.get(group_id)
+        return (decode_state(record[1]), record[0]) if record else (None, 0)
+
+    async def save(self, group_id, state, expected_version):
+        current = self._records.get(group_id, (0, b""))[0]
+        if current != expected_version: raise StateConflictError(f"群 {group_id} 状态版本冲突 (期望 {expected_version}, 实际 {current})")
+        self._records[group_id] = (current + 1, encode_state(state)); return current + 1
+
+    async def delete(self, group_id, expected_version):
+        current = self._records.get(group_id, (0, b""))[0]
+        if current != expected_version: raise StateConflictError(f"群 {group_id} 状态版本冲突 (期望 {expected_version}, 实际 {current})")
+        self._records.pop(group_id, None)
+
+    async def acquire_lease(self, group_id, owner, ttl_s):
+        now = time.monotonic(); holder = self._leases.get(group_id)
+        if holder and holder[0] != owner and holder[1] > now: return False
+        self._leases[group_id] = (owner, now + ttl_s); return True
+
+    async def release_lease(self, group_id, owner):
+        holder = self._leases.get(group_id)
+        if holder and holder[0] == owner: del self._leases[group_id]
+
+# Redis 脚本: 版本比较与写入在服务端原子完成
+_SAVE_SCRIPT = """
+local cur = redis.call('HGET', KEYS[1], 'v') or '0'
+if cur ~= ARGV[1] then return -1 end
+local nv = tonumber(cur) + 1
+redis.call('HSET', KEYS[1], 'v', nv, 'd', ARGV[2])
+if tonumber(ARGV[3]) > 0 then redis.call('EXPIRE', KEYS[1], ARGV[3]) end
+return nv
+"""
+_DELETE_SCRIPT = """
+local cur = redis.call('HGET', KEYS[1], 'v') or '0'
+if cur ~= ARGV[1] then return -1 end
+redis.call('DEL', KEYS[1])
+return 0
+"""
+_LEASE_SCRIPT = """
+local holder = redis.call('GET', KEYS[1])
+if not holder or holder == ARGV[1] then redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2]); return 1 end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+class RedisStateStore(GameStateStore):
+    """Redis 后端: 多个机器人进程共享牌桌状态 (乐观并发 + 群租约)"""
+
+    shared = True
+
+    def __init__(self, client: Any, key_prefix: str = "liar_tavern", state_ttl_s: int = 86400):
+        self.client = client; self.key_prefix = key_prefix; self.state_ttl_s = state_ttl_s
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisStateStore":
+        try: import redis.asyncio as redis_asyncio
+        except ImportError as e: raise RuntimeError("state_backend=redis 需要安装 redis 库 (pip install redis)") from e
+        return cls(redis_asyncio.from_url(url, decode_responses=False), **kwargs)
+
+    def _state_key(self, group_id: str) -> str: return f"{self.key_prefix}:state:{group_id}"
+    def _lease_key(self, group_id: str) -> str: return f"{self.key_prefix}:lease:{group_id}"
+
+    async def load(self, group_id):
+        version, data = await self.client.hmget(self._state_key(group_id), "v", "d")
+        if version is None or data is None: return None, 0
+        return decode_state(data), int(version)
+
+    async def save(self, group_id, state, expected_version):
+        result = int(await self.client.eval(_SAVE_SCRIPT, 1, self._state_key(group_id), str(expected_version), encode_state(state), str(self.state_ttl_s)))
+        if result < 0: raise StateConflictError(f"群 {group_id} 状态版本冲突 (期望 {expected_version})")
+        return result
+
+    async def delete(self, group_id, expected_version):
+        if int(await self.client.eval(_DELETE_SCRIPT, 1, self._state_key(group_id), str(expected_version))) < 0:
+            raise StateConflictError(f"群 {group_id} 状态版本冲突 (期望 {expected_version})")
+
+    async def acquire_lease(self, group_id, owner, ttl_s):
+        return bool(int(await self.client.eval(_LEASE_SCRIPT, 1, self._lease_key(group_id), owner, str(int(ttl_s * 1000)))))
+
+    async def release_lease(self, group_id, owner):
+        await self.client.eval(_RELEASE_SCRIPT, 1, self._lease_key(group_id), owner)
+
+    async def close(self):
+        close = getattr(self.client, "aclose", None) or getattr(self.client, "close", None)
+        if close:
+            result = close()
+            if asyncio.iscoroutine(result): await result
+
+def create_state_store(config: Any) -> GameStateStore:
+    """根据插件配置创建存储后端"""
+    backend = (config.get("state_backend", "memory") or "memory").lower()
+    if backend == "memory": return MemoryStateStore()
+    if backend == "redis":
+        return RedisStateStore.from_url(config.get("state_redis_url", "redis://localhost:6379/0"), key_prefix=config.get("state_key_prefix", "liar_tavern"))
+    raise ValueError(f"未知的 state_backend: {backend}")
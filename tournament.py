@@ -0,0 +1,145 @@
+# liar_tavern/tournament.py
+
+# -*- coding: utf-8 -*-
+
+"""锦标赛赛程: 把一份报名名单分到多张同时进行的牌桌，每桌胜者晋级下一轮，直到决出冠军。
+
+这里只管赛程 (分桌、排队、晋级、对阵表)，与框架无关；开桌、广播与回合推进由 main.py 完成。
+    * 分桌: 人类与 AI 各自打乱，人类在前按蛇形依次落座，各桌人数最多差 1，人类与 AI 均匀分布，LLM 负载不会集中在少数几桌；
+      某桌只分到 1 人时轮空，直接晋级；
+    * 同时进行的牌桌数有上限，其余牌桌排队，有牌桌结束才开下一张，同一时刻驻留内存的对局数因此有界；
+    * 牌桌结束后只留下座位名单与胜者，对局状态随牌桌释放。
+"""
+
+import re
+import random
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .models import MIN_PLAYERS
+from .exceptions import TournamentError
+
+logger = logging.getLogger(__name__)
+
+SIGNUP, RUNNING, FINISHED = "报名中", "进行中", "已结束" # 锦标赛状态
+QUEUED, LIVE, DONE = "排队", "进行中", "结束" # 单桌状态
+BRACKET_ROUND_LINES = 16 # 对阵表中每轮最多列出的牌桌数
+_TABLE_NAME_RE = re.compile(r"[Rr]\d+-\d+") # 锦标赛牌桌名 R<轮>-<桌>，/骗子酒馆 不能用它开桌
+
+@dataclass
+class Entrant:
+    id: str
+    name: str
+    is_ai: bool = False
+
+@dataclass
+class Match:
+    round_no: int
+    index: int
+    seats: List[str]
+    status: str = QUEUED
+    winner_id: Optional[str] = None
+
+    @property
+    def table_name(self) -> str: return f"R{self.round_no}-{self.index}" # 也是牌桌名，需不超过 MAX_TABLE_NAME_LEN
+
+def is_tournament_table_name(name: str) -> bool: return bool(_TABLE_NAME_RE.fullmatch(name))
+
+def split_tables(entrants: List[Entrant], table_size: int, rng: random.Random) -> List[List[str]]:
+    """按蛇形把参赛者分成 ceil(n / table_size) 桌"""
+    humans = [e.id for e in entrants if not e.is_ai]; ais = [e.id for e in entrants if e.is_ai]; rng.shuffle(humans); rng.shuffle(ais)
+    count = max(1, -(-len(entrants) // max(MIN_PLAYERS, table_size))); tables: List[List[str]] = [[] for _ in range(count)]
+    for i, pid in enumerate(humans + ais):
+        lap, pos = divmod(i, count); tables[pos if lap % 2 == 0 else count - 1 - pos].append(pid)
+    for seats in tables: rng.shuffle(seats)
+    return tables
+
+class Tournament:
+    def __init__(self, group_id: str, organizer_id: str, table_size: int, max_live_tables: int, max_entrants: int, seed: Optional[int] = None):
+        self.group_id = group_id; self.organizer_id = organizer_id
+        self.table_size = max(MIN_PLAYERS, table_size); self.max_live_tables = max(1, max_live_tables); self.max_entrants = max(MIN_PLAYERS, max_entrants)
+        self.entrants: Dict[str, Entrant] = {}
+        self.rounds: List[List[Match]] = []
+        self.status = SIGNUP; self.champion_id: Optional[str] = None
+        self.tables_played = 0; self.peak_live = 0
+        self._rng = random.Random(seed)
+
+    # --- 报名 ---
+    def sign_up(self, entrant: Entrant) -> int:
+        if self.status != SIGNUP: raise TournamentError("锦标赛已开赛，不能再报名")
+        if entrant.id in self.entrants: raise TournamentError("已经报过名了")
+        if len(self.entrants) >= self.max_entrants: raise TournamentError(f"报名人数已达上限({self.max_entrants})")
+        self.entrants[entrant.id] = entrant; return len(self.entrants)
+
+    def withdraw(self, player_id: str) -> Entrant:
+        if self.status != SIGNUP: raise TournamentError("锦标赛已开赛，不能退出")
+        if player_id not in self.entrants: raise TournamentError("你没有报名")
+        return self.entrants.pop(player_id)
+
+    # --- 赛程 ---
+    def start(self) -> List[Match]:
+        if self.status != SIGNUP: raise TournamentError("锦标赛已开赛")
+        if len(self.entrants) < MIN_PLAYERS: raise TournamentError(f"至少需{MIN_PLAYERS}人报名")
+        self.status = RUNNING; self._seed_round(list(self.entrants.values())); return self.rounds[-1]
+
+    def _seed_round(self, entrants: List[Entrant]) -> None:
+        round_no = len(self.rounds) + 1; matches = [Match(round_no, i + 1, seats) for i, seats in enumerate(split_tables(entrants, self.table_size, self._rng))]
+        for match in matches:
+            if len(match.seats) < MIN_PLAYERS: match.status = DONE; match.winner_id = match.seats[0] if match.seats else None # 轮空
+        self.rounds.append(matches); logger.info(f"[群{self.group_id}] 锦标赛第 {round_no} 轮: {len(entrants)} 人 / {len(matches)} 桌")
+
+    @property
+    def current_round(self) -> List[Match]: return self.rounds[-1] if self.rounds else []
+
+    def live_matches(self) -> List[Match]: return [m for m in self.current_round if m.status == LIVE]
+
+    def next_match(self) -> Optional[Match]:
+        """有空余名额时取出下一张排队的牌桌并标为进行中；没有可开的牌桌返回 None"""
+        if self.status != RUNNING: return None
+        live = len(self.live_matches())
+        if live >= self.max_live_tables: return None
+        match = next((m for m in self.current_round if m.status == QUEUED), None)
+        if match is None: return None
+        match.status = LIVE; self.peak_live = max(self.peak_live, live + 1); return match
+
+    def finish_match(self, match: Match, winner_id: Optional[str]) -> Optional[List[Match]]:
+        """记下一桌的胜者 (强制结束时为 None，该桌无人晋级)。本轮全部结束时晋级: 返回新一轮的牌桌；
+        只剩一人 (或无人) 时锦标赛结束，status 变为 FINISHED；否则返回 None。"""
+        if match.status == DONE: return None
+        match.status = DONE; match.winner_id = winner_id if winner_id in match.seats else None; self.tables_played += 1
+        if match.round_no != len(self.rounds) or any(m.status != DONE for m in self.current_round): return None
+        winners = [self.entrants[m.winner_id] for m in self.current_round if m.winner_id]
+        if len(winners) <= 1: self.status = FINISHED; self.champion_id = winners[0].id if winners else None; return None
+        self._seed_round(winners); return self.current_round
+
+    def cancel(self) -> List[Match]:
+        """结束锦标赛，返回仍在进行中的牌桌 (由调用方强制结束)"""
+        live = self.live_matches(); self.status = FINISHED; return live
+
+    # --- 展示 ---
+    def name(self, player_id: Optional[str]) -> str:
+        entrant = self.entrants.get(player_id) if player_id else None
+        return entrant.name if entrant else "无"
+
+    def match_line(self, match: Match) -> str:
+        seats = " / ".join(self.name(pid) + ("[AI]" if self.entrants[pid].is_ai else "") for pid in match.seats)
+        if match.status != DONE: return f"{match.table_name} [{match.status}] {seats}"
+        if len(match.seats) < MIN_PLAYERS: return f"{match.table_name} 轮空: {seats}"
+        return f"{match.table_name} {seats} → 🏅{self.name(match.winner_id)}"
+
+    def bracket_lines(self) -> List[str]:
+        """对阵表: 已结束的轮次只列晋级者，当前轮列出各桌 (过多时截断)"""
+        humans = sum(1 for e in self.entrants.values() if not e.is_ai)
+        lines = [f"🏆 骗子酒馆锦标赛 [{self.status}] {len(self.entrants)} 人 (人类 {humans} / AI {len(self.entrants) - humans})，每桌 {self.table_size} 人，最多 {self.max_live_tables} 桌同时进行"]
+        if self.status == SIGNUP: lines.append("报名: " + ("、".join(e.name for e in self.entrants.values()) or "暂无")); return lines
+        for matches in self.rounds[:-1] if self.status == RUNNING else self.rounds:
+            lines.append(f"第{matches[0].round_no}轮 ({len(matches)} 桌) 晋级: " + ("、".join(self.name(m.winner_id) for m in matches if m.winner_id) or "无"))
+        if self.status == RUNNING:
+            matches = self.current_round; done = sum(1 for m in matches if m.status == DONE)
+            lines.append(f"第{len(self.rounds)}轮 ({done}/{len(matches)} 桌结束，{len(self.live_matches())} 桌进行中):")
+            shown = sorted(matches, key=lambda m: ({LIVE: 0, QUEUED: 1, DONE: 2}[m.status], m.index))[:BRACKET_ROUND_LINES]
+            lines.extend(f"  {self.match_line(m)}" for m in shown)
+            if len(matches) > len(shown): lines.append(f"  ... 另有 {len(matches) - len(shown)} 桌")
+        elif self.champion_id: lines.append(f"👑 冠军: {self.name(self.champion_id)}")
+        return lines
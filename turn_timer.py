@@ -0,0 +1,69 @@
+# liar_tavern/turn_timer.py
+
+# -*- coding: utf-8 -*-
+
+import heapq
+import asyncio
+import logging
+import itertools
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TurnTimerHeap:
+    """整个插件共用的回合计时器: 一个最小堆 + 事件循环上的单个 call_at 句柄。
+
+    每个 key (群) 同时最多一个有效计时器。重新调度为 O(log n) 入堆，取消为 O(1) 的惰性删除
+    (过期的堆项在弹出时跳过)，空闲时不占用任何任务。
+    """
+
+    def __init__(self, callback: Callable[[str, Any], None]):
+        self._callback = callback # 在事件循环上同步调用，应尽快返回 (需要 await 的工作请自行创建任务)
+        self._heap: List[Tuple[float, int, str]] = []
+        self._live: Dict[str, Tuple[int, float, Any]] = {} # key -> (seq, when, payload)
+        self._seq = itertools.count()
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._armed_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._live)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._live
+
+    def schedule(self, key: str, delay: float, payload: Any) -> None:
+        """为 key 设置 (或替换) 计时器，delay 秒后以 payload 回调"""
+        loop = asyncio.get_running_loop(); when = loop.time() + max(0.0, delay); seq = next(self._seq)
+        self._live[key] = (seq, when, payload); heapq.heappush(self._heap, (when, seq, key))
+        if self._armed_at is None or when < self._armed_at: self._arm(loop, when)
+        if len(self._heap) > 2 * len(self._live) + 64: self._compact()
+
+    def cancel(self, key: str) -> None:
+        self._live.pop(key, None)
+
+    def close(self) -> None:
+        if self._handle: self._handle.cancel()
+        self._handle = None; self._armed_at = None; self._heap.clear(); self._live.clear()
+
+    def _arm(self, loop: asyncio.AbstractEventLoop, when: float) -> None:
+        if self._handle: self._handle.cancel()
+        self._handle = loop.call_at(when, self._fire); self._armed_at = when
+
+    def _is_stale(self, entry: Tuple[float, int, str]) -> bool:
+        live = self._live.get(entry[2]); return live is None or live[0] != entry[1]
+
+    def _compact(self) -> None:
+        """惰性删除累积过多时按有效项重建堆"""
+        self._heap = [(when, seq, key) for key, (seq, when, _payload) in self._live.items()]; heapq.heapify(self._heap)
+
+    def _fire(self) -> None:
+        self._handle = None; self._armed_at = None
+        loop = asyncio.get_event_loop(); now = loop.time()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_stale(entry): continue
+            _seq, _when, payload = self._live.pop(entry[2])
+            try: self._callback(entry[2], payload)
+            except Exception as e: logger.error(f"回合计时器回调出错 ({entry[2]}): {e}", exc_info=True)
+        while self._heap and self._is_stale(self._heap[0]): heapq.heappop(self._heap)
+        if self._heap: self._arm(loop, self._heap[0][0])